@@ -0,0 +1,348 @@
+# benchmark.py
+
+import argparse
+import heapq
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from classes import Plant, Vehicle, Trip, planning_day
+from simulation import Scheduler
+from main import load_case, build_scheduler
+from generate_test_data import generate_case, case_path
+
+# Размеры кейсов для generate_case: заводы, ТС, клиенты, заказов на клиента
+TIERS = {
+    "small": {"num_plants": 5, "num_vehicles": 60, "num_customers": 50, "num_orders": 2},
+    "medium": {"num_plants": 20, "num_vehicles": 400, "num_customers": 500, "num_orders": 2},
+    "large": {"num_plants": 100, "num_vehicles": 2000, "num_customers": 2500, "num_orders": 4},
+}
+# Опции Scheduler для всех уровней; без ограничения заводов возврата большой кейс считается минутами
+BENCH_OPTIONS = {"return_slack": 15}
+# Методы, для которых замеряется время каждого вызова
+TIMED_METHODS = ((Scheduler, "assign_trip"), (Vehicle, "is_free"), (Plant, "get_first_available_slot"))
+
+
+def occupied_schedule(case_data, occupancy=0.7, seed=0, day_start=None):
+    """
+    Синтетический «занятый» день: подтверждённые поездки, которые занимают в среднем долю occupancy
+    смен парка. Занятость отдельных ТС разная (бета-распределение со средним occupancy): часть машин
+    загружена почти полностью, у части остаются большие окна, как в реальный день. Поездки идут по реальной матрице времени пути, слоты погрузки не пересекаются.
+    Возвращает данные в формате schedule.json.
+    """
+    rng = random.Random(seed)
+    day_start = day_start or planning_day()
+    scheduler = build_scheduler(case_data, day_start=day_start)
+    plants, travel = scheduler.plants, scheduler.travel_times
+    addresses = sorted({order.delivery_address_id for order in scheduler.orders.values()})
+    trips = []
+
+    # ТС обходятся по времени освобождения, чтобы посты погрузки делились между ними равномерно
+    queue = []
+    targets = {}
+    for vehicle in scheduler.vehicles.values():
+        plant_id = vehicle.plant_start if vehicle.plant_start in plants else vehicle.plants[0]
+        queue.append((vehicle.work_time_start + rng.randint(0, 15), vehicle.id, plant_id))
+        targets[vehicle.id] = min(0.98, max(0.05, rng.betavariate(2 * occupancy, 2 * (1 - occupancy))))
+    heapq.heapify(queue)
+    while queue:
+        t, vehicle_id, plant_id = heapq.heappop(queue)
+        vehicle, plant = scheduler.vehicles[vehicle_id], plants[plant_id]
+        start_at = plant.get_first_available_slot(t)
+        if start_at is None:
+            continue
+        load_at = start_at + plant.loading_time
+        # В конце смены берём адрес поближе, если дальний уже не помещается
+        for address in rng.sample(addresses, len(addresses)):
+            return_ids = [p for p in vehicle.plants if p in plants and (p, address) in travel]
+            if (plant_id, address) not in travel or not return_ids:
+                continue
+            return_id = rng.choice(return_ids)
+            arrive_at = load_at + travel.get(plant_id, address)
+            unload_at = arrive_at + rng.randint(20, 60)
+            return_at = unload_at + travel.get(return_id, address)
+            if return_at <= vehicle.work_time_end:
+                break
+        else:
+            continue
+        trip = Trip(
+            order_id=None, plant_id=plant_id, delivery_address_id=address, vehicle_id=vehicle_id,
+            confirm=True, total=vehicle.volume, start_at=start_at, load_at=load_at, arrive_at=arrive_at,
+            unload_at=unload_at, return_at=return_at, status="confirmed", return_plant_id=return_id,
+            plan_date_start=None, plan_date_object=arrive_at, plan_date_done=None
+        )
+        plant.reserve_loading_slot(trip)
+        trips.append(trip)
+        # Пауза после поездки такая, чтобы занятость ТС в среднем была около его целевой
+        # (ожидание свободного поста тоже простой, поэтому вычитается из паузы)
+        target = targets[vehicle_id]
+        pause = (return_at - start_at) * (1 - target) / target * rng.expovariate(1.0) - (start_at - t)
+        heapq.heappush(queue, (return_at + max(0, int(pause)), vehicle_id, return_id))
+    # Выгрузки из учётных систем обычно не упорядочены по времени
+    rng.shuffle(trips)
+    return {"trips": [trip.to_dict(day_start) for trip in trips], "reservations": []}
+
+
+def shift_occupancy(scheduler):
+    busy = sum(tr.return_at - tr.start_at for v in scheduler.vehicles.values() for tr in v.schedule)
+    shift = sum(v.work_time_end - v.work_time_start for v in scheduler.vehicles.values())
+    return busy / shift if shift else 0
+
+
+def bench_occupied(case_data, occupancy=0.7, seed=0, restarts=10):
+    """
+    Планирование поверх занятого на occupancy дня в сравнении с пустым днём.
+    """
+    day_start = planning_day()
+    schedule = occupied_schedule(case_data, occupancy, seed, day_start)
+    rows = []
+    for name, data in (("empty", case_data), ("occupied", dict(case_data, schedule=schedule))):
+        started = time.perf_counter()
+        scheduler = build_scheduler(data, day_start=day_start)
+        build = time.perf_counter() - started
+        occupied = shift_occupancy(scheduler)
+        started = time.perf_counter()
+        best = None
+        for i in range(restarts):
+            scheduler.reset(seed=seed + i)
+            scheduler.simulate()
+            best = scheduler.score() if best is None else max(best, scheduler.score())
+        rows.append({
+            "day": name,
+            "existing trips": len(data['schedule']['trips']) if data.get('schedule') else 0,
+            "occupancy": round(occupied, 3),
+            "build, s": round(build, 4),
+            "restart, ms": round((time.perf_counter() - started) / restarts * 1000, 2),
+            "best score": best,
+        })
+    return rows
+
+
+@contextmanager
+def timed_calls(methods=TIMED_METHODS):
+    """
+    На время блока оборачивает методы классов замером каждого вызова. Возвращает
+    {"Class.method": [длительности, с]}. Замер добавляет к каждому вызову ~0.1 мкс.
+    """
+    samples = {}
+    originals = []
+    for cls, name in methods:
+        original = getattr(cls, name)
+        durations = samples.setdefault(f"{cls.__name__}.{name}", [])
+
+        def wrapper(*args, _original=original, _durations=durations, **kwargs):
+            started = time.perf_counter()
+            result = _original(*args, **kwargs)
+            _durations.append(time.perf_counter() - started)
+            return result
+
+        originals.append((cls, name, original))
+        setattr(cls, name, wrapper)
+    try:
+        yield samples
+    finally:
+        for cls, name, original in originals:
+            setattr(cls, name, original)
+
+
+def latency_stats(durations):
+    """
+    Пропускная способность (вызовов в секунду) и перцентили задержки в микросекундах.
+    """
+    if not durations:
+        return {"calls": 0}
+    ordered = sorted(durations)
+    total = sum(ordered)
+
+    def percentile(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e6, 2)
+
+    return {
+        "calls": len(ordered),
+        "total_s": round(total, 4),
+        "per_second": round(len(ordered) / total) if total else None,
+        "mean_us": round(total / len(ordered) * 1e6, 2),
+        "p50_us": percentile(0.5),
+        "p95_us": percentile(0.95),
+        "p99_us": percentile(0.99),
+        "max_us": round(ordered[-1] * 1e6, 2),
+    }
+
+
+def bench_tier(config, seed=0, runs=3, options=None):
+    """
+    Генерирует кейс уровня config и замеряет построение планировщика, полный simulate (runs прогонов
+    без обёрток) и задержки отдельных методов (ещё один прогон под timed_calls).
+    """
+    started = time.perf_counter()
+    case = generate_case(seed=seed, **config)
+    generate = time.perf_counter() - started
+    started = time.perf_counter()
+    scheduler = build_scheduler(case, **(options or BENCH_OPTIONS))
+    build = time.perf_counter() - started
+
+    simulate = []
+    for i in range(runs):
+        scheduler.reset(seed=seed + i)
+        started = time.perf_counter()
+        scheduler.simulate()
+        simulate.append(time.perf_counter() - started)
+    metrics = scheduler.metrics
+    assigned = len(scheduler.assigned_trips)
+
+    scheduler.reset(seed=seed)
+    with timed_calls() as samples:
+        scheduler.simulate()
+
+    n_orders = len(scheduler.orders)
+    return {
+        "config": config,
+        "orders": n_orders,
+        "generate_s": round(generate, 4),
+        "build_s": round(build, 4),
+        "simulate": dict(latency_stats(simulate), orders_per_second=round(n_orders / min(simulate), 1)),
+        "methods": {name: latency_stats(durations) for name, durations in samples.items()},
+        "assigned_trips": assigned,
+        "metrics": metrics,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(tiers=None, seed=0, runs=3, output=None):
+    """
+    Прогоняет уровни tiers (по умолчанию все из TIERS) и сохраняет результат в JSON для сравнения версий.
+    """
+    result = {
+        "revision": git_revision(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "seed": seed,
+        "options": BENCH_OPTIONS,
+        "tiers": {},
+    }
+    for name in tiers or TIERS:
+        result["tiers"][name] = bench_tier(TIERS[name], seed=seed, runs=runs)
+        print_tier(name, result["tiers"][name])
+    output = output or f"benchmarks/{datetime.now():%Y%m%d_%H%M%S}_{result['revision'] or 'local'}.json"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=4)
+    print(f"Результаты сохранены в {output}")
+    return result
+
+
+def print_tier(name, tier):
+    print(f"\n[{name}] orders: {tier['orders']}, build: {tier['build_s']} s, "
+          f"simulate: {tier['simulate']['mean_us'] / 1e6:.3f} s ({tier['simulate']['orders_per_second']} orders/s)")
+    for method, stats in tier["methods"].items():
+        if stats["calls"]:
+            print(f"  {method}: {stats['calls']} calls, {stats['per_second']}/s, "
+                  f"p50 {stats['p50_us']} us, p95 {stats['p95_us']} us, p99 {stats['p99_us']} us")
+
+
+def compare(old_path, new_path):
+    """
+    Отношение средних задержек new / old по уровням и методам (< 1 — стало быстрее).
+    """
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"{old['revision']} -> {new['revision']}")
+    for name, tier in new["tiers"].items():
+        if name not in old["tiers"]:
+            continue
+        before = dict(old["tiers"][name]["methods"], simulate=old["tiers"][name]["simulate"])
+        after = dict(tier["methods"], simulate=tier["simulate"])
+        for method, stats in after.items():
+            if before.get(method, {}).get("mean_us") and stats.get("mean_us"):
+                print(f"[{name}] {method}: {stats['mean_us'] / before[method]['mean_us']:.2f}x")
+
+
+def bench_decomposition(case_data, restarts=4, workers=None, seed=0, num_clusters=None, options=None):
+    """
+    Один и тот же кейс целиком (run_restarts) и по кластерам (plan_decomposed) при одинаковых
+    рестартах и сиде: время решения и метрики плана, дельты — кластеры минус целиком.
+    """
+    from decomposition import plan_decomposed
+    from main import run_restarts
+    options = options or BENCH_OPTIONS
+    started = time.perf_counter()
+    whole = run_restarts(case_data, restarts=restarts, workers=workers, seed=seed, **options)
+    whole_time = time.perf_counter() - started
+    started = time.perf_counter()
+    split = plan_decomposed(case_data, restarts=restarts, workers=workers, seed=seed, num_clusters=num_clusters,
+                            **options)
+    split_time = time.perf_counter() - started
+    return {
+        "clusters": len(split["clusters"]),
+        "shared_vehicles": sum(cluster["guests"] for cluster in split["clusters"]),
+        "reconciled_trips": split["reconciled_trips"],
+        "monolithic_s": round(whole_time, 3),
+        "decomposed_s": round(split_time, 3),
+        "speedup": round(whole_time / split_time, 2) if split_time else None,
+        "metrics": {key: {"monolithic": value, "decomposed": split["metrics"][key],
+                          "delta": round(split["metrics"][key] - value, 4)}
+                    for key, value in whole["metrics"].items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности планировщика")
+    commands = parser.add_subparsers(dest="command")
+    suite = commands.add_parser("suite", help="уровни сгенерированных кейсов (по умолчанию)")
+    suite.add_argument("--tiers", nargs="+", choices=list(TIERS), default=None)
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--runs", type=int, default=3)
+    suite.add_argument("--output", default=None)
+    occupied = commands.add_parser("occupied", help="планирование поверх занятого дня")
+    occupied.add_argument("case", help="уровень из TIERS или папка кейса")
+    occupied.add_argument("--occupancy", type=float, default=0.7)
+    decompose = commands.add_parser("decompose", help="кейс целиком против решения по кластерам")
+    decompose.add_argument("case", help="уровень из TIERS или папка кейса")
+    decompose.add_argument("--clusters", type=int, default=None)
+    decompose.add_argument("--restarts", type=int, default=4)
+    decompose.add_argument("--workers", type=int, default=None)
+    decompose.add_argument("--seed", type=int, default=0)
+    diff = commands.add_parser("compare", help="сравнить два JSON с результатами")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    args = parser.parse_args()
+
+    if args.command == "occupied":
+        case_data = generate_case(seed=0, **TIERS[args.case]) if args.case in TIERS \
+            else load_case(case_path(args.case))
+        for row in bench_occupied(case_data, occupancy=args.occupancy):
+            print(", ".join(f"{k}: {v}" for k, v in row.items()))
+    elif args.command == "decompose":
+        case_data = generate_case(seed=args.seed, **TIERS[args.case]) if args.case in TIERS \
+            else load_case(case_path(args.case))
+        report = bench_decomposition(case_data, restarts=args.restarts, workers=args.workers, seed=args.seed,
+                                     num_clusters=args.clusters)
+        print(f"clusters: {report['clusters']}, shared vehicles: {report['shared_vehicles']}, "
+              f"reconciled trips: {report['reconciled_trips']}")
+        print(f"time: monolithic {report['monolithic_s']} s, decomposed {report['decomposed_s']} s "
+              f"({report['speedup']}x)")
+        for key, values in report["metrics"].items():
+            print(f"  {key}: {values['monolithic']} -> {values['decomposed']} ({values['delta']:+})")
+    elif args.command == "compare":
+        compare(args.old, args.new)
+    else:
+        run_suite(getattr(args, "tiers", None), getattr(args, "seed", 0), getattr(args, "runs", 3),
+                  getattr(args, "output", None))
+
+
+if __name__ == "__main__":
+    main()
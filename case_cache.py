@@ -0,0 +1,208 @@
+# case_cache.py
+
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+from array import array
+
+from travel import TravelTimeMatrix
+
+# Снимок кейса: заголовок, JSON-описание таблиц, колонки таблиц (выравнены по 8 байт) и матрица
+# времени пути в формате travel.py. Записи plants, vehicles, customers и orders хранятся по колонкам:
+# числа и флаги — массивами, остальные значения (строки, списки заводов) — словарём значений и кодами.
+# Снимок отображается через mmap, JSON разбирается только для короткого описания. Колонки при загрузке
+# переводятся в списки и собираются в записи (как из JSON, но без разбора текста); матрица остаётся
+# отображённой в память и читается с диска по мере обращения.
+MAGIC = b'BSNP'
+HEADER = struct.Struct('<4sIQ')
+VERSION = 1
+SOURCE_FILES = ("plants.json", "vehicles.json", "customers.json", "travel_times.json", "travel_times.bin",
+                "schedule.json")
+CACHE_DIR = ".cache"
+
+
+def content_hash(path):
+    """
+    Хэш содержимого исходных файлов кейса и версии формата снимка.
+    """
+    digest = hashlib.sha256(f"{VERSION}".encode())
+    for name in SOURCE_FILES:
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            continue
+        digest.update(name.encode())
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+def encode_column(values):
+    """
+    (typecode, данные, словарь значений): 'b' — флаги, 'q' — целые, 'd' — числа, 'i' — коды значений.
+    """
+    if all(type(v) is bool for v in values):
+        return 'b', array('b', values), None
+    if all(type(v) is int for v in values):
+        return 'q', array('q', values), None
+    if all(type(v) in (int, float) for v in values):
+        return 'd', array('d', values), None
+    vocab, codes = {}, array('i')
+    for value in values:
+        codes.append(vocab.setdefault(json.dumps(value, ensure_ascii=False), len(vocab)))
+    return 'i', codes, [json.loads(key) for key in vocab]
+
+
+def decode_column(buffer, column):
+    view = memoryview(buffer)[column["offset"]:column["offset"] + column["size"]]
+    if not column["size"]:
+        return []
+    values = view.cast(column["type"]).tolist()
+    if column["type"] == 'b':
+        return [bool(v) for v in values]
+    if column["vocab"] is not None:
+        vocab = column["vocab"]
+        return [vocab[code] for code in values]
+    return values
+
+
+class CachedCase(dict):
+    """
+    Данные кейса из снимка (тот же словарь, что возвращает main.load_case). В процессы-воркеры
+    передаётся путём к снимку, а не содержимым.
+    """
+
+    def __init__(self, data, snapshot_path):
+        super().__init__(data)
+        self.snapshot_path = snapshot_path
+
+    def __reduce__(self):
+        return load_snapshot, (self.snapshot_path,)
+
+
+def save_snapshot(case_data, path):
+    """
+    Пишет снимок кейса. У записей каждой таблицы должен быть одинаковый набор полей.
+    """
+    customers = case_data['customers']
+    orders = [order for customer in customers for order in customer.get('orders', [])]
+    tables = {
+        "plants": case_data['plants'],
+        "vehicles": case_data['vehicles'],
+        "customers": [{k: v for k, v in customer.items() if k != 'orders'} for customer in customers],
+        "orders": orders,
+    }
+    order_offsets = array('q', [0])
+    for customer in customers:
+        order_offsets.append(order_offsets[-1] + len(customer.get('orders', [])))
+
+    blobs, meta = [], {"tables": {}, "schedule": case_data.get('schedule')}
+    offset = 0
+
+    def add_blob(data):
+        nonlocal offset
+        raw = data.tobytes()
+        raw += b'\0' * (-len(raw) % 8)
+        blobs.append(raw)
+        offset += len(raw)
+        return offset - len(raw), len(data) * data.itemsize
+
+    for name, records in tables.items():
+        keys = list(records[0]) if records else []
+        if any(list(record) != keys for record in records):
+            raise ValueError(f"{name}: у записей разный набор полей")
+        columns = {}
+        for key in keys:
+            typecode, data, vocab = encode_column([record[key] for record in records])
+            start, size = add_blob(data)
+            columns[key] = {"type": typecode, "offset": start, "size": size, "vocab": vocab}
+        meta["tables"][name] = {"count": len(records), "columns": columns}
+    start, size = add_blob(order_offsets)
+    meta["order_offsets"] = {"type": 'q', "offset": start, "size": size, "vocab": None}
+
+    travel_times = case_data['travel_times']
+    if not isinstance(travel_times, TravelTimeMatrix):
+        travel_times = TravelTimeMatrix.from_entries(travel_times)
+    payload = json.dumps(meta, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    payload += b' ' * (-(HEADER.size + len(payload)) % 8)
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(payload)))
+            f.write(payload)
+            for raw in blobs:
+                f.write(raw)
+            travel_times.write(f)
+        # Запись через временный файл: параллельный запуск не прочитает недописанный снимок
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_snapshot(path):
+    """
+    Данные кейса из снимка: записи таблиц собираются из колонок, матрица времени пути остаётся в mmap.
+    """
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, size = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: не снимок кейса")
+    meta = json.loads(buffer[HEADER.size:HEADER.size + size])
+    base = HEADER.size + size
+
+    def table(name):
+        description = meta["tables"][name]
+        columns = {key: decode_column(buffer, dict(column, offset=base + column["offset"]))
+                   for key, column in description["columns"].items()}
+        if not columns:
+            return [{} for _ in range(description["count"])]
+        keys = list(columns)
+        return [dict(zip(keys, row)) for row in zip(*columns.values())]
+
+    orders = table("orders")
+    offsets = decode_column(buffer, dict(meta["order_offsets"], offset=base + meta["order_offsets"]["offset"]))
+    customers = table("customers")
+    for i, customer in enumerate(customers):
+        customer['orders'] = orders[offsets[i]:offsets[i + 1]]
+
+    blobs_end = base + max((column["offset"] + column["size"] + (-column["size"] % 8)
+                            for description in meta["tables"].values()
+                            for column in description["columns"].values()),
+                           default=0)
+    blobs_end = max(blobs_end, base + meta["order_offsets"]["offset"] + meta["order_offsets"]["size"]
+                    + (-meta["order_offsets"]["size"] % 8))
+    return CachedCase({
+        "plants": table("plants"),
+        "vehicles": table("vehicles"),
+        "customers": customers,
+        "travel_times": TravelTimeMatrix.from_buffer(buffer, blobs_end, path),
+        "schedule": meta["schedule"],
+    }, path)
+
+
+def load_cached_case(path, load_case):
+    """
+    Данные кейса из папки path через снимок в path/.cache/<хэш исходных файлов>.snap. Если снимка
+    с таким хэшем нет (кейс новый или файлы изменились), кейс читается функцией load_case, снимок
+    пишется заново, а устаревшие удаляются. Если снимок записать нельзя (нет доступа к папке или данные
+    не ложатся в формат), возвращаются прочитанные данные.
+    """
+    cache_dir = os.path.join(path, CACHE_DIR)
+    snapshot = os.path.join(cache_dir, f"{content_hash(path)}.snap")
+    if os.path.exists(snapshot):
+        return load_snapshot(snapshot)
+    case_data = load_case(path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        save_snapshot(case_data, snapshot)
+    except (OSError, ValueError, TypeError, OverflowError, struct.error):
+        return case_data
+    for stale in glob.glob(os.path.join(cache_dir, "*.snap")):
+        if stale != snapshot:
+            os.remove(stale)
+    return load_snapshot(snapshot)
@@ -0,0 +1,58 @@
+# case_file.py
+
+import json
+import mmap
+import struct
+import sys
+
+from travel import TravelTimeMatrix
+
+# Однофайловый кейс: заголовок, JSON с заводами, ТС, клиентами (и schedule), затем с 8-байтного
+# выравнивания — матрица времени пути в формате travel.py. Матрица при чтении не копируется:
+# она отображается в память, в воркеры передаётся по пути и смещению.
+MAGIC = b'BCAS'
+HEADER = struct.Struct('<4sIQ')
+VERSION = 1
+SECTIONS = ("plants", "vehicles", "customers", "schedule")
+
+
+def save_case_file(case_data, path):
+    """
+    Сохраняет кейс в формате load_case (main.load_case) одним файлом.
+    """
+    travel_times = case_data['travel_times']
+    if not isinstance(travel_times, TravelTimeMatrix):
+        travel_times = TravelTimeMatrix.from_entries(travel_times)
+    payload = json.dumps({key: case_data.get(key) for key in SECTIONS},
+                         ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(payload)))
+        f.write(payload)
+        f.write(b'\0' * (-(HEADER.size + len(payload)) % 8))
+        travel_times.write(f)
+
+
+def load_case_file(path):
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, size = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: не файл кейса")
+    case_data = json.loads(buffer[HEADER.size:HEADER.size + size])
+    offset = HEADER.size + size
+    case_data['travel_times'] = TravelTimeMatrix.from_buffer(buffer, offset + (-offset % 8), path)
+    return case_data
+
+
+def is_case_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+if __name__ == "__main__":
+    # python case_file.py <папка кейса> <файл кейса>
+    from main import load_case
+    save_case_file(load_case(sys.argv[1]), sys.argv[2])
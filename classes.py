@@ -1,54 +1,191 @@
 # classes.py
 
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
 from collections import defaultdict
+from functools import lru_cache
 
-from datetime import datetime, timedelta
+# Внутри планировщика все моменты времени — целые минуты от начала дня планирования,
+# длительности — целые минуты. В datetime переводим только при чтении и записи данных.
+# Строки дат и времени в кейсах сильно повторяются (минутная точность в пределах дня),
+# поэтому разбор и форматирование кэшируются.
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def planning_day(moment=None):
+    """
+    Полночь дня планирования (по умолчанию — сегодня).
+    """
+    moment = moment or datetime.today()
+    return datetime.combine(moment.date(), datetime.min.time())
+
+
+@lru_cache(maxsize=None)
+def parse_minutes(time_str):
+    """
+    'HH:MM:SS' -> минуты от полуночи.
+    """
+    hours, minutes, seconds = time_str.split(':')
+    return int(hours) * 60 + int(minutes) + int(seconds) // 60
+
+
+def work_window(start_str, end_str):
+    """
+    Рабочее время 'HH:MM:SS'–'HH:MM:SS' в минутах от полуночи. Если конец не позже начала,
+    смена переходит через полночь и конец относится к следующему дню (больше 24 * 60).
+    """
+    start, end = parse_minutes(start_str), parse_minutes(end_str)
+    return start, end + 24 * 60 if end <= start else end
+
+
+def to_minutes(moment, day_start):
+    return (moment - day_start) // timedelta(minutes=1)
+
+
+def to_datetime(minutes, day_start):
+    return day_start + timedelta(minutes=minutes)
+
+
+@lru_cache(maxsize=65536)
+def datetime_minutes(text, day_start):
+    """
+    'YYYY-MM-DD HH:MM:SS' -> минуты от day_start.
+    """
+    return to_minutes(datetime.strptime(text, DATETIME_FORMAT), day_start)
+
+
+@lru_cache(maxsize=65536)
+def format_minutes(minutes, day_start):
+    return to_datetime(minutes, day_start).strftime(DATETIME_FORMAT)
+
+
+class LoadingCalendar:
+    """
+    Календарь погрузок завода: loading_capacity параллельных постов, у каждого — отсортированные
+    по времени непересекающиеся интервалы. Поиск первого свободного окна и проверка занятости
+    выполняются бинарным поиском по каждому посту.
+    """
+    __slots__ = ('capacity', 'starts', 'ends', 'slots', 'stats')
+
+    def __init__(self, capacity=1):
+        self.capacity = max(1, capacity)
+        self.starts = [[] for _ in range(self.capacity)]
+        self.ends = [[] for _ in range(self.capacity)]
+        self.slots = {}  # key -> (bay, start, end)
+        self.stats = None  # Instrumentation планировщика, если замеры включены
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _bay_first_fit(self, bay, time_from, duration):
+        starts, ends = self.starts[bay], self.ends[bay]
+        start = time_from
+        # Интервалы, закончившиеся до start, не мешают; дальше идём только по вплотную занятым
+        first = i = bisect_right(ends, start)
+        while i < len(starts) and starts[i] < start + duration:
+            start = max(start, ends[i])
+            i += 1
+        if self.stats is not None:
+            self.stats.count("slot_search_steps", i - first + 1)
+        return start
+
+    def _bay_is_free(self, bay, start, end):
+        i = bisect_right(self.ends[bay], start)
+        return i == len(self.starts[bay]) or self.starts[bay][i] >= end
+
+    def first_fit(self, time_from, duration):
+        """
+        Самое раннее начало погрузки длительностью duration не раньше time_from на любом посту.
+        """
+        return min(self._bay_first_fit(bay, time_from, duration) for bay in range(self.capacity))
+
+    def is_free(self, start, end):
+        return any(self._bay_is_free(bay, start, end) for bay in range(self.capacity))
+
+    def free_intervals(self, bay, start, end):
+        """
+        Свободные промежутки поста bay внутри [start, end): [(начало, конец)] по возрастанию.
+        """
+        starts, ends = self.starts[bay], self.ends[bay]
+        gaps = []
+        i = bisect_right(ends, start)
+        while i < len(starts) and starts[i] < end:
+            if starts[i] > start:
+                gaps.append((start, starts[i]))
+            start = max(start, ends[i])
+            i += 1
+        if start < end:
+            gaps.append((start, end))
+        return gaps
+
+    def reserve(self, key, start, end, bay=None):
+        """
+        Бронирует интервал на первом свободном посту (или на посту bay) и возвращает номер поста.
+        """
+        bays = range(self.capacity) if bay is None else [bay]
+        for bay in bays:
+            if self._bay_is_free(bay, start, end):
+                i = bisect_right(self.starts[bay], start)
+                self.starts[bay].insert(i, start)
+                self.ends[bay].insert(i, end)
+                self.slots[key] = (bay, start, end)
+                return bay
+        raise ValueError(f"Нет свободного поста погрузки для {key} на {start}")
+
+    def release(self, key):
+        bay, start, end = self.slots.pop(key)
+        i = bisect_left(self.starts[bay], start)
+        del self.starts[bay][i]
+        del self.ends[bay][i]
 
 
 class Plant:
+    __slots__ = ('id', 'latitude', 'longitude', 'work_time_start', 'work_time_end', 'loading_capacity',
+                 'loading_time', 'loading_schedule', 'calendar')
+
     def __init__(self, id, latitude, longitude, work_time_start, work_time_end, loading_capacity=2,
                  loading_time=15, loading_schedule=None):
         self.id = id
         self.latitude = latitude
         self.longitude = longitude
-        self.work_time_start = datetime.combine(datetime.today(), datetime.strptime(work_time_start, '%H:%M:%S').time())
-        self.work_time_end = datetime.combine(datetime.today(), datetime.strptime(work_time_end, '%H:%M:%S').time())
+        self.work_time_start, self.work_time_end = work_window(work_time_start, work_time_end)
         self.loading_capacity = loading_capacity
-        self.loading_time = timedelta(minutes=loading_time)  # Время загрузки одной машины
-        self.loading_schedule = loading_schedule if loading_schedule is not None else {}
+        self.loading_time = loading_time  # Время загрузки одной машины, минуты
+        self.loading_schedule = {}
+        self.calendar = LoadingCalendar(loading_capacity)
+        for slot_id, slot in (loading_schedule or {}).items():
+            self.reserve_slot(slot_id, slot['start'], slot['end'])
 
     def is_loading_slot_available(self, loading_start, loading_end):
-        for order_id, slot in self.loading_schedule.items():
-            if not (loading_start >= slot['end'] or loading_end <= slot['start']):
-                return False
-        return True
+        return self.calendar.is_free(loading_start, loading_end)
 
     def get_first_available_slot(self, time_from=None):
-        time_from = max(time_from, self.work_time_start) or self.work_time_start
-        # Сортируем слоты по времени начала
-        slots = sorted(self.loading_schedule.values(), key=lambda x: x['start'])
-        possible_starts = [time_from] + [slot['end'] for slot in slots if slot['end'] >= time_from]
-        slots_starts = [slot['start'] for slot in slots if slot['end'] >= time_from] + [self.work_time_end]
-
-        for i in range(len(possible_starts)):
-            proposed_start = possible_starts[i]
-            proposed_end = proposed_start + self.loading_time
-
-            # Проверяем, что proposed_end не превышает начало следующего слота
-            if proposed_end <= slots_starts[i]:
-                # Проверяем, находится ли слот в рабочее время
-                if self.work_time_start <= proposed_start and proposed_end <= self.work_time_end:
-                    return proposed_start
+        time_from = max(time_from, self.work_time_start) if time_from is not None else self.work_time_start
+        proposed_start = self.calendar.first_fit(time_from, self.loading_time)
+        # Проверяем, что погрузка укладывается в рабочее время
+        if proposed_start + self.loading_time <= self.work_time_end:
+            return proposed_start
         return None
 
+    def reserve_slot(self, slot_id, start, end, bay=None):
+        bay = self.calendar.reserve(slot_id, start, end, bay)
+        self.loading_schedule[slot_id] = {'start': start, 'end': end, 'bay': bay}
+        return bay
+
+    # Погрузки поездок хранятся под самим объектом Trip: id у вариантов одной заявки совпадают.
+    # Пост запоминается в trip.bay, чтобы при откате поездка вернулась на тот же пост.
     def reserve_loading_slot(self, trip):
-        start = trip.start_at
-        end = start + self.loading_time
-        self.loading_schedule[trip.id] = {'start': start, 'end': end}
+        trip.bay = self.reserve_slot(trip, trip.start_at, trip.start_at + self.loading_time, trip.bay)
+
+    def release_loading_slot(self, trip):
+        self.calendar.release(trip)
+        del self.loading_schedule[trip]
 
 
 class Vehicle:
+    __slots__ = ('id', 'number', 'volume', 'rent', 'gidrolotok', 'axes', 'work_time_start', 'work_time_end',
+                 'plants', 'plant_start', 'schedule', '_starts')
+
     def __init__(self, id, number, volume, rent, gidrolotok, axes, work_time_start, work_time_end, plants, plant_start, schedule=None):
         self.id = id
         self.number = number
@@ -56,60 +193,142 @@ class Vehicle:
         self.rent = rent
         self.gidrolotok = gidrolotok
         self.axes = axes
-        self.work_time_start = datetime.combine(datetime.today(), datetime.strptime(work_time_start, '%H:%M:%S').time())
-        self.work_time_end = datetime.combine(datetime.today(), datetime.strptime(work_time_end, '%H:%M:%S').time())
+        self.work_time_start, self.work_time_end = work_window(work_time_start, work_time_end)
         self.plants = plants
-        self.schedule = schedule if schedule is not None else []
         self.plant_start = plant_start
+        # Поездки хранятся отсортированными по start_at, окна между ними ищутся бинарным поиском
+        self.schedule = sorted(schedule or [], key=lambda tr: tr.start_at)
+        self._starts = [tr.start_at for tr in self.schedule]
 
     def is_available(self, trip):
         """
         Проверяет доступность транспортного средства на весь период поездки.
         """
+        return self.is_free(trip.start_at, trip.unload_at, trip.return_at, trip.plant_id, trip.return_plant_id)
+
+    def is_free(self, start_at, unload_at, return_at, plant_id, return_plant_id):
+        """
+        Бинарный поиск окна между соседними поездками, в которое помещается [start_at, return_at].
+        """
         # Проверка рабочих часов
-        if not (self.work_time_start <= trip.start_at <= self.work_time_end and
-                self.work_time_start <= trip.unload_at <= self.work_time_end):
+        if not (self.work_time_start <= start_at <= self.work_time_end and
+                self.work_time_start <= unload_at <= self.work_time_end):
             return False
 
         # Проверка, что водитель может загрузиться на заводе
-        if trip.plant_id not in self.plants:
+        if plant_id not in self.plants:
             return False
 
-        intervals = []
-        plant_intervals = []
-        if len(self.schedule) == 0:
-            intervals = [(self.work_time_start, self.work_time_end)]
-            plant_intervals = [(self.plant_start, None)]
+        i = bisect_right(self._starts, start_at)
+        if i > 0:
+            prev = self.schedule[i - 1]
+            gap_start, plant_before = prev.return_at, prev.return_plant_id
         else:
-            for i, tr in enumerate(self.schedule):
-                if i == 0:
-                    intervals.append((self.work_time_start, tr.start_at))
-                    plant_intervals.append((self.plant_start, self.schedule[i].plant_id))
-                else:
-                    intervals.append((self.schedule[i - 1].return_at, tr.start_at))
-                    plant_intervals.append((self.schedule[i - 1].return_plant_id, self.schedule[i].plant_id))
-            intervals.append((self.schedule[-1].return_at, self.work_time_end))
-            plant_intervals.append((self.schedule[-1].return_plant_id, None))
-
-        def equal_plants(pl1, pl2):
-            if pl1 is None or pl2 is None:
-                return True
-            return pl1 == pl2
-
-        for i, interval in enumerate(intervals):
-            start, end = interval
-            plant_start, plant_end = plant_intervals[i]
-
-            if (start <= trip.start_at) and (trip.return_at <= end) and (equal_plants(plant_start, trip.plant_id) and equal_plants(trip.return_plant_id, plant_end)):
-                return True
-
-        return False
+            gap_start, plant_before = self.work_time_start, self.plant_start
+        if i < len(self.schedule):
+            nxt = self.schedule[i]
+            gap_end, plant_after = nxt.start_at, nxt.plant_id
+        else:
+            gap_end, plant_after = self.work_time_end, None
+
+        if not (gap_start <= start_at and return_at <= gap_end):
+            return False
+        # ТС должно начинать поездку там, где закончило предыдущую, и вернуться туда, откуда начнёт следующую
+        return (plant_before is None or plant_before == plant_id) and \
+            (plant_after is None or plant_after == return_plant_id)
 
     def assign_trip(self, trip):
-        self.schedule.append(trip)
+        i = bisect_right(self._starts, trip.start_at)
+        self._starts.insert(i, trip.start_at)
+        self.schedule.insert(i, trip)
+
+    def can_unassign(self, trip):
+        """
+        Снятие поездки не должно разрывать цепочку заводов: предыдущая поездка должна
+        возвращаться туда, откуда начинается следующая.
+        """
+        i = bisect_left(self._starts, trip.start_at)
+        while self.schedule[i] is not trip:
+            i += 1
+        plant_before = self.schedule[i - 1].return_plant_id if i > 0 else self.plant_start
+        plant_after = self.schedule[i + 1].plant_id if i + 1 < len(self.schedule) else None
+        return plant_before is None or plant_after is None or plant_before == plant_after
+
+    def unassign_trip(self, trip):
+        i = bisect_left(self._starts, trip.start_at)
+        while self.schedule[i] is not trip:
+            i += 1
+        del self._starts[i]
+        del self.schedule[i]
+
+
+class VehicleIndex:
+    """
+    Индекс парка: для каждого завода — ТС, которые могут на нём грузиться, по возрастанию начала смены,
+    и свободные окна ТС по заводу, где ТС стоит в начале окна (None — завод не известен и подходит любой).
+    free_vehicles находит ТС, свободные на заданном интервале и стоящие на заводе погрузки, не перебирая
+    весь парк; завод возврата и рабочее время проверяет Vehicle.is_free. Окна ТС пересчитываются
+    при каждом изменении его расписания (update).
+    """
+
+    def __init__(self, vehicles):
+        by_plant = defaultdict(list)
+        for vehicle in vehicles:
+            for plant_id in vehicle.plants:
+                by_plant[plant_id].append(vehicle)
+        self.by_plant = {}
+        for plant_id, plant_vehicles in by_plant.items():
+            plant_vehicles.sort(key=lambda v: v.work_time_start)
+            self.by_plant[plant_id] = plant_vehicles
+        # Окна (конец, начало, id ТС) по заводу, отсортированные по концу; концы — отдельным списком для bisect
+        self.gaps = defaultdict(list)
+        self.gap_ends = defaultdict(list)
+        self.vehicle_gaps = {}  # id ТС -> [(завод, окно)]
+        for vehicle in vehicles:
+            self.update(vehicle)
+
+    def vehicles_for_plant(self, plant_id):
+        return self.by_plant.get(plant_id, [])
+
+    def update(self, vehicle):
+        for plant_id, gap in self.vehicle_gaps.pop(vehicle.id, ()):
+            i = bisect_left(self.gaps[plant_id], gap)
+            del self.gaps[plant_id][i]
+            del self.gap_ends[plant_id][i]
+        vehicle_gaps = []
+        gap_start, plant_id = vehicle.work_time_start, vehicle.plant_start
+        for trip in vehicle.schedule:
+            if trip.start_at > gap_start:
+                vehicle_gaps.append((plant_id, (trip.start_at, gap_start, vehicle.id)))
+            gap_start, plant_id = max(gap_start, trip.return_at), trip.return_plant_id
+        if vehicle.work_time_end > gap_start:
+            vehicle_gaps.append((plant_id, (vehicle.work_time_end, gap_start, vehicle.id)))
+        for plant_id, gap in vehicle_gaps:
+            i = bisect_left(self.gaps[plant_id], gap)
+            self.gaps[plant_id].insert(i, gap)
+            self.gap_ends[plant_id].insert(i, gap[0])
+        self.vehicle_gaps[vehicle.id] = vehicle_gaps
+
+    def free_vehicles(self, plant_id, start_at, return_at):
+        """
+        id ТС, у которых [start_at, return_at] целиком попадает в свободное окно, начинающееся на заводе
+        plant_id (или на неизвестном заводе). Просматриваются только окна, заканчивающиеся не раньше return_at.
+        """
+        free = set()
+        for key in (plant_id, None):
+            gaps = self.gaps.get(key)
+            if not gaps:
+                continue
+            for i in range(bisect_left(self.gap_ends[key], return_at), len(gaps)):
+                _, gap_start, vehicle_id = gaps[i]
+                if gap_start <= start_at:
+                    free.add(vehicle_id)
+        return free
 
 
 class Customer:
+    __slots__ = ('id', 'delivery_address_id', 'orders')
+
     def __init__(self, id, delivery_address_id):
         self.id = id
         self.delivery_address_id = delivery_address_id
@@ -120,18 +339,23 @@ class Customer:
 
 
 class Order:
+    __slots__ = ('id', 'status', 'total', 'first_order_datetime_delivery', 'time_unloading', 'type_delivery',
+                 'time_interval_client', 'axle', 'gidrolotok', 'plants', 'delivery_address_id',
+                 'assigned_trips', 'failure_reasons')
+
     def __init__(self, id, status, total,
                  date_shipment, first_order_time_delivery, time_unloading,
                  type_delivery, time_interval_client, axle, gidrolotok,
-                 plants, delivery_address_id):
+                 plants, delivery_address_id, day_start=None):
         self.id = id
         self.status = status
         self.total = total
-        self.first_order_datetime_delivery = datetime.strptime(f"{date_shipment} {first_order_time_delivery}",
-                                                               '%Y-%m-%d %H:%M:%S')
-        self.time_unloading = timedelta(minutes=time_unloading)
+        # Минуты от начала дня планирования day_start (заказ на другой день даёт значение вне [0, 1440))
+        self.first_order_datetime_delivery = datetime_minutes(f"{date_shipment} {first_order_time_delivery}",
+                                                              day_start or planning_day())
+        self.time_unloading = time_unloading
         self.type_delivery = type_delivery
-        self.time_interval_client = timedelta(minutes=time_interval_client)
+        self.time_interval_client = time_interval_client
         self.axle = axle
         self.gidrolotok = gidrolotok
         self.plants = plants
@@ -141,11 +365,15 @@ class Order:
 
 
 class Trip:
+    __slots__ = ('id', 'order_id', 'plant_id', 'delivery_address_id', 'vehicle_id', 'confirm', 'total',
+                 'start_at', 'load_at', 'arrive_at', 'unload_at', 'return_at', 'status', 'return_plant_id',
+                 'plan_date_start', 'plan_date_object', 'plan_date_done', 'bay')
+
     def __init__(self, order_id, plant_id, delivery_address_id, vehicle_id,
                  confirm, total, start_at, load_at, arrive_at, unload_at,
                  return_at, status, return_plant_id, plan_date_start,
                  plan_date_object, plan_date_done):
-        self.id = f"{order_id}_{arrive_at}"
+        self.id = (order_id, arrive_at)
         self.order_id = order_id
         self.plant_id = plant_id
         self.delivery_address_id = delivery_address_id
@@ -162,6 +390,7 @@ class Trip:
         self.plan_date_start = plan_date_start
         self.plan_date_object = plan_date_object
         self.plan_date_done = plan_date_done
+        self.bay = None  # Пост погрузки на заводе, назначается при бронировании слота
 
     def shift(self, time_shift):
         self.start_at += time_shift
@@ -172,22 +401,60 @@ class Trip:
 
 
     #make JSON serializable
-    def to_dict(self):
+    def to_dict(self, day_start=None):
+        day_start = day_start or planning_day()
+        order_id, requested_at = self.id
         return {
-            "id": self.id,
+            "id": f"{order_id}_{to_datetime(requested_at, day_start)}",
             "order_id": self.order_id,
             "plant_id": self.plant_id,
+            "delivery_address_id": self.delivery_address_id,
             "vehicle_id": self.vehicle_id,
             "confirm": self.confirm,
             "total": self.total,
-            "start_at": self.start_at.strftime('%Y-%m-%d %H:%M:%S'),
-            "load_at": self.load_at.strftime('%Y-%m-%d %H:%M:%S'),
-            "arrive_at": self.arrive_at.strftime('%Y-%m-%d %H:%M:%S'),
-            "unload_at": self.unload_at.strftime('%Y-%m-%d %H:%M:%S'),
-            "return_at": self.return_at.strftime('%Y-%m-%d %H:%M:%S'),
+            "start_at": format_minutes(self.start_at, day_start),
+            "load_at": format_minutes(self.load_at, day_start),
+            "arrive_at": format_minutes(self.arrive_at, day_start),
+            "unload_at": format_minutes(self.unload_at, day_start),
+            "return_at": format_minutes(self.return_at, day_start),
             "status": self.status,
             "return_plant_id": self.return_plant_id,
             "plan_date_start": self.plan_date_start,
-            "plan_date_object": self.plan_date_object.strftime('%Y-%m-%d %H:%M:%S'),
+            "plan_date_object": format_minutes(self.plan_date_object, day_start),
             "plan_date_done": self.plan_date_done
         }
+
+    @classmethod
+    def from_dict(cls, data, day_start=None):
+        """
+        Обратное к to_dict: уже назначенная поездка из данных кейса.
+        """
+        day_start = day_start or planning_day()
+
+        def minutes(key):
+            return datetime_minutes(data[key], day_start)
+
+        trip = cls(
+            order_id=data['order_id'],
+            plant_id=data['plant_id'],
+            delivery_address_id=data.get('delivery_address_id'),
+            vehicle_id=data['vehicle_id'],
+            confirm=data.get('confirm', True),
+            total=data['total'],
+            start_at=minutes('start_at'),
+            load_at=minutes('load_at'),
+            arrive_at=minutes('arrive_at'),
+            unload_at=minutes('unload_at'),
+            return_at=minutes('return_at'),
+            status=data.get('status', "confirmed"),
+            return_plant_id=data['return_plant_id'],
+            plan_date_start=data.get('plan_date_start'),
+            plan_date_object=minutes('plan_date_object' if data.get('plan_date_object') else 'arrive_at'),
+            plan_date_done=data.get('plan_date_done')
+        )
+        # id из to_dict — "<заказ>_<запрошенное время прибытия>"; оно может отличаться от arrive_at
+        # (поездку сдвигают под слот погрузки), поэтому id восстанавливается из строки
+        prefix = f"{data['order_id']}_"
+        if str(data.get('id', '')).startswith(prefix):
+            trip.id = (data['order_id'], datetime_minutes(data['id'][len(prefix):], day_start))
+        return trip
@@ -0,0 +1,288 @@
+# decomposition.py
+
+import math
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from classes import DATETIME_FORMAT
+from instrumentation import Instrumentation
+from main import build_scheduler, compact_result, create_travel_times, run_restarts
+
+
+def kmeans(points, k, seed=0, iterations=50):
+    """
+    Номер кластера для каждой точки (широта, долгота). Начальные центры — как в k-means++,
+    долгота масштабируется косинусом широты. Пустые кластеры отбрасываются, номера идут подряд.
+    """
+    rng = random.Random(seed)
+    xy = [(lat, lon * math.cos(math.radians(lat))) for lat, lon in points]
+
+    def dist(a, b):
+        return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2
+
+    centers = [xy[rng.randrange(len(xy))]]
+    while len(centers) < min(k, len(xy)):
+        weights = [min(dist(p, c) for c in centers) for p in xy]
+        if not any(weights):
+            break
+        centers.append(rng.choices(xy, weights)[0])
+    labels = None
+    for _ in range(iterations):
+        new_labels = [min(range(len(centers)), key=lambda c: dist(p, centers[c])) for p in xy]
+        if new_labels == labels:
+            break
+        labels = new_labels
+        for c in range(len(centers)):
+            members = [p for p, label in zip(xy, labels) if label == c]
+            if members:
+                centers[c] = (sum(p[0] for p in members) / len(members), sum(p[1] for p in members) / len(members))
+    used = {label: i for i, label in enumerate(sorted(set(labels)))}
+    return [used[label] for label in labels]
+
+
+class Partition:
+    """
+    Разбиение кейса на географические кластеры:
+      plant_cluster — заводы, k-means по координатам;
+      vehicle_home  — ТС, кластер завода старта (без него — большинства заводов ТС);
+      order_cluster — заказы, кластер ближайшего по времени пути из допустимых для заказа заводов.
+    Уже назначенные поездки из schedule объединяют кластеры своего ТС и своих заводов.
+    ТС, заводы которого лежат в нескольких кластерах, — общее (shared). travel_times — время пути
+    (main.create_travel_times), по умолчанию матрица кейса.
+    """
+
+    def __init__(self, case_data, num_clusters=None, seed=0, travel_times=None):
+        plants = case_data['plants']
+        labels = kmeans([(p['latitude'], p['longitude']) for p in plants],
+                        num_clusters or max(1, len(plants) // 10), seed)
+        self.plant_cluster = {p['id']: label for p, label in zip(plants, labels)}
+        self.vehicle_home = {}
+        for vehicle in case_data['vehicles']:
+            if vehicle['plant_start'] in self.plant_cluster:
+                self.vehicle_home[vehicle['id']] = self.plant_cluster[vehicle['plant_start']]
+            else:
+                clusters = Counter(self.plant_cluster[p] for p in vehicle['plants'] if p in self.plant_cluster)
+                self.vehicle_home[vehicle['id']] = clusters.most_common(1)[0][0] if clusters else 0
+
+        parent = list(range(max(labels) + 1))
+
+        def find(c):
+            while parent[c] != c:
+                parent[c] = parent[parent[c]]
+                c = parent[c]
+            return c
+
+        for trip in (case_data.get('schedule') or {}).get('trips', []):
+            for plant_id in (trip['plant_id'], trip['return_plant_id']):
+                if plant_id in self.plant_cluster:
+                    parent[find(self.plant_cluster[plant_id])] = find(self.vehicle_home[trip['vehicle_id']])
+        roots = {root: i for i, root in enumerate(sorted({find(c) for c in parent}))}
+        self.plant_cluster = {p: roots[find(c)] for p, c in self.plant_cluster.items()}
+        self.vehicle_home = {v: roots[find(c)] for v, c in self.vehicle_home.items()}
+        self.clusters = list(range(len(roots)))
+
+        travel_times = travel_times or create_travel_times(case_data['travel_times'])
+        self.order_cluster = {}
+        for customer in case_data['customers']:
+            for order in customer.get('orders', []):
+                candidates = [p for p in (order['plants'] or self.plant_cluster) if p in self.plant_cluster
+                              and (p, order['delivery_address_id']) in travel_times]
+                nearest = min(candidates, key=lambda p: travel_times.get(p, order['delivery_address_id']),
+                              default=None)
+                self.order_cluster[order['id']] = self.plant_cluster[nearest] if nearest is not None else 0
+
+    def shared_clusters(self, vehicle):
+        """
+        Кластеры, кроме домашнего, где ТС может грузиться.
+        """
+        return {self.plant_cluster[p] for p in vehicle['plants'] if p in self.plant_cluster} - \
+            {self.vehicle_home[vehicle['id']]}
+
+    def sub_case(self, case_data, cluster, guests=(), lent=(), trips=None, reservations=()):
+        """
+        Данные кейса (как main.load_case) одного кластера: его заводы, ТС и заказы. Заказы грузятся
+        только на заводах кластера. guests — id общих ТС из других кластеров, lent — ТС кластера,
+        отданные другим (их погрузки передаются бронями постов в reservations), trips — уже назначенные
+        поездки (по умолчанию — из schedule кейса). Заводы этих поездок тоже входят в подзадачу, чтобы
+        ТС могли вернуться туда, откуда начинают следующую поездку.
+        """
+        own = {p for p, c in self.plant_cluster.items() if c == cluster}
+        members = (set(guests) | {v for v, c in self.vehicle_home.items() if c == cluster}) - set(lent)
+        schedule = case_data.get('schedule') or {}
+        if trips is None:
+            trips = [trip for trip in schedule.get('trips', []) if trip['vehicle_id'] in members]
+        anchors = {plant_id for trip in trips for plant_id in (trip['plant_id'], trip['return_plant_id'])}
+        customers = []
+        for customer in case_data['customers']:
+            orders = [dict(order, plants=[p for p in (order['plants'] or own) if p in own])
+                      for order in customer.get('orders', []) if self.order_cluster[order['id']] == cluster]
+            if orders:
+                customers.append(dict(customer, orders=orders))
+        return {
+            "plants": [p for p in case_data['plants'] if p['id'] in own or p['id'] in anchors],
+            "vehicles": [v for v in case_data['vehicles'] if v['id'] in members],
+            "customers": customers,
+            "travel_times": case_data['travel_times'],
+            "schedule": {"trips": trips,
+                         "reservations": [r for r in schedule.get('reservations', []) if r['plant_id'] in own] +
+                                         list(reservations)},
+        }
+
+
+def add_minutes(text, minutes):
+    return (datetime.strptime(text, DATETIME_FORMAT) + timedelta(minutes=minutes)).strftime(DATETIME_FORMAT)
+
+
+def solve_cluster(sub_case, seed, run_options):
+    started = time.perf_counter()
+    result = run_restarts(sub_case, workers=1, seed=seed, **run_options)
+    return result, time.perf_counter() - started
+
+
+def solve_all(jobs, workers):
+    if workers == 1:
+        return [solve_cluster(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(solve_cluster, *zip(*jobs)))
+
+
+def plan_decomposed(case_data, restarts=30, workers=None, seed=None, time_limit=None, improve_time=None,
+                    prune=True, validate=False, num_clusters=None, **options):
+    """
+    Планирование по географическим кластерам (Partition): каждый кластер — отдельная подзадача
+    со своими заводами, ТС и заказами, подзадачи решаются мультистартом в разных процессах.
+    Затем согласование общих ТС: каждое общее ТС после своей последней поездки отдаётся одному
+    соседнему кластеру, где осталось больше всего недовезённого объёма, и этот кластер перерешается
+    поверх уже найденного плана (он загружается как подтверждённые поездки).
+    Итоговые метрики считаются по всему кейсу, как у обычного Scheduler. Параметры как у
+    main.run_restarts; time_limit делится между двумя этапами поровну.
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    travel_times = create_travel_times(case_data['travel_times'], case_data['plants'], case_data['customers'],
+                                       options.get('nearest'))
+    partition = Partition(case_data, num_clusters, seed, travel_times)
+    clusters = partition.clusters
+    workers = max(1, min(workers or os.cpu_count() or 1, len(clusters)))
+    run_options = dict(options, restarts=restarts, improve_time=improve_time, prune=prune, validate=validate,
+                       time_limit=time_limit / 2 * workers / len(clusters) if time_limit is not None else None)
+
+    cases = {c: partition.sub_case(case_data, c) for c in clusters}
+    solved = dict(zip(clusters, solve_all([(cases[c], seed + c, run_options) for c in clusters], workers)))
+    results = {c: result for c, (result, _) in solved.items()}
+    solve_time = {c: elapsed for c, (_, elapsed) in solved.items()}
+
+    # Согласование общих ТС. ТС соседнего кластера может взять его заказы только после своей последней
+    # поездки, вернувшись на завод этого кластера: у последней поездки снимается завод возврата, а время
+    # возврата берётся с запасом (до самого дальнего из заводов кластера, где ТС грузится). Каждое общее ТС
+    # отдаётся одному кластеру — с наибольшим недовезённым объёмом, а в своём кластере на втором этапе
+    # заменяется бронями постов, поэтому подзадачи второго этапа не пересекаются
+    vehicles = {vehicle['id']: vehicle for vehicle in case_data['vehicles']}
+    leftover = {c: results[c]["metrics"]["Undelivered Volume"] if results[c] else 0 for c in clusters}
+    trips_by_vehicle = {}
+    for c in clusters:
+        for trip in results[c]["assigned_trips"] if results[c] else []:
+            trips_by_vehicle.setdefault(trip['vehicle_id'], []).append(trip)
+    for trips in trips_by_vehicle.values():
+        trips.sort(key=lambda trip: trip['start_at'])
+    guests, open_ends = {}, {}
+    for vehicle_id, vehicle in vehicles.items():
+        candidates = [c for c in partition.shared_clusters(vehicle) if leftover[c] > 0]
+        if not candidates or vehicle_id not in trips_by_vehicle:
+            continue
+        c = max(candidates, key=lambda c: (leftover[c], -c))
+        last = trips_by_vehicle[vehicle_id][-1]
+        loadable = [p for p in vehicle['plants'] if partition.plant_cluster.get(p) == c]
+        # Время пути от последнего адреса должно быть известно до каждого завода, где ТС может начать
+        if not all((p, last['delivery_address_id']) in travel_times for p in loadable):
+            continue
+        guests.setdefault(c, []).append(vehicle_id)
+        reach = max(travel_times.get(p, last['delivery_address_id']) for p in loadable)
+        open_ends[vehicle_id] = dict(last, return_plant_id=None, return_at=add_minutes(last['unload_at'], reach))
+
+    job_clusters = sorted(guests)
+    jobs = []
+    for c in job_clusters:
+        lent = {v for v in open_ends if partition.vehicle_home[v] == c}
+        home_trips = results[c]["assigned_trips"] if results[c] else []
+        slots = [{"plant_id": trip['plant_id'], "start": trip['start_at'], "end": trip['load_at']}
+                 for trip in home_trips if trip['vehicle_id'] in lent]
+        trips = [trip for trip in home_trips if trip['vehicle_id'] not in lent] + \
+            [trip for v in guests[c] for trip in trips_by_vehicle[v][:-1] + [open_ends[v]]]
+        jobs.append((partition.sub_case(case_data, c, guests[c], lent, trips, slots),
+                     seed + len(clusters) + c, run_options))
+    reconciled, patched = {}, {}
+    for c, (sub_case, _, _), (result, elapsed) in zip(job_clusters, jobs,
+                                                       solve_all(jobs, max(1, min(workers, len(jobs))))):
+        solve_time[c] += elapsed
+        if result is None:
+            continue
+        existing = {trip['id'] for trip in sub_case["schedule"]["trips"]}
+        added = [trip for trip in result["assigned_trips"] if trip['id'] not in existing]
+        reconciled[c] = (result, added)
+        # Последняя поездка общего ТС возвращается на завод, откуда оно начинает работу в этом кластере
+        for vehicle_id in guests[c]:
+            taken = [trip for trip in added if trip['vehicle_id'] == vehicle_id]
+            if taken:
+                first = min(taken, key=lambda trip: trip['start_at'])
+                last = trips_by_vehicle[vehicle_id][-1]
+                patched[last['id']] = dict(
+                    last, return_plant_id=first['plant_id'],
+                    return_at=add_minutes(last['unload_at'],
+                                          travel_times.get(first['plant_id'], last['delivery_address_id'])))
+
+    assigned, failed, new_trips = [], [], 0
+    for c in clusters:
+        if results[c]:
+            assigned += [patched.get(trip['id'], trip) for trip in results[c]["assigned_trips"]]
+        if c in reconciled:
+            result, added = reconciled[c]
+            assigned += added
+            new_trips += len(added)
+            failed += result["failed_trips"]
+        elif results[c]:
+            failed += results[c]["failed_trips"]
+
+    # Метрики всего плана: поездки загружаются в общий планировщик как уже назначенные
+    # (заодно проверяется, что ТС и посты заводов не заняты дважды)
+    schedule = case_data.get('schedule') or {}
+    scheduler = build_scheduler(dict(case_data, schedule={"trips": assigned,
+                                                          "reservations": schedule.get('reservations', [])}),
+                                **options)
+    scheduler.calculate_metrics()
+    merged = compact_result(scheduler, seed=seed)
+    merged["failed_trips"] = failed
+    merged["pruning"] = {}
+    merged.update({"restarts": 0, "restarts_cut": 0, "time_saved": 0.0})
+    instruments = Instrumentation() if options.get("instrument") else None
+    for result in [results[c] for c in clusters] + [result for result, _ in reconciled.values()]:
+        if result is None:
+            continue
+        merged["restarts"] += result["restarts"]
+        merged["restarts_cut"] += result["restarts_cut"]
+        merged["time_saved"] += result["time_saved"]
+        for key, value in result["pruning"].items():
+            merged["pruning"][key] = merged["pruning"].get(key, 0) + value
+        if instruments is not None:
+            instruments.merge(result["instrumentation"])
+    merged["time_saved"] = round(merged["time_saved"], 3)
+    if instruments is not None:
+        merged["instrumentation"] = instruments.as_dict()
+    if validate:
+        from validation import validate_scheduler, summarize
+        merged["violations"] = summarize(validate_scheduler(scheduler))
+        merged["restarts_invalid"] = sum(result["restarts_invalid"] for result in results.values() if result)
+    merged["clusters"] = [{
+        "cluster": c,
+        "plants": sum(1 for cluster in partition.plant_cluster.values() if cluster == c),
+        "vehicles": sum(1 for cluster in partition.vehicle_home.values() if cluster == c),
+        "orders": sum(1 for cluster in partition.order_cluster.values() if cluster == c),
+        "guests": len(guests.get(c, [])),
+        "solve_s": round(solve_time[c], 3),
+    } for c in clusters]
+    merged["reconciled_trips"] = new_trips
+    return merged
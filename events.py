@@ -0,0 +1,78 @@
+# events.py
+
+import heapq
+
+
+class VehicleBreakdown:
+    """
+    ТС выходит из строя в момент at и недоступно до until (None — до конца смены).
+    """
+    def __init__(self, vehicle_id, at, until=None):
+        self.vehicle_id = vehicle_id
+        self.at = at
+        self.until = until
+
+
+class PlantOutage:
+    """
+    Завод не может грузить машины на всех постах в интервале [at, until).
+    """
+    def __init__(self, plant_id, at, until):
+        self.plant_id = plant_id
+        self.at = at
+        self.until = until
+
+
+class OrderChange:
+    """
+    В момент at общий объём заказа order_id меняется на total (0 — отмена заказа).
+    """
+    def __init__(self, order_id, at, total):
+        self.order_id = order_id
+        self.at = at
+        self.total = total
+
+
+class NewOrder:
+    """
+    В момент at поступает новый заказ order (объект classes.Order).
+    """
+    def __init__(self, order, at):
+        self.order = order
+        self.at = at
+
+
+class EventQueue:
+    """
+    Очередь событий на куче. Ключ — время события, при равенстве времени события
+    извлекаются в порядке добавления.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __bool__(self):
+        return bool(self._heap)
+
+    def __iter__(self):
+        # События в порядке кучи, без сортировки
+        return (event for _, _, event in self._heap)
+
+    def push(self, time, event):
+        heapq.heappush(self._heap, (time, self._seq, event))
+        self._seq += 1
+
+    def pop(self):
+        time, _, event = heapq.heappop(self._heap)
+        return time, event
+
+    def snapshot(self):
+        return list(self._heap), self._seq
+
+    def restore(self, state):
+        heap, self._seq = state
+        self._heap = list(heap)
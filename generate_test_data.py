@@ -1,9 +1,15 @@
 # generate_test_data.py
 
+import argparse
 import json
+import math
+import os
 import random
+from array import array
 from datetime import datetime, timedelta
 
+from travel import TravelTimeMatrix
+
 order_counter = 0
 
 
@@ -90,23 +96,173 @@ def generate_travel_times(plants, customers):
     return travel_times
 
 
+def make_clusters(rng, num_clusters):
+    """
+    Центры «городов»: заводы, ТС и клиенты располагаются вокруг них.
+    """
+    return [(round(rng.uniform(54.0, 58.0), 6), round(rng.uniform(35.0, 60.0), 6)) for _ in range(num_clusters)]
+
+
+def near(rng, center, spread):
+    return round(rng.gauss(center[0], spread), 6), round(rng.gauss(center[1], spread), 6)
+
+
+def road_minutes(a, b, speed_kmh=40):
+    """
+    Время пути по прямой с поправкой на дороги: 10 минут на подачу плюс дорога со скоростью speed_kmh.
+    """
+    dlat = (a[0] - b[0]) * 111.0
+    dlon = (a[1] - b[1]) * 111.0 * math.cos(math.radians((a[0] + b[0]) / 2))
+    return 10 + round(math.hypot(dlat, dlon) * 1.3 / speed_kmh * 60)
+
+
+def generate_case(num_plants, num_vehicles, num_customers, num_orders=1, seed=None, num_clusters=None, num_days=1):
+    """
+    Неинтерактивная генерация большого кейса с кластерной географией. При одинаковом seed данные
+    совпадают. num_orders — заказов на клиента. Время пути выводится из координат, поэтому матрица
+    возвращается сразу как TravelTimeMatrix (её можно передать в build_scheduler вместо JSON).
+    При num_days > 1 заказы распределяются по дням начиная с сегодняшнего (для горизонта планирования).
+    """
+    rng = random.Random(seed)
+    clusters = make_clusters(rng, num_clusters or max(1, num_plants // 10))
+    dates = [(datetime.today() + timedelta(days=day)).strftime('%Y-%m-%d') for day in range(num_days)]
+
+    plants, plant_cluster = [], {}
+    for pid in range(1, num_plants + 1):
+        cluster = (pid - 1) % len(clusters)  # В каждом кластере хотя бы один завод
+        latitude, longitude = near(rng, clusters[cluster], 0.1)
+        plants.append({
+            "id": pid, "latitude": latitude, "longitude": longitude,
+            "work_time_start": "06:00:00", "work_time_end": "22:00:00"
+        })
+        plant_cluster[pid] = cluster
+    cluster_plants = [[p["id"] for p in plants if plant_cluster[p["id"]] == c] for c in range(len(clusters))]
+
+    vehicles = []
+    for i in range(1, num_vehicles + 1):
+        home = cluster_plants[rng.randrange(len(clusters))]
+        plants_work_with = rng.sample(home, k=rng.randint(1, min(3, len(home))))
+        shift_start = rng.choice([6, 7, 8])
+        vehicles.append({
+            "id": i,
+            "number": f"H{rng.randint(100, 999)}KK{rng.randint(100, 999)}",
+            "volume": rng.choice([8, 10, 12]),
+            "rent": rng.random() < 0.3,
+            "gidrolotok": rng.random() < 0.5,
+            "axes": rng.choice([4, 6]),
+            "work_time_start": f"{shift_start:02d}:00:00",
+            "work_time_end": f"{shift_start + 12:02d}:00:00",
+            "plants": plants_work_with,
+            "plant_start": rng.choice(plants_work_with)
+        })
+
+    coordinates = {p["id"]: (p["latitude"], p["longitude"]) for p in plants}
+    customers, customer_coordinates, order_id = [], [], 0
+    for cid in range(1, num_customers + 1):
+        point = near(rng, clusters[rng.randrange(len(clusters))], 0.15)
+        customer_coordinates.append(point)
+        # Заказ можно грузить на 1-3 ближайших заводах
+        nearest = sorted(coordinates, key=lambda pid: road_minutes(coordinates[pid], point))
+        orders = []
+        for _ in range(num_orders):
+            orders.append({
+                "id": order_id,
+                "status": "new",
+                "total": rng.randint(5, 40),
+                "date_shipment": dates[rng.randrange(num_days)] if num_days > 1 else dates[0],
+                "first_order_time_delivery": f"{rng.randint(7, 15):02d}:{rng.choice([0, 15, 30, 45]):02d}:00",
+                "time_unloading": rng.randint(20, 60),
+                "type_delivery": "withInterval",
+                "time_interval_client": rng.randint(15, 60),
+                "axle": rng.choice([4, 6]),
+                "gidrolotok": rng.random() < 0.3,
+                "plants": nearest[:rng.randint(1, 3)],
+                "delivery_address_id": cid
+            })
+            order_id += 1
+        customers.append({"id": cid, "delivery_address_id": cid, "latitude": point[0], "longitude": point[1],
+                          "orders": orders})
+
+    plant_ids = [p["id"] for p in plants]
+    data = array('i', (road_minutes(coordinates[pid], point) for pid in plant_ids for point in customer_coordinates))
+    travel_times = TravelTimeMatrix(plant_ids, [c["id"] for c in customers], data)
+    return {"plants": plants, "vehicles": vehicles, "customers": customers, "travel_times": travel_times}
+
+
+def save_case(case, path, binary=None):
+    """
+    Сохраняет кейс в папку path. Матрица времени пути пишется в travel_times.bin, если она
+    большая (или binary=True), иначе — в travel_times.json.
+    """
+    os.makedirs(path, exist_ok=True)
+    save_json(case["plants"], f'{path}/plants.json')
+    save_json(case["vehicles"], f'{path}/vehicles.json')
+    save_json(case["customers"], f'{path}/customers.json')
+    matrix = case["travel_times"]
+    if binary is None:
+        binary = len(matrix.plant_ids) * matrix.n_addresses > 100_000
+    if binary:
+        matrix.save(f'{path}/travel_times.bin')
+    else:
+        save_json([{"plant_id": plant_id, "customer_id": address_id, "travel_time_minutes": matrix.get(plant_id, address_id)}
+                   for plant_id in matrix.plant_ids for address_id in matrix.address_ids],
+                  f'{path}/travel_times.json')
+
+
+def case_path(case):
+    """
+    Папка (или однофайловый кейс, см. case_file.py): существующий путь или имя подпапки в data/.
+    """
+    return case if os.path.exists(case) or os.sep in case else f'data/{case}'
+
+
 def save_json(data, filename):
     with open(filename, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=4)
 
 
-def main():
-    case_name = input("Введите название тестового случая: ")
-    with open(f'data/{case_name}/config.json', 'r') as f:
-        config = json.load(f)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генерация тестового кейса по config.json в папке кейса")
+    parser.add_argument("case", nargs="?",
+                        help="папка кейса: путь или имя в data/ (без аргумента — запрос в консоли)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="сид: кейс генерируется воспроизводимо, с кластерной географией")
+    # Размеры можно задать без config.json (или переопределить его); тогда конфиг сохраняется в папку кейса
+    parser.add_argument("--plants", type=int, dest="num_plants")
+    parser.add_argument("--vehicles", type=int, dest="num_vehicles")
+    parser.add_argument("--customers", type=int, dest="num_customers")
+    parser.add_argument("--orders", type=int, dest="num_orders", help="заказов на клиента")
+    parser.add_argument("--clusters", type=int, dest="num_clusters")
+    parser.add_argument("--days", type=int, dest="num_days", help="дней, по которым распределяются заказы")
+    args = parser.parse_args(argv)
+    path = case_path(args.case or input("Введите название тестового случая: "))
+
+    config = {}
+    if os.path.exists(f'{path}/config.json'):
+        with open(f'{path}/config.json', 'r') as f:
+            config = json.load(f)
+    overrides = {key: value for key, value in vars(args).items() if key.startswith("num_") and value is not None}
+    if args.seed is not None:
+        overrides["seed"] = args.seed
+    if overrides:
+        config.update(overrides)
+        os.makedirs(path, exist_ok=True)
+        save_json(config, f'{path}/config.json')
+
+    if config.get('seed') is not None:
+        case = generate_case(num_plants=config['num_plants'], num_vehicles=config['num_vehicles'],
+                             num_customers=config['num_customers'], num_orders=config.get('num_orders', 1),
+                             seed=config['seed'], num_clusters=config.get('num_clusters'),
+                             num_days=config.get('num_days', 1))
+        save_case(case, path)
+        print(f"Тестовые данные успешно сгенерированы и сохранены в папке {path}.")
+        return
 
     plants = generate_plants(num_plants=config['num_plants'])
     vehicles = generate_vehicles(num_vehicles=config['num_vehicles'], plants=plants)
     customers = generate_customers(num_customers=config['num_customers'], plants=plants)
     travel_times = generate_travel_times(plants, customers)
 
-
-    path = f'data/{case_name}'
     # Сохранение данных в JSON-файлы
     save_json(plants, f'{path}/plants.json')
     save_json(vehicles, f'{path}/vehicles.json')
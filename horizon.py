@@ -0,0 +1,253 @@
+# horizon.py
+
+import os
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from classes import DATETIME_FORMAT, Trip, parse_minutes, planning_day, work_window
+from instrumentation import Instrumentation
+from main import create_plants, create_vehicles, run_restarts
+from validation import validate_plan
+
+DAY = 24 * 60
+# Нарушения, которые могут возникнуть только на стыке дней: внутри дня их не допускает Scheduler
+JOINT_VIOLATIONS = ("vehicle_overlap", "plant_capacity", "plant_continuity")
+# Метрики горизонта — суммы по дням, кроме этих (среднее по дням)
+AVERAGED_METRICS = ("Plant utilization",)
+
+
+def operational_day(order, shifts):
+    """
+    Полночь дня, к которому относится заказ: день отгрузки, а если время заказа не попадает
+    ни в одну смену этого дня, но попадает в ночную смену предыдущего — предыдущий день.
+    shifts — рабочие окна ТС в минутах от полуночи (classes.work_window).
+    """
+    day = datetime.strptime(order['date_shipment'], '%Y-%m-%d')
+    minute = parse_minutes(order['first_order_time_delivery'])
+    if not any(start <= minute <= end for start, end in shifts) and \
+            any(start <= minute + DAY <= end for start, end in shifts):
+        day -= timedelta(days=1)
+    return day
+
+
+def split_days(case_data):
+    """
+    Делит кейс на дни: {полночь дня: данные кейса (как main.load_case) с заказами, поездками
+    и бронями только этого дня}. Заводы, ТС и матрица времени пути общие.
+    """
+    shifts = {work_window(v['work_time_start'], v['work_time_end']) for v in case_data['vehicles']}
+    orders = defaultdict(lambda: defaultdict(list))
+    for i, customer in enumerate(case_data['customers']):
+        for order in customer.get('orders', []):
+            orders[operational_day(order, shifts)][i].append(order)
+    schedule = case_data.get('schedule') or {}
+    trips, reservations = defaultdict(list), defaultdict(list)
+    for trip in schedule.get('trips', []):
+        trips[planning_day(datetime.strptime(trip['start_at'], DATETIME_FORMAT))].append(trip)
+    for reservation in schedule.get('reservations', []):
+        reservations[planning_day(datetime.strptime(reservation['start'], DATETIME_FORMAT))].append(reservation)
+
+    days = {}
+    for day in sorted(orders.keys() | trips.keys() | reservations.keys()):
+        days[day] = {
+            "plants": case_data['plants'],
+            "vehicles": case_data['vehicles'],
+            "customers": [dict(customer, orders=orders[day].get(i, []))
+                          for i, customer in enumerate(case_data['customers'])],
+            "travel_times": case_data['travel_times'],
+            "schedule": {"trips": trips[day], "reservations": reservations[day]},
+        }
+    return days
+
+
+def solve_day(day_case, day_start, seed, run_options):
+    """
+    Мультистарт одного дня в одном процессе: у дня свои календари постов и индексы ТС.
+    Время решения дня — в result["solve_s"].
+    """
+    started = time.perf_counter()
+    result = run_restarts(day_case, workers=1, seed=seed, day_start=day_start, **run_options)
+    if result is not None:
+        result["solve_s"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def carry_over(day_case, spill, positions):
+    """
+    Данные дня с тем, что осталось от предыдущего: ТС стартуют с завода, где закончили
+    (positions), а поездки, которые ещё идут после полуночи (spill), уже заняты.
+    """
+    # Для ТС с переходящей поездкой завод старта не нужен: следующая поездка сверяется с ней
+    spilled = {data["vehicle_id"] for data in spill}
+    vehicles = [dict(vehicle, plant_start=None if vehicle['id'] in spilled
+                     else positions.get(vehicle['id'], vehicle['plant_start']))
+                for vehicle in day_case['vehicles']]
+    schedule = day_case['schedule']
+    return dict(day_case, vehicles=vehicles,
+                schedule={"trips": spill + schedule['trips'], "reservations": schedule['reservations']})
+
+
+def exclude_inherited(result, spill, day_start, plants):
+    """
+    Результат дня, решённого с переходящими поездками (carry_over), без их вклада в метрики и score:
+    эти поездки уже посчитаны в предыдущем дне, а merge_days суммирует метрики по дням.
+    """
+    trips = [Trip.from_dict(data, day_start) for data in spill]
+    capacity = sum(p.loading_capacity * (p.work_time_end - p.work_time_start) for p in plants.values())
+    inherited = {
+        "Plan time delta": sum(abs(trip.arrive_at - trip.plan_date_object) for trip in trips),
+        "Empty run minutes": sum(trip.return_at - trip.unload_at for trip in trips),
+        "Late arrivals": sum(trip.arrive_at > trip.plan_date_object for trip in trips),
+        "Plant utilization": sum(plants[trip.plant_id].loading_time for trip in trips) / capacity if capacity else 0,
+    }
+    metrics = dict(result["metrics"])
+    for key, value in inherited.items():
+        metrics[key] -= value
+    metrics["Plant utilization"] = round(metrics["Plant utilization"], 4)
+    undelivered, plan_delta = result["score"]
+    return dict(result, metrics=metrics, score=(undelivered, plan_delta + inherited["Plan time delta"]))
+
+
+def joint_violations(result, spill, positions, day_start, plants, vehicles):
+    """
+    Нарушения на стыке с предыдущим днём: план дня, решённый от заводов старта ТС, проверяется
+    вместе с переходящими поездками и фактическими заводами, где ТС закончили предыдущий день.
+    """
+    records = spill + result["assigned_trips"]
+    trips = [Trip.from_dict(data, day_start) for data in records]
+    for trip, data in zip(trips, records):
+        trip.id = data["id"]
+    spilled = {data["vehicle_id"] for data in spill}
+    for vehicle_id, vehicle in vehicles.items():
+        vehicle.plant_start = None if vehicle_id in spilled else positions.get(vehicle_id, vehicle.plant_start)
+    found = validate_plan(trips, plants, vehicles)
+    return {kind: found[kind] for kind in JOINT_VIOLATIONS if kind in found}
+
+
+def plan_horizon(case_data, restarts=30, workers=None, seed=None, time_limit=None, improve_time=None, **options):
+    """
+    Планирование на несколько дней за один запуск. Заказы делятся по дням (operational_day),
+    у каждого дня свой планировщик; ночные смены (конец раньше начала) заканчиваются на следующий
+    день. ТС начинают день на заводе, где закончили предыдущий, а поездки после полуночи занимают
+    ТС и посты (carry_over).
+    С одним воркером дни решаются по порядку, каждый — от итогов предыдущего. С несколькими дни
+    сначала решаются параллельно в предположении, что ТС стартуют со своих заводов старта, затем
+    проходятся по порядку: если план дня не согласуется с предыдущим (joint_violations), он
+    отбрасывается и день перерешается последовательно. time_limit — на весь горизонт: параллельный
+    проход получает половину, перерешивания — остаток (если он исчерпан — один рестарт). Параметры
+    как у main.run_restarts.
+    Результат в формате run_restarts, по дням — в result["days"], время параллельного прохода,
+    перерешиваний и отброшенных планов — в result["horizon"].
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    started = time.perf_counter()
+    deadline = started + time_limit if time_limit is not None else None
+    days = split_days(case_data)
+    starts = list(days)
+    if not starts:
+        return None
+    workers = max(1, min(workers or os.cpu_count() or 1, len(starts)))
+    parallel = workers > 1
+    # Бюджет времени делится между днями с учётом того, что workers дней решаются одновременно;
+    # параллельному проходу — половина, вторая остаётся на перерешивание несогласованных дней
+    share = (0.5 if parallel else 1) * workers / len(starts)
+    run_options = dict(options, restarts=restarts, improve_time=improve_time,
+                       time_limit=time_limit * share if time_limit is not None else None)
+    seeds = [seed + k for k in range(len(starts))]
+    results = [None] * len(starts)
+    if parallel:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(solve_day, [days[day] for day in starts], starts, seeds,
+                                    [run_options] * len(starts)))
+    timing = {"parallel_pass_s": round(time.perf_counter() - started, 3) if parallel else None,
+              "sequential_s": 0.0, "discarded_s": 0.0}
+
+    def sequential_options(days_left):
+        if deadline is None:
+            return run_options
+        left = deadline - time.perf_counter()
+        if left <= 0:
+            return dict(run_options, restarts=1, time_limit=None)
+        return dict(run_options, time_limit=left / days_left)
+
+    plants = {plant.id: plant for plant in create_plants(case_data['plants'])}
+    vehicles = {vehicle.id: vehicle for vehicle in create_vehicles(case_data['vehicles'])}
+    depots = {vehicle_id: vehicle.plant_start for vehicle_id, vehicle in vehicles.items()}
+    positions, spill = {}, []
+    accepted = []
+    for k, day in enumerate(starts):
+        result = results[k]
+        carried = bool(spill or positions)
+        resolved = False
+        if parallel and carried:
+            for vehicle_id, vehicle in vehicles.items():
+                vehicle.plant_start = depots[vehicle_id]
+            if result is None or joint_violations(result, spill, positions, day, plants, vehicles):
+                if result is not None:
+                    timing["discarded_s"] += result["solve_s"]
+                result, resolved = None, True
+        if not parallel or resolved:
+            day_started = time.perf_counter()
+            result = solve_day(carry_over(days[day], spill, positions) if carried else days[day], day, seeds[k],
+                               sequential_options(len(starts) - k))
+            timing["sequential_s"] += time.perf_counter() - day_started
+            if result is not None and carried:
+                result = exclude_inherited(result, spill, day, plants)
+        spilled = {data["id"] for data in spill}
+        trips = [data for data in result["assigned_trips"] if data["id"] not in spilled] if result else []
+        accepted.append((day, result, trips, resolved))
+
+        # Завод, где ТС закончило день, и поездки, которые закончатся уже в следующем дне
+        next_day = starts[k + 1] if k + 1 < len(starts) else None
+        by_start = sorted(spill + trips, key=lambda data: data["start_at"])
+        for data in by_start:
+            positions[data["vehicle_id"]] = data["return_plant_id"]
+        spill = [data for data in by_start if next_day is not None
+                 and datetime.strptime(data["return_at"], DATETIME_FORMAT) > next_day]
+    merged = merge_days(accepted, seed, options)
+    merged["horizon"] = {key: round(value, 3) if value is not None else None for key, value in timing.items()}
+    return merged
+
+
+def merge_days(accepted, seed, options):
+    merged = {"seed": seed, "assigned_trips": [], "failed_trips": [], "metrics": {}, "pruning": {},
+              "restarts": 0, "restarts_cut": 0, "time_saved": 0.0, "days": []}
+    instruments = Instrumentation() if options.get("instrument") else None
+    score = None
+    for day, result, trips, resolved in accepted:
+        merged["days"].append({"date": day.strftime('%Y-%m-%d'), "seed": result["seed"] if result else None,
+                               "trips": len(trips), "resolved": resolved,
+                               "solve_s": result["solve_s"] if result else None,
+                               "metrics": result["metrics"] if result else {}})
+        if result is None:
+            continue
+        merged["assigned_trips"] += trips
+        merged["failed_trips"] += result["failed_trips"]
+        for key in ("restarts", "restarts_cut", "time_saved"):
+            merged[key] += result[key]
+        for key, value in result["pruning"].items():
+            merged["pruning"][key] = merged["pruning"].get(key, 0) + value
+        for key, value in result["metrics"].items():
+            merged["metrics"][key] = merged["metrics"].get(key, 0) + value
+        score = result["score"] if score is None else tuple(a + b for a, b in zip(score, result["score"]))
+        if "violations" in result:
+            violations = merged.setdefault("violations", {})
+            for kind, n in result["violations"].items():
+                violations[kind] = violations.get(kind, 0) + n
+            merged["restarts_invalid"] = merged.get("restarts_invalid", 0) + result["restarts_invalid"]
+        if instruments is not None:
+            instruments.merge(result["instrumentation"])
+    solved = sum(1 for _, result, _, _ in accepted if result is not None)
+    for key in AVERAGED_METRICS:
+        if key in merged["metrics"] and solved:
+            merged["metrics"][key] = round(merged["metrics"][key] / solved, 4)
+    merged["score"] = score
+    merged["time_saved"] = round(merged["time_saved"], 3)
+    merged["days_resolved"] = sum(1 for *_, resolved in accepted if resolved)
+    if instruments is not None:
+        merged["instrumentation"] = instruments.as_dict()
+    return merged
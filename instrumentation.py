@@ -0,0 +1,84 @@
+# instrumentation.py
+
+import json
+
+
+class Instrumentation:
+    """
+    Счётчики, таймеры и распределения для горячих путей планировщика. Включается флагом
+    Scheduler(..., instrument=True); в выключенном состоянии планировщик хранит None и в горячих
+    путях проверяет только это поле, поэтому замеры ничего не стоят.
+      counters     — {имя: число}, например проверки доступности ТС, шаги поиска слота;
+      timers       — {имя: [вызовов, секунд]}, время фаз (simulate, assign_trip, local_search, ...);
+      observations — {имя: [количество, сумма, минимум, максимум]}, например кандидатов на заявку.
+    Для пар счётчиков <имя>_hits и <имя>_misses (кэши) as_dict добавляет долю попаданий в hit_rates.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self.observations = {}
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, seconds, calls=1):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [calls, seconds]
+        else:
+            timer[0] += calls
+            timer[1] += seconds
+
+    def observe(self, name, value):
+        stats = self.observations.get(name)
+        if stats is None:
+            self.observations[name] = [1, value, value, value]
+        else:
+            stats[0] += 1
+            stats[1] += value
+            stats[2] = min(stats[2], value)
+            stats[3] = max(stats[3], value)
+
+    def merge(self, data):
+        """
+        Добавляет результаты другого экземпляра (в виде as_dict(), например из процесса-воркера).
+        """
+        for name, n in data["counters"].items():
+            self.count(name, n)
+        for name, timer in data["timers"].items():
+            self.add_time(name, timer["total_s"], timer["calls"])
+        for name, stats in data["observations"].items():
+            current = self.observations.get(name)
+            if current is None:
+                self.observations[name] = [stats["count"], stats["sum"], stats["min"], stats["max"]]
+            else:
+                current[0] += stats["count"]
+                current[1] += stats["sum"]
+                current[2] = min(current[2], stats["min"])
+                current[3] = max(current[3], stats["max"])
+
+    def as_dict(self):
+        return {
+            "counters": dict(sorted(self.counters.items())),
+            "timers": {name: {"calls": calls, "total_s": round(total, 6),
+                              "mean_ms": round(total / calls * 1000, 4) if calls else 0}
+                       for name, (calls, total) in sorted(self.timers.items())},
+            "observations": {name: {"count": count, "sum": total, "min": low, "max": high,
+                                     "mean": round(total / count, 3) if count else 0}
+                             for name, (count, total, low, high) in sorted(self.observations.items())},
+            "hit_rates": self.hit_rates(),
+        }
+
+    def hit_rates(self):
+        rates = {}
+        for name, hits in sorted(self.counters.items()):
+            if name.endswith("_hits"):
+                cache = name[:-len("_hits")]
+                lookups = hits + self.counters.get(f"{cache}_misses", 0)
+                rates[cache] = round(hits / lookups, 4) if lookups else None
+        return rates
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, ensure_ascii=False, indent=4)
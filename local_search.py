@@ -0,0 +1,135 @@
+# local_search.py
+
+import random
+import time
+from collections import defaultdict
+
+MOVES = ("vehicle", "plant", "retime", "reinsert")
+
+
+class LocalSearch:
+    """
+    Улучшение расписания после жадного прохода Scheduler.simulate. Ходы:
+      vehicle  — передать поездку другому ТС;
+      plant    — сменить завод погрузки;
+      retime   — перенести поездку того же ТС в ближайший к плану свободный слот;
+      reinsert — повторить заявку, на которую жадный проход не нашёл вариантов.
+    Изменение метрик (недовезённый объём, отклонение от плана) считается по разнице между
+    старой и новой поездкой, без пересимуляции; итоговые значения ведёт MetricsAccumulator.
+    Ход принимается, если метрики не ухудшаются; иначе состояние откатывается через
+    Scheduler.snapshot/restore.
+    Локальный поиск — завершающая фаза: он меняет список failed_trips, поэтому снимки,
+    сделанные до него, кроме исходного (reset), восстанавливать нельзя.
+    """
+
+    def __init__(self, scheduler, seed=None):
+        self.scheduler = scheduler
+        self.random = random.Random(seed)
+        # Разгрузки по адресам: новые варианты не должны пересекаться с чужими разгрузками
+        self.address_trips = defaultdict(list)
+        for trip in scheduler.assigned_trips:
+            self.address_trips[trip.delivery_address_id].append(trip)
+        self.pruning_stats = scheduler.new_pruning_stats()
+        self.stats = {move: {"tried": 0, "accepted": 0} for move in MOVES}
+        self.stats["iterations"] = 0
+
+    def score(self):
+        return self.scheduler.score()
+
+    def unloading_free(self, trip, ignore=None):
+        for other in self.address_trips[trip.delivery_address_id]:
+            if other is not ignore and trip.arrive_at < other.unload_at and other.arrive_at < trip.unload_at:
+                return False
+        return True
+
+    def _commit(self, trip):
+        self.scheduler.commit_trip(trip)
+        self.address_trips[trip.delivery_address_id].append(trip)
+
+    def _best(self, candidates, delta):
+        """
+        Кандидаты с минимальной (по метрикам) разницей; при равенстве — случайный из лучших.
+        """
+        deltas = [delta(c) for c in candidates]
+        best = min(deltas)
+        return self.random.choice([c for c, d in zip(candidates, deltas) if d == best]), best
+
+    def relocate(self, trip, move):
+        sch = self.scheduler
+        if trip.confirm or not sch.vehicles[trip.vehicle_id].can_unassign(trip):
+            return False
+        state = sch.snapshot()
+        sch.uncommit_trip(trip)
+        # Новая заявка на плановое время поездки: слот подбирается заново
+        request = sch.new_request(sch.orders[trip.order_id], trip.plan_date_object)
+        if move == "vehicle":
+            candidates = [c for c in sch.suitable_trips(request, stats=self.pruning_stats)
+                          if c.vehicle_id != trip.vehicle_id]
+        elif move == "plant":
+            candidates = [c for c in sch.suitable_trips(request, stats=self.pruning_stats)
+                          if c.plant_id != trip.plant_id]
+        else:
+            candidates = sch.suitable_trips(request, vehicle_ids={trip.vehicle_id}, plant_ids={trip.plant_id},
+                                            stats=self.pruning_stats)
+        candidates = [c for c in candidates if self.unloading_free(c, ignore=trip)]
+
+        old_deviation = abs(trip.arrive_at - trip.plan_date_object)
+        if candidates:
+            best, (d_undelivered, d_plan) = self._best(candidates, lambda c: (
+                trip.total - c.total, abs(c.arrive_at - c.plan_date_object) - old_deviation))
+            if (d_undelivered, d_plan) <= (0, 0):
+                self.address_trips[trip.delivery_address_id].remove(trip)
+                self._commit(best)
+                return True
+        sch.restore(state)
+        return False
+
+    def reinsert(self):
+        sch = self.scheduler
+        failed = [i for i, (request, _) in enumerate(sch.failed_trips)
+                  if request is not None and sch.remaining[request.order_id] > 0]
+        if not failed:
+            return False
+        index = self.random.choice(failed)
+        request = sch.failed_trips[index][0]
+        candidates = [c for c in sch.suitable_trips(request, stats=self.pruning_stats) if self.unloading_free(c)]
+        if not candidates:
+            return False
+        best, _ = self._best(candidates, lambda c: abs(c.arrive_at - c.plan_date_object))
+        del sch.failed_trips[index]
+        self._commit(best)
+
+        # Продолжаем цепочку заказа так же, как это сделал бы жадный проход
+        order = sch.orders[request.order_id]
+        while sch.remaining[order.id] > 0:
+            request = sch.new_request(order, best.unload_at + order.time_interval_client)
+            candidates = [c for c in sch.suitable_trips(request, stats=self.pruning_stats) if self.unloading_free(c)]
+            if not candidates:
+                sch.failed_trips.append((request, "No suitable trips"))
+                break
+            best, _ = self._best(candidates, lambda c: abs(c.arrive_at - c.plan_date_object))
+            self._commit(best)
+        return True
+
+    def run(self, time_limit=1.0, max_iterations=None):
+        """
+        Случайные ходы до истечения time_limit секунд или max_iterations итераций.
+        """
+        sch = self.scheduler
+        deadline = time.monotonic() + time_limit
+        iterations = 0
+        while time.monotonic() < deadline and (max_iterations is None or iterations < max_iterations):
+            if not sch.assigned_trips and not sch.failed_trips:
+                break
+            iterations += 1
+            move = self.random.choice(MOVES)
+            if move == "reinsert":
+                accepted = self.reinsert()
+            elif sch.assigned_trips:
+                accepted = self.relocate(self.random.choice(sch.assigned_trips), move)
+            else:
+                continue
+            self.stats[move]["tried"] += 1
+            self.stats[move]["accepted"] += accepted
+        self.stats["iterations"] += iterations
+        return sch.calculate_metrics()
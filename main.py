@@ -1,10 +1,22 @@
 # main.py
-import copy
+import argparse
 import json
-from datetime import datetime, timedelta
-from classes import Plant, Vehicle, Customer, Order
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from classes import Plant, Vehicle, Customer, Order, Trip, planning_day, datetime_minutes
 from simulation import Scheduler
+from local_search import LocalSearch
+from travel import TravelTimeMatrix, EstimatedTravelTimes, DEFAULT_NEAREST
+from case_file import load_case_file, is_case_file
+from case_cache import load_cached_case
+from instrumentation import Instrumentation
+from scoring import STRATEGIES, make_strategy
+from generate_test_data import case_path
 import cProfile
+import pstats
+import sys
 
 def load_json_data(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
@@ -44,7 +56,7 @@ def create_vehicles(vehicles_data):
     return vehicles
 
 
-def create_customers(customers_data):
+def create_customers(customers_data, day_start=None):
     customers = []
     for customer in customers_data:
         new_customer = Customer(
@@ -65,73 +77,508 @@ def create_customers(customers_data):
                 axle=order['axle'],
                 gidrolotok=order['gidrolotok'],
                 plants=order['plants'],
-                delivery_address_id=order['delivery_address_id']
+                delivery_address_id=order['delivery_address_id'],
+                day_start=day_start
             )
             new_customer.add_order(o)
         customers.append(new_customer)
     return customers
 
 
-def create_travel_times(travel_times_data):
-    travel_times = {}
-    for entry in travel_times_data:
-        key = (entry['plant_id'], entry['customer_id'])
-        travel_times[key] = timedelta(minutes=entry['travel_time_minutes'])
-    return travel_times
-
-
-def main():
-    case_name = input("Введите название кейса: ")
-    #case_name = 'case_2_2_2'
-    path = f'data/{case_name}'
-    # Пути к JSON-файлам
-    plants_file = f'{path}/plants.json'
-    vehicles_file = f'{path}/vehicles.json'
-    customers_file = f'{path}/customers.json'
-    travel_times_file = f'{path}/travel_times.json'
-
-    # Загрузка данных из JSON
-    plants_data = load_json_data(plants_file)
-    vehicles_data = load_json_data(vehicles_file)
-    customers_data = load_json_data(customers_file)
-    travel_times_data = load_json_data(travel_times_file)
-
-    # Создание объектов
-    plants = create_plants(plants_data)
-    vehicles = create_vehicles(vehicles_data)
-    customers = create_customers(customers_data)
-    travel_times = create_travel_times(travel_times_data)
-
-    best_metric = None
+def create_existing_schedule(schedule_data, day_start=None):
+    """
+    Уже подтверждённые поездки и брони постов погрузки из schedule.json:
+    {"trips": [Trip.to_dict()], "reservations": [{"plant_id", "start", "end"}]}.
+    """
+    day_start = day_start or planning_day()
+    trips = [Trip.from_dict(trip, day_start) for trip in schedule_data.get('trips', [])]
+    reservations = [(r['plant_id'], datetime_minutes(r['start'], day_start), datetime_minutes(r['end'], day_start))
+                    for r in schedule_data.get('reservations', [])]
+    return trips, reservations
+
+
+def create_travel_times(travel_times_data, plants=None, customers=None, nearest=None):
+    """
+    Матрица времени пути из данных кейса. С nearest=k недостающие пары оцениваются по координатам
+    заводов и клиентов для k ближайших к адресу заводов (travel.EstimatedTravelTimes); то же
+    по умолчанию, если матрицы в кейсе нет совсем.
+    """
+    # Бинарная матрица уже загружена (отображена в память) в load_case
+    if isinstance(travel_times_data, TravelTimeMatrix):
+        matrix = travel_times_data
+    # Колоночный формат: {"plant_ids", "address_ids", "minutes"}
+    elif isinstance(travel_times_data, dict):
+        matrix = TravelTimeMatrix.from_columns(travel_times_data)
+    else:
+        matrix = TravelTimeMatrix.from_entries(travel_times_data or [])
+    if plants is None or customers is None or (nearest is None and matrix.plant_ids):
+        return matrix
+    plant_points = {p['id']: (p['latitude'], p['longitude']) for p in plants}
+    address_points = {c['delivery_address_id']: (c['latitude'], c['longitude']) for c in customers
+                      if c.get('latitude') is not None and c.get('longitude') is not None}
+    return EstimatedTravelTimes(matrix, plant_points, address_points, nearest or DEFAULT_NEAREST)
+
+
+def load_case(path, cache=False):
+    """
+    Читает сырые данные кейса из папки или однофайлового кейса (case_file.py).
+    Результат сериализуем и передаётся в процессы-воркеры. С cache=True папка кейса читается
+    через снимок в .cache/ (case_cache.py), который пересобирается при изменении исходных файлов.
+    """
+    if is_case_file(path):
+        return load_case_file(path)
+    if cache:
+        return load_cached_case(path, load_case)
+    return {
+        "plants": load_json_data(f'{path}/plants.json'),
+        "vehicles": load_json_data(f'{path}/vehicles.json'),
+        "customers": load_json_data(f'{path}/customers.json'),
+        "travel_times": load_travel_times(path),
+        # Необязательный файл с уже занятыми слотами и подтверждёнными поездками
+        "schedule": load_json_data(f'{path}/schedule.json') if os.path.exists(f'{path}/schedule.json') else None,
+    }
+
+
+def load_travel_times(path):
+    """
+    Большие предрасчитанные матрицы берутся из travel_times.bin (см. travel.convert_json), иначе — из JSON.
+    """
+    if os.path.exists(f'{path}/travel_times.bin'):
+        return TravelTimeMatrix.load(f'{path}/travel_times.bin')
+    # Без матрицы время пути оценивается по координатам (create_travel_times)
+    if not os.path.exists(f'{path}/travel_times.json'):
+        return []
+    return load_json_data(f'{path}/travel_times.json')
+
+
+def build_scheduler(case_data, seed=None, day_start=None, nearest=None, **options):
+    """
+    options передаются в Scheduler как есть (vectorized, scoring, return_slack, ...);
+    nearest — см. create_travel_times.
+    """
+    day_start = day_start or planning_day()
+    if case_data.get('schedule'):
+        options['existing_trips'], options['reservations'] = create_existing_schedule(case_data['schedule'], day_start)
+    return Scheduler(
+        plants=create_plants(case_data['plants']),
+        vehicles=create_vehicles(case_data['vehicles']),
+        customers=create_customers(case_data['customers'], day_start=day_start),
+        travel_times=create_travel_times(case_data['travel_times'], case_data['plants'], case_data['customers'],
+                                         nearest),
+        seed=seed,
+        day_start=day_start,
+        **options
+    )
+
+
+def compact_result(scheduler, seed=None):
+    return {
+        "seed": seed,
+        "score": scheduler.score(),
+        "assigned_trips": [trip.to_dict(scheduler.day_start) for trip in scheduler.assigned_trips],
+        "failed_trips": [(request.order_id, err) for request, err in scheduler.failed_trips],
+        "metrics": scheduler.metrics,
+        "pruning": dict(scheduler.pruning_stats)
+    }
+
+
+def restart_worker(case_data, base_seed, first, step, restarts=None, deadline=None, options=None, prune=True,
+                   validate=False):
+    """
+    Выполняет рестарты с номерами first, first + step, ... пока не исчерпан лимит
+    рестартов или не наступил deadline (time.time()). Возвращает только лучший результат
+    и статистику. При prune=True рестарт прерывается, как только его оптимистичная оценка
+    хуже лучшего завершённого рестарта этого воркера. При validate=True план каждого
+    завершённого рестарта проверяется validation.py, число нарушений лучшего — в best["violations"].
+    """
+    best = None
+    stats = {"restarts": 0, "cut": 0, "time_saved": 0.0, "invalid": 0}
+    if validate:
+        # numpy нужен только для проверки планов
+        from validation import validate_scheduler, summarize
+    full_time = 0.0
+    full_runs = 0
+    cut_time = 0.0
+    i = first
+    # Объекты строятся один раз на воркер; между рестартами состояние откатывается через reset()
+    started = time.perf_counter()
+    scheduler = build_scheduler(case_data, **(options or {}))
+    if scheduler.instruments is not None:
+        scheduler.instruments.add_time("build_scheduler", time.perf_counter() - started)
+    while (restarts is None or i < restarts) and (deadline is None or time.time() < deadline):
+        scheduler.reset(seed=base_seed + i)
+        started = time.perf_counter()
+        scheduler.simulate(cutoff=best["score"] if prune and best is not None else None)
+        elapsed = time.perf_counter() - started
+        stats["restarts"] += 1
+        if scheduler.aborted:
+            stats["cut"] += 1
+            cut_time += elapsed
+        else:
+            full_time += elapsed
+            full_runs += 1
+            violations = None
+            if validate:
+                started = time.perf_counter()
+                violations = summarize(validate_scheduler(scheduler))
+                if scheduler.instruments is not None:
+                    scheduler.instruments.add_time("validate", time.perf_counter() - started)
+                stats["invalid"] += bool(violations)
+            if best is None or scheduler.score() > best["score"]:
+                best = compact_result(scheduler, seed=base_seed + i)
+                if violations is not None:
+                    best["violations"] = violations
+        i += step
+    # Экономия оценивается как среднее время полного рестарта минус фактическое время прерванных
+    if full_runs:
+        stats["time_saved"] = full_time / full_runs * stats["cut"] - cut_time
+    if scheduler.instruments is not None:
+        stats["instrumentation"] = scheduler.instruments.as_dict()
+    return best, stats
+
+
+def run_restarts(case_data, restarts=30, workers=1, seed=None, time_limit=None, improve_time=None, prune=True,
+                 validate=False, **options):
+    """
+    Параллельный мультистарт. Рестарт i использует сид seed + i, поэтому при фиксированных
+    seed и restarts результат не зависит от числа воркеров. Если задан time_limit (секунды),
+    рестарты выполняются до его истечения; restarts=None снимает ограничение на их число.
+    options передаются в build_scheduler (например, vectorized=True, scoring=BestCostStrategy()).
+    Если задан improve_time (секунды), лучший рестарт дополнительно улучшается локальным поиском.
+    prune=True прерывает рестарты, которые уже не могут обойти лучший (на результат не влияет).
+    validate=True проверяет план каждого завершённого рестарта (см. validation.py); планы с нарушениями
+    не отбрасываются, их число — в result["restarts_invalid"].
+    С options instrument=True замеры всех воркеров и локального поиска суммируются в result["instrumentation"].
+    """
+    if restarts is None and time_limit is None:
+        raise ValueError("Нужно задать restarts или time_limit")
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    workers = workers or os.cpu_count() or 1
+    if restarts is not None:
+        workers = max(1, min(workers, restarts))
+    deadline = time.time() + time_limit if time_limit is not None else None
+    instruments = Instrumentation() if options.get("instrument") else None
+    started = time.perf_counter()
+
+    if workers == 1:
+        outcomes = [restart_worker(case_data, seed, 0, 1, restarts, deadline, options, prune, validate)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(restart_worker, case_data, seed, k, workers, restarts, deadline, options, prune,
+                                   validate)
+                       for k in range(workers)]
+            outcomes = [f.result() for f in futures]
+    if instruments is not None:
+        instruments.add_time("restarts", time.perf_counter() - started)
+
     best_result = None
-    for _ in range(30):
-        # Создание объекта Scheduler и запуск симуляции
-        scheduler = Scheduler(plants=plants, vehicles=vehicles, customers=customers, travel_times=travel_times)
-        scheduler.simulate()
+    totals = {"restarts": 0, "cut": 0, "time_saved": 0.0, "invalid": 0}
+    for result, stats in outcomes:
+        for key in totals:
+            totals[key] += stats[key]
+        if instruments is not None:
+            instruments.merge(stats["instrumentation"])
+        if result is None:
+            continue
+        # При равенстве метрик предпочитаем меньший сид, чтобы выбор был детерминирован
+        if (best_result is None or result["score"] > best_result["score"]
+                or (result["score"] == best_result["score"] and result["seed"] < best_result["seed"])):
+            best_result = result
+    if best_result is not None and improve_time:
+        best_result = improve_result(case_data, best_result, improve_time, options, validate)
+        if instruments is not None:
+            instruments.merge(best_result["instrumentation"])
+    if best_result is not None:
+        if instruments is not None:
+            best_result["instrumentation"] = instruments.as_dict()
+        best_result["restarts"] = totals["restarts"]
+        best_result["restarts_cut"] = totals["cut"]
+        best_result["time_saved"] = round(totals["time_saved"], 3)
+        if validate:
+            best_result["restarts_invalid"] = totals["invalid"]
+    return best_result
+
+
+def improve_result(case_data, result, improve_time, options=None, validate=False):
+    """
+    Восстанавливает лучший рестарт по его сиду (симуляция детерминирована) и улучшает локальным поиском.
+    """
+    scheduler = build_scheduler(case_data, **(options or {}))
+    scheduler.reset(seed=result["seed"])
+    scheduler.simulate()
+    if scheduler.instruments is not None:
+        # В общие замеры идёт только сам локальный поиск: симуляция выше повторяет уже учтённый рестарт
+        scheduler.instruments = Instrumentation()
+        for plant in scheduler.plants.values():
+            plant.calendar.stats = scheduler.instruments
+    search = LocalSearch(scheduler, seed=result["seed"])
+    started = time.perf_counter()
+    search.run(time_limit=improve_time)
+    improved = compact_result(scheduler, seed=result["seed"])
+    improved["local_search"] = search.stats
+    if validate:
+        from validation import validate_scheduler, summarize
+        improved["violations"] = summarize(validate_scheduler(scheduler))
+    if scheduler.instruments is not None:
+        scheduler.instruments.add_time("local_search", time.perf_counter() - started)
+        improved["instrumentation"] = scheduler.instruments.as_dict()
+    return improved
+
+
+def results_path(path):
+    """
+    Файл результата по умолчанию: results.json в папке кейса или <кейс>.results.json рядом с файлом кейса.
+    """
+    if os.path.isdir(path):
+        return f'{path}/results.json'
+    return f'{os.path.splitext(path)[0]}.results.json'
+
+
+def instrumentation_path(output):
+    """
+    Файл замеров рядом с результатом: results.json -> instrumentation.json, <кейс>.results.json и
+    <кейс>.json (пакетный режим с общей папкой) -> <кейс>.instrumentation.json.
+    """
+    stem = os.path.splitext(output)[0]
+    if os.path.basename(stem) == 'results':
+        return os.path.join(os.path.dirname(stem), 'instrumentation.json')
+    stem = stem[:-len('.results')] if stem.endswith('.results') else stem
+    return f'{stem}.instrumentation.json'
 
-        if best_metric is None or scheduler.score() > best_metric:
-            best_metric = scheduler.score()
-            best_result = copy.deepcopy(scheduler)
 
-    with open(f'data/{case_name}/results.json', 'w', encoding='utf-8') as f:
+def write_results(best_result, output):
+    """
+    results.json (как раньше) или, если output оканчивается на .jsonl, компактные JSON-строки:
+    по строке на поездку ({"kind": "trip", ...}), несостоявшуюся заявку и метрики. Поездки
+    пишутся по одной, без сборки всего документа в памяти.
+    """
+    if output.endswith('.jsonl'):
+        with open(output, 'w', encoding='utf-8') as f:
+            for record in result_records(best_result):
+                f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+                f.write('\n')
+        return
+    with open(output, 'w', encoding='utf-8') as f:
         obj_to_dump = {
-            "assigned_trips": [trip.to_dict() for trip in best_result.assigned_trips],
-            "failed_trips": best_result.failed_trips,
-            "metrics": best_result.metrics
+            "assigned_trips": best_result["assigned_trips"],
+            "failed_trips": best_result["failed_trips"],
+            "metrics": best_result["metrics"]
         }
         json.dump(obj_to_dump, f, ensure_ascii=False, indent=4)
 
+
+def result_records(best_result):
+    yield {"kind": "metrics", "seed": best_result["seed"], **best_result["metrics"]}
+    for trip in best_result["assigned_trips"]:
+        yield {"kind": "trip", **trip}
+    for order_id, err in best_result["failed_trips"]:
+        yield {"kind": "failed", "order_id": order_id, "error": err}
+
+
+def read_results(path):
+    """
+    Читает результат любого из форматов write_results в виде словаря results.json.
+    """
+    if not path.endswith('.jsonl'):
+        return load_json_data(path)
+    result = {"assigned_trips": [], "failed_trips": [], "metrics": {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            kind = record.pop("kind")
+            if kind == "trip":
+                result["assigned_trips"].append(record)
+            elif kind == "failed":
+                result["failed_trips"].append([record["order_id"], record["error"]])
+            else:
+                record.pop("seed", None)
+                result["metrics"] = record
+    return result
+
+
+def run_case(path, output=None, restarts=30, workers=None, seed=None, time_limit=None, improve_time=None,
+             instrument=False, cache=False, horizon=False, decompose=None, **options):
+    """
+    Полный прогон одного кейса: чтение (через снимок, если cache), рестарты, запись результата
+    (по умолчанию results.json в папке кейса, замеры — рядом с ним, см. instrumentation_path).
+    С horizon=True заказы планируются по дням (horizon.plan_horizon), с decompose — по географическим
+    кластерам (decomposition.plan_decomposed; число кластеров, 0 — по числу заводов).
+    Возвращает лучший результат и строку сводки для пакетного режима.
+    """
+    started = time.perf_counter()
+    case_data = load_case(path, cache=cache)
+    load_time = time.perf_counter() - started
+
+    if instrument:
+        options["instrument"] = True
+    if horizon:
+        from horizon import plan_horizon
+        best_result = plan_horizon(case_data, restarts=restarts, workers=workers, seed=seed, time_limit=time_limit,
+                                   improve_time=improve_time, **options)
+    elif decompose is not None:
+        from decomposition import plan_decomposed
+        best_result = plan_decomposed(case_data, restarts=restarts, workers=workers, seed=seed,
+                                      time_limit=time_limit, improve_time=improve_time,
+                                      num_clusters=decompose or None, **options)
+    else:
+        best_result = run_restarts(case_data, restarts=restarts, workers=workers, seed=seed, time_limit=time_limit,
+                                   improve_time=improve_time, **options)
+    summary = {"case": os.path.basename(os.path.normpath(path)), "orders": sum(
+        len(customer.get('orders', [])) for customer in case_data['customers'])}
+    if best_result is None:
+        summary["time_s"] = round(time.perf_counter() - started, 3)
+        return None, summary
+
+    output = output or results_path(path)
+    write_results(best_result, output)
+    if instrument:
+        instruments = Instrumentation()
+        instruments.merge(best_result["instrumentation"])
+        instruments.add_time("load_case", load_time)
+        instruments.save(instrumentation_path(output))
+    summary.update({
+        "restarts": best_result["restarts"],
+        "cut": best_result["restarts_cut"],
+        "seed": best_result["seed"],
+        **best_result["metrics"],
+        "time_s": round(time.perf_counter() - started, 3),
+    })
+    if "violations" in best_result:
+        summary["violations"] = sum(best_result["violations"].values())
+    return best_result, summary
+
+
+def batch_case(path, output, run_options):
+    """
+    Задача пакетного режима для процесса пула: кейс считается в один поток, наружу — только сводка.
+    """
+    try:
+        return run_case(path, output=output, workers=1, **run_options)[1]
+    except Exception as err:
+        return {"case": os.path.basename(os.path.normpath(path)), "error": f"{type(err).__name__}: {err}"}
+
+
+def run_batch(paths, output_dir=None, workers=None, **run_options):
+    """
+    Пакетный режим: кейсы распределяются по пулу процессов (каждый кейс — в одном процессе).
+    Результаты пишутся в папки кейсов или в output_dir/<кейс>.json; там же сохраняется summary.json.
+    """
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    outputs = [os.path.join(output_dir, f"{os.path.basename(os.path.normpath(path))}.json") if output_dir else None
+               for path in paths]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(batch_case, path, output, run_options) for path, output in zip(paths, outputs)]
+        rows = [f.result() for f in futures]
+    if output_dir:
+        with open(os.path.join(output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=4)
+    return rows
+
+
+def print_summary(rows):
+    """
+    Сводная таблица по кейсам: столбцы — объединение ключей всех строк.
+    """
+    columns = []
+    for row in rows:
+        columns += [key for key in row if key not in columns]
+    table = [[str(row.get(column, "")) for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(line[i]) for line in table]) for i, column in enumerate(columns)]
+    for line in [columns] + table:
+        print("  ".join(value.ljust(width) for value, width in zip(line, widths)).rstrip())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Планирование доставки бетона по кейсам из data/")
+    parser.add_argument("cases", nargs="*",
+                        help="папки кейсов (путь или имя в data/); несколько — пакетный режим; "
+                             "без аргументов — запрос в консоли")
+    parser.add_argument("--seed", type=int, default=None, help="базовый сид рестартов")
+    parser.add_argument("--restarts", type=int, default=None,
+                        help="число рестартов (по умолчанию 30, а с --time-limit — без ограничения)")
+    parser.add_argument("--time-limit", type=float, default=None, help="бюджет времени на рестарты, секунды")
+    parser.add_argument("--improve-time", type=float, default=None, help="время локального поиска, секунды")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="число процессов (по умолчанию — число ядер): рестарты одного кейса или кейсы пакета")
+    parser.add_argument("--output", default=None,
+                        help="файл результата (один кейс) или папка для результатов и summary.json (пакет)")
+    parser.add_argument("--strategy", choices=list(STRATEGIES), default=None, help="стратегия выбора варианта")
+    parser.add_argument("--vectorized", action="store_true", help="пакетная оценка вариантов на NumPy")
+    parser.add_argument("--nearest", type=int, default=None, metavar="K",
+                        help="оценивать недостающее время пути по координатам для K ближайших заводов")
+    parser.add_argument("--no-prune", dest="prune", action="store_false", help="не прерывать проигрышные рестарты")
+    parser.add_argument("--horizon", action="store_true",
+                        help="планировать все дни заказов кейса (ночные смены, перенос заводов ТС между днями)")
+    parser.add_argument("--decompose", type=int, nargs="?", const=0, default=None, metavar="CLUSTERS",
+                        help="решать географические кластеры в отдельных процессах (без числа — по числу заводов)")
+    parser.add_argument("--validate", action="store_true", help="проверять план каждого рестарта (validation.py)")
+    parser.add_argument("--cache", action="store_true",
+                        help="читать кейс через снимок в <кейс>/.cache/ (создаётся при первом запуске)")
+    parser.add_argument("--instrument", action="store_true", help="сохранить замеры в instrumentation.json")
+    parser.add_argument("--profile", action="store_true", help="вывести профиль cProfile")
+    args = parser.parse_args(argv)
+    if args.horizon and args.decompose is not None:
+        parser.error("--horizon и --decompose не совмещаются")
+    if args.restarts is None and args.time_limit is None:
+        args.restarts = 30
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    paths = [case_path(case) for case in args.cases] or [case_path(input("Введите название кейса: "))]
+    run_options = {"restarts": args.restarts, "seed": args.seed, "time_limit": args.time_limit,
+                   "improve_time": args.improve_time, "instrument": args.instrument, "prune": args.prune,
+                   "cache": args.cache, "validate": args.validate, "horizon": args.horizon,
+                   "decompose": args.decompose}
+    if args.strategy:
+        run_options["scoring"] = make_strategy(args.strategy)
+    if args.vectorized:
+        run_options["vectorized"] = True
+    if args.nearest:
+        run_options["nearest"] = args.nearest
+
+    if len(paths) > 1:
+        print_summary(run_batch(paths, output_dir=args.output, workers=args.workers, **run_options))
+        return
+
+    best_result, summary = run_case(paths[0], output=args.output, workers=args.workers, **run_options)
+    if best_result is None:
+        print("Не выполнено ни одного рестарта")
+        return
+
     # Вывод метрик симуляции
-    print("\nSimulation Metrics:")
-    for k, v in best_result.metrics.items():
+    print(f"\nRestarts: {best_result['restarts']} (cut early: {best_result['restarts_cut']}, "
+          f"time saved: {best_result['time_saved']} s), best seed: {best_result['seed']}, "
+          f"time: {summary['time_s']} s")
+    print("Simulation Metrics:")
+    for k, v in best_result["metrics"].items():
         print(f"{k}: {v}")
+    print("Candidates pruned per stage:", best_result["pruning"])
+    if "violations" in best_result:
+        print(f"Plan violations: {best_result['violations'] or 'none'} "
+              f"(restarts with violations: {best_result['restarts_invalid']})")
+    for day in best_result.get("days", []):
+        print(f"Day {day['date']}: trips {day['trips']}, seed {day['seed']}"
+              f"{', re-solved after previous day' if day['resolved'] else ''}")
+    for cluster in best_result.get("clusters", []):
+        print(f"Cluster {cluster['cluster']}: plants {cluster['plants']}, vehicles {cluster['vehicles']} "
+              f"(+{cluster['guests']} shared), orders {cluster['orders']}, solve {cluster['solve_s']} s")
+    if "reconciled_trips" in best_result:
+        print(f"Trips added by shared vehicles: {best_result['reconciled_trips']}")
+    if "local_search" in best_result:
+        print("Local search moves:", best_result["local_search"])
 
 
 if __name__ == "__main__":
-    profiler = cProfile.Profile()
-    profiler.enable()
-
-    main()
-
-    profiler.disable()  # Остановка профилирования
-    #profiler.print_stats(sort='time')  # Вывод результатов
+    if "--profile" in sys.argv:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        main()
+        profiler.disable()  # Остановка профилирования
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(30)
+    else:
+        main()
@@ -0,0 +1,75 @@
+# metrics.py
+
+
+class MetricsAccumulator:
+    """
+    Метрики расписания, которые обновляются при каждом назначении и откате поездки,
+    поэтому текущее значение (и score) доступно в любой момент симуляции:
+      undelivered   — недовезённый объём;
+      plan_delta    — суммарное отклонение прибытия от плана, минуты;
+      empty_run     — порожний пробег (возврат на завод), минуты;
+      late          — число поездок, прибывших позже плана;
+      idle          — простои ТС между первой и последней поездкой, минуты;
+      loading       — занятое время постов погрузки, минуты (для загрузки заводов).
+    """
+
+    def __init__(self, plants, vehicles, remaining, trips=()):
+        self.undelivered = sum(remaining.values())
+        self.plan_delta = 0
+        self.empty_run = 0
+        self.late = 0
+        self.loading = 0
+        self.capacity = sum(p.loading_capacity * (p.work_time_end - p.work_time_start) for p in plants)
+        # Расписания ТС могут быть непустыми изначально (уже подтверждённые поездки)
+        self.busy = {v.id: sum(tr.return_at - tr.start_at for tr in v.schedule) for v in vehicles}
+        self.vehicle_idle = {}
+        self.idle = 0
+        for vehicle in vehicles:
+            self.update_vehicle(vehicle)
+        # Уже загруженные поездки (trips) входят в расписания ТС и в remaining, остальные слагаемые учитываем здесь
+        loading_time = {p.id: p.loading_time for p in plants}
+        for trip in trips:
+            self.plan_delta += abs(trip.arrive_at - trip.plan_date_object)
+            self.empty_run += trip.return_at - trip.unload_at
+            self.late += trip.arrive_at > trip.plan_date_object
+            self.loading += loading_time[trip.plant_id]
+
+    def update_vehicle(self, vehicle):
+        schedule = vehicle.schedule
+        idle = schedule[-1].return_at - schedule[0].start_at - self.busy[vehicle.id] if schedule else 0
+        self.idle += idle - self.vehicle_idle.get(vehicle.id, 0)
+        self.vehicle_idle[vehicle.id] = idle
+
+    def add_trip(self, trip, vehicle, plant, sign=1):
+        """
+        Учитывает поездку (sign=1) или её снятие (sign=-1). Вызывается после изменения расписания ТС.
+        """
+        self.undelivered -= sign * trip.total
+        self.plan_delta += sign * abs(trip.arrive_at - trip.plan_date_object)
+        self.empty_run += sign * (trip.return_at - trip.unload_at)
+        self.late += sign * (trip.arrive_at > trip.plan_date_object)
+        self.loading += sign * plant.loading_time
+        self.add_block(trip, vehicle, sign)
+
+    def remove_trip(self, trip, vehicle, plant):
+        self.add_trip(trip, vehicle, plant, sign=-1)
+
+    def add_block(self, block, vehicle, sign=1):
+        self.busy[vehicle.id] += sign * (block.return_at - block.start_at)
+        self.update_vehicle(vehicle)
+
+    def change_volume(self, delta):
+        self.undelivered += delta
+
+    def score(self):
+        return -self.undelivered, -self.plan_delta
+
+    def as_dict(self):
+        return {
+            "Undelivered Volume": self.undelivered,
+            "Plan time delta": self.plan_delta,
+            "Vehicle idle time": self.idle,
+            "Empty run minutes": self.empty_run,
+            "Late arrivals": self.late,
+            "Plant utilization": round(self.loading / self.capacity, 4) if self.capacity else 0,
+        }
@@ -0,0 +1,72 @@
+# scoring.py
+
+import math
+
+# Слагаемые стоимости варианта поездки, все в целых числах и считаются за O(1):
+#   plan deviation — отклонение прибытия от плана, минуты;
+#   empty run — порожний пробег (возврат на завод), минуты;
+#   unused volume — недогруз ТС, м³ (чем меньше, тем лучше используется машина).
+COST_TERMS = ("plan deviation", "empty run", "unused volume")
+
+
+class UniformStrategy:
+    """
+    Равновероятный выбор среди допустимых вариантов (исходное поведение).
+    """
+    def pick(self, costs, rng):
+        probs = [1 / len(costs)**2 for _ in range(len(costs))]
+        return rng.choices(range(len(costs)), weights=probs)[0]
+
+
+class BestCostStrategy:
+    """
+    Детерминированно выбирает вариант с минимальной взвешенной суммой слагаемых;
+    при равенстве — первый в порядке перебора.
+    """
+    def __init__(self, weights=(1.0, 1.0, 1.0)):
+        self.weights = tuple(weights)
+
+    def weighted(self, cost):
+        return sum(w * c for w, c in zip(self.weights, cost))
+
+    def pick(self, costs, rng):
+        return min(range(len(costs)), key=lambda i: self.weighted(costs[i]))
+
+
+class SoftmaxStrategy(BestCostStrategy):
+    """
+    Случайный выбор с вероятностью exp(-(cost - min_cost) / temperature). При малой температуре
+    близок к BestCostStrategy, при большой — к равновероятному.
+    """
+    def __init__(self, temperature=10.0, weights=(1.0, 1.0, 1.0)):
+        super().__init__(weights)
+        self.temperature = temperature
+
+    def pick(self, costs, rng):
+        values = [self.weighted(cost) for cost in costs]
+        best = min(values)
+        probs = [math.exp(-(v - best) / self.temperature) for v in values]
+        return rng.choices(range(len(costs)), weights=probs)[0]
+
+
+class LexicographicStrategy:
+    """
+    Минимум по слагаемым в порядке COST_TERMS: сначала отклонение от плана, затем порожний
+    пробег, затем недогруз.
+    """
+    def pick(self, costs, rng):
+        return min(range(len(costs)), key=lambda i: tuple(costs[i]))
+
+
+STRATEGIES = {
+    "uniform": UniformStrategy,
+    "best": BestCostStrategy,
+    "softmax": SoftmaxStrategy,
+    "lexicographic": LexicographicStrategy,
+}
+
+
+def make_strategy(name, **params):
+    if name not in STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия выбора: {name}. Доступны: {', '.join(STRATEGIES)}")
+    return STRATEGIES[name](**params)
@@ -1,167 +1,799 @@
 # simulation.py
 
-import copy
 import random
+import time
+from collections import OrderedDict
 
-from classes import Plant, Vehicle, Customer, Order, Trip
+from classes import Plant, Vehicle, VehicleIndex, Customer, Order, Trip, planning_day
+from travel import TravelTimeMatrix
+from scoring import UniformStrategy
+from metrics import MetricsAccumulator
+from instrumentation import Instrumentation
+from events import EventQueue, VehicleBreakdown, PlantOutage, OrderChange, NewOrder
 
 
 class Scheduler:
-    def __init__(self, plants, vehicles, customers, travel_times):
-        self.travel_times = copy.deepcopy(travel_times)
-        self.customer_delivery_queue = []
+    def __init__(self, plants, vehicles, customers, travel_times, seed=None, events=None, return_slack=None,
+                 vectorized=False, day_start=None, scoring=None, existing_trips=None, reservations=None,
+                 instrument=False):
+        # Справочники только читаются, поэтому копии не нужны; матрица разделяется между планировщиками
+        # Словарь {(завод, адрес): минуты} переводится в матрицу; TravelTimeMatrix и EstimatedTravelTimes — как есть
+        if isinstance(travel_times, dict):
+            travel_times = TravelTimeMatrix.from_dict(travel_times)
+        self.travel_times = travel_times
+        # Заводы с известным временем пути до адреса (см. reachable_plants) и шаблоны времени поездок
+        # по заказам (см. trip_template). Оба держат времена пути, поэтому при оценке по координатам
+        # (EstimatedTravelTimes) это LRU-кэши того же размера, что и кэш оценок; с полной матрицей — без предела
+        self._cache_size = getattr(travel_times, "cache_size", None)
+        self._reachable = OrderedDict()
+        self._templates = OrderedDict()
+        # Полночь дня планирования: все времена внутри — минуты от неё
+        self.day_start = day_start or planning_day()
+        # Собственный генератор, чтобы рестарты в разных процессах были воспроизводимы
+        self.random = random.Random(seed)
+        # Стратегия выбора варианта поездки из допустимых (см. scoring.py)
+        self.scoring = scoring or UniformStrategy()
+        # Очередь событий: заявки на доставку (Trip без ТС) и внешние события из events.py
+        self.customer_delivery_queue = EventQueue()
+
+        # Счётчики и таймеры горячих путей (None — замеры выключены и ничего не стоят)
+        self.instruments = Instrumentation() if instrument else None
 
         self.plants = {}
         for plant in plants:
             self.plants[plant.id] = plant
+            plant.calendar.stats = self.instruments
 
         self.vehicles = {}
         for vehicle in vehicles:
             self.vehicles[vehicle.id] = vehicle
+        self.fleet = VehicleIndex(self.vehicles.values())
 
         self.orders = {}
         self.customers = {}
         for customer in customers:
             self.customers[customer.id] = customer
             for order in customer.orders:
-                self.orders[order.id] = copy.deepcopy(order)
-
+                self.orders[order.id] = order
+
+        # Объём заказов, заявки по которым не нашли вариантов (по заказам и всего), и число внешних событий в очереди
+        self.lost = {}
+        self.lost_volume = 0
+        self.pending_external = 0
+        self.aborted = False
+
+        # Изменяемое состояние прогона: заказанный и оставшийся объём. Сами заказы не меняются.
+        self.ordered = {order.id: order.total for order in self.orders.values()}
+        self.remaining = dict(self.ordered)
+        # Исходные статусы заказов: полностью довезённый заказ получает "done", при откате статус возвращается
+        self.statuses = {order.id: order.status for order in self.orders.values()}
+        # Уже подтверждённые поездки и брони постов погрузки — часть исходного состояния, reset их не снимает
+        existing_trips = list(existing_trips or [])
+        self.load_existing(existing_trips, reservations or [])
+        for order_id in self.orders:
+            self._update_status(order_id)
+        self.accumulator = MetricsAccumulator(self.plants.values(), self.vehicles.values(), self.remaining,
+                                              existing_trips)
+
+        last_unload = {}
+        for trip in existing_trips:
+            last_unload[trip.order_id] = max(last_unload.get(trip.order_id, trip.unload_at), trip.unload_at)
         for order in self.orders.values():
-            self.customer_delivery_queue.append(Trip(
-                order_id=order.id,
-                plant_id=None,
-                delivery_address_id=order.delivery_address_id,
-                vehicle_id=None,
-                confirm=False,
-                total=None,
-                start_at=None,
-                load_at=None,
-                arrive_at=order.first_order_datetime_delivery,
-                unload_at=None,
-                return_at=None,
-                status="new",
-                return_plant_id=None,
-                plan_date_start=None,
-                plan_date_object=None,
-                plan_date_done=None
-            ))
-
-        self.assigned_trips = []
+            arrive_at = order.first_order_datetime_delivery
+            if order.id in last_unload:
+                # Цепочка заявок продолжается после уже запланированных поездок заказа
+                arrive_at = max(arrive_at, last_unload[order.id] + order.time_interval_client)
+            self.add_event(self.new_request(order, arrive_at))
+        for event in events or []:
+            self.add_event(event)
+
+        # Допустимое превышение времени пути до завода возврата над ближайшим (None — без ограничения)
+        self.return_slack = return_slack
+        # Сколько вариантов (ТС, завод погрузки, завод возврата) отсёк каждый этап фильтрации
+        self.pruning_stats = self.new_pruning_stats()
+
+        self.assigned_trips = existing_trips
         self.failed_trips = []
         self.metrics = None
+        # Пакетная оценка вариантов на NumPy (numpy нужен только в этом режиме)
+        self.evaluator = None
+        if vectorized:
+            from vectorized import VectorizedEvaluator
+            self.evaluator = VectorizedEvaluator(self)
+        # Журнал изменений состояния для отката (snapshot/restore): пары (функция отката, аргумент)
+        self._trail = []
+        self._initial_state = self.snapshot()
+
+    def load_existing(self, trips, reservations):
+        """
+        Загрузка уже назначенных поездок (Trip с ТС и заводом) и броней постов (plant_id, start, end)
+        теми же операциями, что и при планировании. Погрузки идут по возрастанию начала: тогда первый
+        свободный пост всегда подходит, и допустимое расписание раскладывается по постам.
+        """
+        unknown_plants = {trip.plant_id for trip in trips} | {plant_id for plant_id, _, _ in reservations}
+        unknown_plants -= self.plants.keys()
+        if unknown_plants:
+            raise ValueError(f"Поездки или брони на заводах, которых нет в кейсе: {sorted(unknown_plants, key=str)}")
+        unknown_vehicles = {trip.vehicle_id for trip in trips} - self.vehicles.keys()
+        if unknown_vehicles:
+            raise ValueError(f"Поездки ТС, которых нет в кейсе: {sorted(unknown_vehicles, key=str)}")
+
+        loadings = [(trip.start_at, trip.start_at + self.plants[trip.plant_id].loading_time, trip.plant_id, trip)
+                    for trip in trips]
+        loadings += [(start, end, plant_id, ("reserved", i)) for i, (plant_id, start, end) in enumerate(reservations)]
+        for start, end, plant_id, key in sorted(loadings, key=lambda slot: (slot[0], slot[1])):
+            if isinstance(key, Trip):
+                self.plants[plant_id].reserve_loading_slot(key)
+            else:
+                self.plants[plant_id].reserve_slot(key, start, end)
+
+        for trip in sorted(trips, key=lambda tr: tr.start_at):
+            vehicle = self.vehicles[trip.vehicle_id]
+            if vehicle.schedule and vehicle.schedule[-1].return_at > trip.start_at:
+                raise ValueError(f"ТС {vehicle.id}: пересекаются поездки {vehicle.schedule[-1].id} и {trip.id}")
+            vehicle.assign_trip(trip)
+            if trip.order_id in self.remaining:
+                self.remaining[trip.order_id] -= trip.total
+        for vehicle_id in {trip.vehicle_id for trip in trips}:
+            self.fleet.update(self.vehicles[vehicle_id])
+
+    @staticmethod
+    def new_pruning_stats():
+        return dict.fromkeys(["trips", "candidates", "order_plants", "unreachable_plants", "vehicle_plants",
+                              "vehicle_specs", "time_window", "plant_slot", "return_plants", "vehicle_gaps",
+                              "evaluated"], 0)
+
+    def new_request(self, order, arrive_at):
+        return Trip(
+            order_id=order.id,
+            plant_id=None,
+            delivery_address_id=order.delivery_address_id,
+            vehicle_id=None,
+            confirm=False,
+            total=None,
+            start_at=None,
+            load_at=None,
+            arrive_at=arrive_at,
+            unload_at=None,
+            return_at=None,
+            status="new",
+            return_plant_id=None,
+            plan_date_start=None,
+            plan_date_object=None,
+            plan_date_done=None
+        )
+
+    def add_event(self, event):
+        if isinstance(event, Trip):
+            self.customer_delivery_queue.push(event.arrive_at, event)
+        else:
+            self.pending_external += 1
+            self.customer_delivery_queue.push(event.at, event)
+
+    def snapshot(self):
+        """
+        Дешёвый снимок состояния: длины журналов и копия очереди (без копирования поездок).
+        """
+        return len(self._trail), len(self.failed_trips), self.customer_delivery_queue.snapshot(), self.pending_external
+
+    def restore(self, state):
+        """
+        Откатывает изменения, сделанные после снимка state.
+        """
+        trail_len, failed_len, queue, self.pending_external = state
+        while len(self._trail) > trail_len:
+            undo, arg = self._trail.pop()
+            undo(arg)
+        del self.failed_trips[failed_len:]
+        self.customer_delivery_queue.restore(queue)
+        self.metrics = None
 
-    def get_trip_distance(self, trip):
-        return self.travel_times[(trip.plant_id, trip.delivery_address_id)] + self.travel_times[(trip.return_plant_id, trip.delivery_address_id)]
-
-    def simulate(self):
-        def get_first_trip(trips):
-            # get index of the trip with the earliest arrive_at
-            first_trip = None
-            res_index = None
-            for i, trip in enumerate(trips):
-                if not first_trip or trip.arrive_at < first_trip.arrive_at:
-                    first_trip = trip
-                    res_index = i
-            return res_index
-
+    def reset(self, seed=None):
+        """
+        Возвращает планировщик и общие объекты Plant/Vehicle в исходное состояние перед новым рестартом.
+        """
+        self.restore(self._initial_state)
+        self.random.seed(seed)
+        self.pruning_stats = self.new_pruning_stats()
+
+    def commit_trip(self, trip):
+        self._apply_trip(trip)
+        self._trail.append((self._remove_trip, trip))
+
+    def uncommit_trip(self, trip):
+        self._remove_trip(trip)
+        self._trail.append((self._apply_trip, trip))
+
+    def _apply_trip(self, trip):
+        plant, vehicle = self.plants[trip.plant_id], self.vehicles[trip.vehicle_id]
+        plant.reserve_loading_slot(trip)
+        vehicle.assign_trip(trip)
+        self._vehicle_changed(trip.vehicle_id)
+        self.remaining[trip.order_id] -= trip.total
+        self._update_status(trip.order_id)
+        self.accumulator.add_trip(trip, vehicle, plant)
+        self.assigned_trips.append(trip)
+
+    def _remove_trip(self, trip):
+        plant, vehicle = self.plants[trip.plant_id], self.vehicles[trip.vehicle_id]
+        plant.release_loading_slot(trip)
+        vehicle.unassign_trip(trip)
+        self._vehicle_changed(trip.vehicle_id)
+        self.remaining[trip.order_id] += trip.total
+        self._update_status(trip.order_id)
+        self.accumulator.remove_trip(trip, vehicle, plant)
+        if self.assigned_trips and self.assigned_trips[-1] is trip:
+            self.assigned_trips.pop()
+        else:
+            self.assigned_trips.remove(trip)
+
+    def _update_status(self, order_id):
+        order = self.orders[order_id]
+        if self.ordered[order_id] > 0 and self.remaining[order_id] <= 0:
+            order.status = "done"
+        else:
+            order.status = self.statuses[order_id]
+
+    def _vehicle_changed(self, vehicle_id):
+        self.fleet.update(self.vehicles[vehicle_id])
+        if self.evaluator is not None:
+            self.evaluator.dirty.add(vehicle_id)
+
+    def _set_volume(self, change):
+        order_id, ordered, remaining = change
+        self._trail.append((self._restore_volume, (order_id, self.ordered[order_id], self.remaining[order_id])))
+        self.accumulator.change_volume(remaining - self.remaining[order_id])
+        self.ordered[order_id] = ordered
+        self.remaining[order_id] = remaining
+        self._update_status(order_id)
+
+    def _restore_volume(self, change):
+        order_id, ordered, remaining = change
+        self.accumulator.change_volume(remaining - self.remaining[order_id])
+        self.ordered[order_id] = ordered
+        self.remaining[order_id] = remaining
+        self._update_status(order_id)
+
+    def _set_lost(self, change):
+        order_id, volume = change
+        self._trail.append((self._restore_lost, (order_id, self.lost.get(order_id, 0))))
+        self._restore_lost(change)
+
+    def _restore_lost(self, change):
+        order_id, volume = change
+        self.lost_volume += volume - self.lost.get(order_id, 0)
+        if volume:
+            self.lost[order_id] = volume
+        else:
+            self.lost.pop(order_id, None)
+
+    def _add_block(self, block):
+        self._apply_block(block)
+        self._trail.append((self._remove_block, block))
+
+    def _drop_block(self, block):
+        self._remove_block(block)
+        self._trail.append((self._apply_block, block))
+
+    def _apply_block(self, block):
+        vehicle = self.vehicles[block.vehicle_id]
+        vehicle.assign_trip(block)
+        self._vehicle_changed(block.vehicle_id)
+        self.accumulator.add_block(block, vehicle)
+
+    def _remove_block(self, block):
+        vehicle = self.vehicles[block.vehicle_id]
+        vehicle.unassign_trip(block)
+        self._vehicle_changed(block.vehicle_id)
+        self.accumulator.add_block(block, vehicle, sign=-1)
+
+    def _add_outage(self, outage):
+        plant = self.plants[outage.plant_id]
+        # Погрузки, которые снять нельзя (подтверждённые и уже начавшиеся), завершаются:
+        # простой занимает только свободные промежутки каждого поста
+        slot_ids = []
+        for bay in range(plant.calendar.capacity):
+            for start, end in plant.calendar.free_intervals(bay, outage.at, outage.until):
+                slot_id = ("outage", outage.at, bay, start)
+                plant.reserve_slot(slot_id, start, end, bay)
+                slot_ids.append(slot_id)
+        self._trail.append((self._remove_outage, (plant, slot_ids)))
+
+    def _remove_outage(self, change):
+        plant, slot_ids = change
+        for slot_id in slot_ids:
+            plant.calendar.release(slot_id)
+            del plant.loading_schedule[slot_id]
+
+    def optimistic_score(self):
+        """
+        Оптимистичная оценка итогового score: заказы с заявками в очереди считаются довезёнными
+        полностью, а отклонение от плана дальше не растёт. Объём заказов, по которым заявка уже
+        не нашла вариантов, в жадном проходе не восстанавливается. Если в очереди есть внешние
+        события (они могут вернуть объём), оценки нет — None.
+        """
+        if self.pending_external:
+            return None
+        return -self.lost_volume, -self.accumulator.plan_delta
+
+    def simulate(self, cutoff=None):
+        """
+        Обрабатывает очередь событий. Если задан cutoff (score лучшего завершённого рестарта),
+        симуляция прерывается, как только optimistic_score() становится хуже него; тогда aborted=True.
+        """
+        self.aborted = False
+        started = time.perf_counter() if self.instruments is not None else None
         while self.customer_delivery_queue:
-            new_trip = self.customer_delivery_queue.pop(get_first_trip(self.customer_delivery_queue))
-            new_trip, err = self.assign_trip(new_trip)
-            if not new_trip:
-                self.failed_trips.append((new_trip, err))
+            now, event = self.customer_delivery_queue.pop()
+            if isinstance(event, Trip):
+                self.handle_request(event)
+                if cutoff is not None:
+                    bound = self.optimistic_score()
+                    if bound is not None and bound < cutoff:
+                        self.aborted = True
+                        break
                 continue
+            self.pending_external -= 1
+            if isinstance(event, VehicleBreakdown):
+                self.handle_breakdown(event)
+            elif isinstance(event, PlantOutage):
+                self.handle_outage(event)
+            elif isinstance(event, OrderChange):
+                self.handle_order_change(event)
+            elif isinstance(event, NewOrder):
+                self.handle_new_order(event)
             else:
-                self.assigned_trips.append(new_trip)
-                order = self.orders[new_trip.order_id]
-                self.orders[new_trip.order_id].total -= new_trip.total
-                if self.orders[new_trip.order_id].total == 0:
-                    self.orders[new_trip.order_id].status = "done"
-                else:
-                    self.customer_delivery_queue.append(Trip(
-                        order_id=order.id,
-                        plant_id=None,
-                        delivery_address_id=order.delivery_address_id,
-                        vehicle_id=None,
-                        confirm=False,
-                        total=None,
-                        start_at=None,
-                        load_at=None,
-                        arrive_at=new_trip.unload_at + order.time_interval_client,
-                        unload_at=None,
-                        return_at=None,
-                        status="new",
-                        return_plant_id=None,
-                        plan_date_start=None,
-                        plan_date_object=None,
-                        plan_date_done=None
-
-                    ))
+                raise TypeError(f"Неизвестное событие: {event!r}")
 
+        if started is not None:
+            self.instruments.add_time("simulate", time.perf_counter() - started)
+            self.instruments.count("simulations")
+            self.instruments.count("simulations_aborted", self.aborted)
         self.calculate_metrics()
         return self.assigned_trips, self.failed_trips
 
-    def get_travel_time(self, start, end):
-        return self.travel_times[(start, end)]
+    def handle_request(self, request):
+        order = self.orders[request.order_id]
+        # Заказ мог быть уменьшен или отменён, пока заявка стояла в очереди
+        if self.remaining[order.id] <= 0:
+            return
+        if self.instruments is None:
+            new_trip, err = self.assign_trip(request)
+        else:
+            started = time.perf_counter()
+            new_trip, err = self.assign_trip(request)
+            self.instruments.add_time("assign_trip", time.perf_counter() - started)
+            self.instruments.count("requests_failed", not new_trip)
+        if not new_trip:
+            # Без времени пути до адреса ни от одного завода заказ не выполнить: причина отдельная,
+            # чтобы такие заказы было видно в failed_trips, а не среди обычных «нет вариантов»
+            if not self.reachable_plants(order.delivery_address_id):
+                err = "No travel times to delivery address"
+            # Сохраняем саму заявку, чтобы её можно было повторить (например, локальным поиском)
+            self.failed_trips.append((request, err))
+            self._set_lost((order.id, self.remaining[order.id]))
+        elif self.remaining[order.id] > 0:
+            self.add_event(self.new_request(order, new_trip.unload_at + order.time_interval_client))
+
+    def has_request(self, order_id):
+        return any(isinstance(event, Trip) and event.order_id == order_id for event in self.customer_delivery_queue)
+
+    def reopen_order(self, order_id, arrive_at):
+        """
+        Ставит новую заявку по заказу, у которого не осталось заявок в очереди
+        (заказ был выполнен или его цепочка заявок оборвалась).
+        """
+        if order_id in self.lost:
+            self._set_lost((order_id, 0))
+        self.add_event(self.new_request(self.orders[order_id], arrive_at))
+
+    @staticmethod
+    def is_frozen(trip, now):
+        """
+        Подтверждённые и уже начавшиеся к моменту now поездки перепланированию не подлежат.
+        """
+        return trip.confirm or trip.start_at < now
+
+    def dependent_trips(self, vehicle, trips, now):
+        """
+        Поездки ТС, которые нужно снять, чтобы снять trips и не разорвать цепочку заводов: следующая
+        поездка должна начинаться там, куда вернулась предыдущая оставшаяся. Расписание делится
+        замороженными поездками (и блоками поломок) на участки; на участке со снимаемыми поездками
+        снимаются и те, что больше не стыкуются с предыдущей. Если участок после этого не сходится
+        с замороженной поездкой в его конце, он не меняется вовсе.
+        """
+        removed, segment = [], []
+        position = vehicle.plant_start
+        for trip in vehicle.schedule + [None]:
+            if trip is not None and not self.is_frozen(trip, now):
+                segment.append(trip)
+                continue
+            if any(tr in trips for tr in segment):
+                dropped, current = [], position
+                for tr in segment:
+                    if tr in trips or (current is not None and tr.plant_id != current):
+                        dropped.append(tr)
+                    else:
+                        current = tr.return_plant_id
+                target = trip.plant_id if trip is not None else None
+                if target is None or current is None or current == target:
+                    removed += dropped
+            segment = []
+            if trip is not None:
+                position = trip.return_plant_id
+        return removed
+
+    def cancel_trips(self, trips, now, keep_order=None):
+        """
+        Снимает назначенные поездки (кроме замороженных) вместе с зависящими от них (dependent_trips)
+        и возвращает их объём в заказы с перепланированием. Заказ keep_order не перепланируется:
+        его заявку ставит вызывающий. Возвращает снятые поездки.
+        """
+        trips = {tr for tr in trips if not self.is_frozen(tr, now)}
+        removed = []
+        for vehicle_id in {tr.vehicle_id for tr in trips}:
+            removed += self.dependent_trips(self.vehicles[vehicle_id], trips, now)
+        for trip in sorted(removed, key=lambda tr: tr.arrive_at):
+            self.uncommit_trip(trip)
+        for trip in sorted(removed, key=lambda tr: tr.arrive_at):
+            if trip.order_id != keep_order and not self.has_request(trip.order_id):
+                self.reopen_order(trip.order_id, max(trip.plan_date_object, now))
+        return removed
+
+    def handle_breakdown(self, event):
+        vehicle = self.vehicles[event.vehicle_id]
+        start = event.at
+        until = event.until if event.until is not None else vehicle.work_time_end
+        # Ремонт начинается, когда ТС вернётся из поездки, которая уже идёт
+        for trip in vehicle.schedule:
+            if trip.status != "breakdown" and trip.start_at < event.at < trip.return_at:
+                start = max(start, trip.return_at)
+        # Блоки прежних поломок, которые пересекаются с этой или примыкают к ней, объединяются с ней
+        for block in [tr for tr in vehicle.schedule if tr.status == "breakdown"
+                      and tr.start_at <= until and tr.return_at >= start]:
+            start, until = min(start, block.start_at), max(until, block.return_at)
+            self._drop_block(block)
+        # Замороженные поездки внутри ремонта остаются: блок занимает промежутки между ними
+        frozen = sorted((tr for tr in vehicle.schedule if self.is_frozen(tr, event.at)
+                         and tr.start_at < until and tr.return_at > start), key=lambda tr: tr.start_at)
+        gaps, cursor = [], start
+        for trip in frozen:
+            if trip.start_at > cursor:
+                gaps.append((cursor, trip.start_at))
+            cursor = max(cursor, trip.return_at)
+        if cursor < until:
+            gaps.append((cursor, until))
+        for gap_start, gap_end in gaps:
+            block = Trip(
+                order_id=None, plant_id=None, delivery_address_id=None, vehicle_id=vehicle.id,
+                confirm=True, total=0, start_at=gap_start, load_at=gap_start, arrive_at=gap_start,
+                unload_at=gap_end, return_at=gap_end, status="breakdown", return_plant_id=None,
+                plan_date_start=None, plan_date_object=None, plan_date_done=None
+            )
+            block.id = ("breakdown", vehicle.id, gap_start)
+            self._add_block(block)
+        # Поездки, которые ещё не начались к моменту поломки, передаются другим ТС. Блоки уже в расписании,
+        # поэтому поездки после ремонта не снимаются из-за цепочки заводов: после ремонта ТС может быть где угодно
+        self.cancel_trips([tr for tr in vehicle.schedule
+                           if tr.status != "breakdown" and tr.start_at >= event.at and tr.start_at < until],
+                          event.at)
+
+    def handle_outage(self, event):
+        plant = self.plants[event.plant_id]
+        self.cancel_trips([tr for tr in self.assigned_trips
+                           if tr.plant_id == plant.id and tr.start_at < event.until
+                           and tr.start_at + plant.loading_time > event.at],
+                          event.at)
+        self._add_outage(event)
+
+    def handle_order_change(self, event):
+        order_id = event.order_id
+        # При уменьшении заказа снимаются лишние поездки с конца цепочки, пока они не заморожены
+        trips = sorted((tr for tr in self.assigned_trips if tr.order_id == order_id), key=lambda tr: tr.arrive_at)
+        planned = self.ordered[order_id] - self.remaining[order_id]
+        excess = []
+        while trips and not self.is_frozen(trips[-1], event.at) and planned - trips[-1].total >= event.total:
+            planned -= trips[-1].total
+            excess.append(trips.pop())
+        self.cancel_trips(excess, event.at, keep_order=order_id)
+        planned = self.ordered[order_id] - self.remaining[order_id]
+        self._set_volume((order_id, event.total, max(0, event.total - planned)))
+        if order_id in self.lost:
+            self._set_lost((order_id, 0))
+        if self.remaining[order_id] > 0 and not self.has_request(order_id):
+            trips = [tr for tr in self.assigned_trips if tr.order_id == order_id]
+            if trips:
+                last = max(trips, key=lambda tr: tr.unload_at)
+                arrive_at = last.unload_at + self.orders[order_id].time_interval_client
+            else:
+                arrive_at = self.orders[order_id].first_order_datetime_delivery
+            self.reopen_order(order_id, max(arrive_at, event.at))
+
+    def handle_new_order(self, event):
+        order = event.order
+        if order.id in self.orders:
+            raise ValueError(f"Заказ {order.id} уже есть в плане")
+        self._add_order(order)
+        self.reopen_order(order.id, max(order.first_order_datetime_delivery, event.at))
+
+    def _add_order(self, order):
+        self.orders[order.id] = order
+        self.ordered[order.id] = order.total
+        self.remaining[order.id] = order.total
+        self.statuses[order.id] = order.status
+        self.accumulator.change_volume(order.total)
+        self._trail.append((self._remove_order, order))
+
+    def _remove_order(self, order):
+        self.accumulator.change_volume(-self.remaining.pop(order.id))
+        del self.ordered[order.id]
+        del self.orders[order.id]
+        order.status = self.statuses.pop(order.id)
+        self._templates.pop(order.id, None)
+
+    def apply_event(self, event):
+        """
+        Живой режим: применяет событие к уже построенному плану. Обрабатываются только само событие
+        и заявки, которые оно поставило в очередь (снятые поездки, новый или увеличенный заказ),
+        остальной план не пересчитывается. Возвращает изменения плана и время обработки.
+        """
+        started = time.perf_counter()
+        trail_len, failed_len = len(self._trail), len(self.failed_trips)
+        self.add_event(event)
+        self.simulate()
+        added, removed = [], []
+        for undo, arg in self._trail[trail_len:]:
+            if undo == self._remove_trip:
+                added.append(arg)
+            elif undo == self._apply_trip:
+                removed.append(arg)
+        return {
+            "added": added,
+            "removed": removed,
+            "failed": self.failed_trips[failed_len:],
+            "latency_ms": (time.perf_counter() - started) * 1000,
+        }
 
-    def get_best_trip(self, trips):
-        travel_times = [self.get_trip_distance(trip) for trip in trips]
-        # randomly choose one of the best trips based on the minimum travel time (using probs)
-        probs = [1 / len(travel_times)**2 for _ in range(len(travel_times))]
-        best_trip = random.choices(trips, weights=probs)[0]
-        return best_trip
+    def new_order(self, order, at):
+        return self.apply_event(NewOrder(order, at))
 
-    def assign_trip(self, trip):
-        suitable_trips = []
+    def cancel_order(self, order_id, at):
+        return self.apply_event(OrderChange(order_id, at, 0))
 
-        trip_variant = copy.deepcopy(trip)
-        for v_id, vehicle in self.vehicles.items():
-            for pto_id, plant_from in self.plants.items():
-                for pfr_id, plant_to in self.plants.items():
-                    trip_variant.plant_id = plant_from.id
-                    trip_variant.arrive_at = trip.arrive_at
-                    trip_variant.vehicle_id = vehicle.id
-                    trip_variant.return_plant_id = plant_to.id
-                    trip_variant.total = min(vehicle.volume, self.orders[trip.order_id].total)
+    def change_volume(self, order_id, at, total):
+        return self.apply_event(OrderChange(order_id, at, total))
 
-                    trip_variant.load_at = trip_variant.arrive_at - self.get_travel_time(start=plant_from.id, end=self.orders[trip.order_id].delivery_address_id)
-                    trip_variant.start_at = trip_variant.load_at - self.plants[plant_from.id].loading_time
-                    trip_variant.unload_at = trip_variant.arrive_at + self.orders[trip.order_id].time_unloading
-                    trip_variant.return_at = trip_variant.unload_at + self.get_travel_time(start=self.orders[trip.order_id].delivery_address_id, end=plant_to.id)
-                    trip_variant.plan_date_object = trip_variant.arrive_at
+    def vehicle_unavailable(self, vehicle_id, at, until=None):
+        return self.apply_event(VehicleBreakdown(vehicle_id, at, until))
 
-                    plant_slot_variant = plant_from.get_first_available_slot(trip_variant.start_at)
-                    if plant_slot_variant is None:
-                        continue
+    def get_travel_time(self, start, end):
+        # Матрица задана как (завод, клиент) и считается симметричной: обратный путь ищется по тому же ключу
+        return self.travel_times.get(start, end)
+
+    def pick_index(self, costs):
+        return self.scoring.pick(costs, self.random)
+
+    def trip_costs(self, trip):
+        """
+        Слагаемые стоимости варианта в порядке scoring.COST_TERMS.
+        """
+        return (abs(trip.arrive_at - trip.plan_date_object),
+                self.get_travel_time(start=trip.return_plant_id, end=trip.delivery_address_id),
+                self.vehicles[trip.vehicle_id].volume - trip.total)
+
+    def get_best_trip(self, trips):
+        return trips[self.pick_index([self.trip_costs(trip) for trip in trips])]
+
+    def trip_template(self, order):
+        """
+        Шаблон времени поездок заказа — смещения от времени прибытия к клиенту, которые не зависят
+        от ТС и сдвига по слоту погрузки: (loads, unload, returns), где loads — {завод погрузки:
+        (завод, начало погрузки, конец погрузки)}, unload — конец разгрузки, returns — {завод возврата:
+        (завод, возвращение)} в порядке return_plants. Для пары заводов шаблон поездки — loads[from]
+        и returns[to]. Считается один раз на заказ за время жизни планировщика (рестарты его не сбрасывают),
+        если не вытеснен из кэша (см. _cache).
+        """
+        template = self._cached(self._templates, order.id)
+        if template is not None:
+            if self.instruments is not None:
+                self.instruments.count("trip_template_hits")
+            return template
+        if self.instruments is not None:
+            self.instruments.count("trip_template_misses")
+        address = order.delivery_address_id
+        loads = {}
+        for plant in self.reachable_plants(address):
+            if not order.plants or plant.id in order.plants:
+                go = self.get_travel_time(start=plant.id, end=address)
+                loads[plant.id] = (plant, -go - plant.loading_time, -go)
+        unload = order.time_unloading
+        returns = {plant.id: (plant, unload + self.get_travel_time(start=plant.id, end=address))
+                   for plant in self.return_plants(order)}
+        return self._cache(self._templates, order.id, (loads, unload, returns))
+
+    def make_trip_variant(self, trip, vehicle, plant_from, plant_to):
+        order = self.orders[trip.order_id]
+        loads, unload, returns = self.trip_template(order)
+        _, start_offset, load_offset = loads[plant_from.id]
+        arrive_at = trip.arrive_at
+        return Trip(
+            order_id=order.id,
+            plant_id=plant_from.id,
+            delivery_address_id=order.delivery_address_id,
+            vehicle_id=vehicle.id,
+            confirm=trip.confirm,
+            total=min(vehicle.volume, self.remaining[order.id]),
+            start_at=arrive_at + start_offset,
+            load_at=arrive_at + load_offset,
+            arrive_at=arrive_at,
+            unload_at=arrive_at + unload,
+            return_at=arrive_at + returns[plant_to.id][1],
+            status=trip.status,
+            return_plant_id=plant_to.id,
+            plan_date_start=trip.plan_date_start,
+            plan_date_object=trip.arrive_at,
+            plan_date_done=trip.plan_date_done
+        )
+
+    def vehicle_fits_order(self, vehicle, order):
+        """
+        Ограничения объекта: ТС с гидролотком, если он нужен, и не больше осей, чем допускает клиент.
+        """
+        if order.gidrolotok and not vehicle.gidrolotok:
+            return False
+        return order.axle is None or vehicle.axes <= order.axle
+
+    def count_order_plants(self, order):
+        """
+        Число заводов, на которых заказ разрешает грузиться (без учёта времени пути до адреса).
+        """
+        if not order.plants:
+            return len(self.plants)
+        return sum(1 for plant_id in set(order.plants) if plant_id in self.plants)
+
+    def reachable_plants(self, address_id):
+        """
+        Заводы, для которых известно (или оценено) время пути до адреса, в порядке self.plants.
+        """
+        plants = self._cached(self._reachable, address_id)
+        if plants is None:
+            plants = self._cache(self._reachable, address_id,
+                                 [p for p in self.plants.values() if (p.id, address_id) in self.travel_times])
+        return plants
+
+    def _cached(self, cache, key):
+        value = cache.get(key)
+        if value is not None and self._cache_size is not None:
+            cache.move_to_end(key)
+        return value
+
+    def _cache(self, cache, key, value):
+        """
+        Кладёт значение в кэш reachable_plants или trip_template; сверх _cache_size вытесняется
+        давно не использованное.
+        """
+        cache[key] = value
+        if self._cache_size is not None and len(cache) > self._cache_size:
+            cache.popitem(last=False)
+        return value
+
+    def return_plants(self, order):
+        """
+        Заводы возврата, отсортированные по времени пути от клиента; при заданном return_slack
+        отбрасываются заводы, которые дальше ближайшего больше чем на return_slack.
+        """
+        plants = sorted(self.reachable_plants(order.delivery_address_id),
+                        key=lambda p: self.get_travel_time(start=p.id, end=order.delivery_address_id))
+        if self.return_slack is None or not plants:
+            return plants
+        limit = self.get_travel_time(start=plants[0].id, end=order.delivery_address_id) + self.return_slack
+        return [p for p in plants if self.get_travel_time(start=p.id, end=order.delivery_address_id) <= limit]
+
+    def suitable_trips(self, trip, vehicle_ids=None, plant_ids=None, stats=None):
+        """
+        Все допустимые варианты выполнения заявки trip. vehicle_ids и plant_ids дополнительно
+        ограничивают ТС и заводы погрузки (используется локальным поиском).
+        """
+        suitable_trips = []
+        order = self.orders[trip.order_id]
+        stats = self.pruning_stats if stats is None else stats
+        evaluated = stats["evaluated"]
+        n_plants = len(self.plants)
+        stats["trips"] += 1
+        stats["candidates"] += len(self.vehicles) * n_plants * n_plants
+
+        # Варианты поездки считаются как шаблон заказа плюс сдвиг по слоту погрузки
+        loads, unload, returns = self.trip_template(order)
+        # Заводы, запрещённые заказом, и разрешённые, но без времени пути до адреса, считаются отдельно
+        allowed = self.count_order_plants(order)
+        stats["order_plants"] += len(self.vehicles) * (n_plants - allowed) * n_plants
+        stats["unreachable_plants"] += len(self.vehicles) * (allowed - len(loads)) * n_plants
+        loading_plants = loads.values()
+        if plant_ids is not None:
+            loading_plants = [load for load in loading_plants if load[0].id in plant_ids]
+        earliest_unload = trip.arrive_at + unload
+
+        for plant_from, start_offset, _ in loading_plants:
+            start_at = trip.arrive_at + start_offset
+            vehicles = self.fleet.vehicles_for_plant(plant_from.id)
+            if vehicle_ids is not None:
+                vehicles = [v for v in vehicles if v.id in vehicle_ids]
+            stats["vehicle_plants"] += (len(self.vehicles) - len(vehicles)) * n_plants
+            fitting = [v for v in vehicles if self.vehicle_fits_order(v, order)]
+            stats["vehicle_specs"] += (len(vehicles) - len(fitting)) * n_plants
+            # Быстрая проверка окна: даже без сдвига по слоту ТС должно успеть разгрузиться до конца смены
+            vehicles = [v for v in fitting if earliest_unload <= v.work_time_end]
+            stats["time_window"] += (len(fitting) - len(vehicles)) * n_plants
+            if not vehicles:
+                continue
 
-                    time_shift = plant_slot_variant - trip_variant.start_at
-                    trip_variant.shift(time_shift)
+            # Слот погрузки зависит только от завода, поэтому ищется один раз для всех ТС
+            plant_slot_variant = plant_from.get_first_available_slot(start_at)
+            if plant_slot_variant is None:
+                stats["plant_slot"] += len(vehicles) * n_plants
+                continue
+            time_shift = plant_slot_variant - start_at
+            stats["return_plants"] += len(vehicles) * (n_plants - len(returns))
+            if not returns:
+                continue
+            arrive_at = trip.arrive_at + time_shift
+            unload_at = arrive_at + unload
+
+            # По индексу окон — только ТС, которые стоят на заводе погрузки и свободны хотя бы
+            # до ближайшего возврата; остальные Vehicle.is_free не проверяются
+            free = self.fleet.free_vehicles(plant_from.id, plant_slot_variant,
+                                            arrive_at + min(offset for _, offset in returns.values()))
+            gapped = [v for v in vehicles if v.id in free]
+            stats["vehicle_gaps"] += (len(vehicles) - len(gapped)) * len(returns)
+            stats["evaluated"] += len(gapped) * len(returns)
+
+            # Доступность ТС проверяется по времени из шаблона, поездка создаётся только для допустимых
+            for vehicle in gapped:
+                for plant_to, return_offset in returns.values():
+                    if vehicle.is_free(plant_slot_variant, unload_at, arrive_at + return_offset,
+                                       plant_from.id, plant_to.id):
+                        trip_variant = self.make_trip_variant(trip, vehicle, plant_from, plant_to)
+                        trip_variant.shift(time_shift)
+                        suitable_trips.append(trip_variant)
+
+        if self.instruments is not None:
+            self.observe_candidates(stats["evaluated"] - evaluated, len(suitable_trips))
+        return suitable_trips
+
+    def observe_candidates(self, evaluated, suitable):
+        """
+        Замер одной заявки: сколько вариантов дошло до проверки доступности ТС (остальные отсечены
+        фильтрами) и сколько из них допустимы.
+        """
+        candidates = len(self.vehicles) * len(self.plants) ** 2
+        self.instruments.count("availability_checks", evaluated)
+        self.instruments.observe("candidates_per_trip", evaluated)
+        self.instruments.observe("pruned_per_trip", candidates - evaluated)
+        self.instruments.observe("suitable_per_trip", suitable)
 
-                    if vehicle.is_available(trip_variant):
-                        suitable_trips.append(copy.deepcopy(trip_variant))
+    def assign_trip(self, trip):
+        if self.evaluator is not None:
+            return self.evaluator.assign_trip(trip)
+        suitable_trips = self.suitable_trips(trip)
 
         if not suitable_trips:
             return None, "No suitable trips"
 
         best_trip = self.get_best_trip(suitable_trips)
-
-        self.plants[best_trip.plant_id].reserve_loading_slot(best_trip)
-        self.vehicles[best_trip.vehicle_id].assign_trip(best_trip)
+        self.commit_trip(best_trip)
 
         return best_trip, None
 
     def calculate_metrics(self):
-        self.metrics = {
-            "Undelivered Volume": sum([order.total for order in self.orders.values()]),
-            "Plan time delta": sum(
-                                    abs((trip.arrive_at - trip.plan_date_object).total_seconds()) / 60
-                                    for trip in self.assigned_trips
-                                    if trip.arrive_at and trip.plan_date_object
-                                ),
-        }
+        # Метрики накапливаются при каждом назначении и откате, здесь только снимок
+        self.metrics = self.accumulator.as_dict()
         return self.metrics
 
     def score(self):
-        return -self.metrics["Undelivered Volume"], -self.metrics["Plan time delta"]
+        """
+        Текущая оценка расписания; доступна и в середине симуляции.
+        """
+        return self.accumulator.score()
 
 
 
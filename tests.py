@@ -81,6 +81,483 @@ def check_customer_unloadings(assigned_trips, order_to_customer_map):
 
     return customer_violations
 
+
+def test_loading_calendar_bays():
+    """
+    Checks first-fit over several loading bays, booking on the first free bay, release and the
+    Plant-level slot queries built on the calendar.
+    """
+    import pytest
+    from classes import LoadingCalendar, Plant
+    calendar = LoadingCalendar(2)
+    assert calendar.reserve("a", 0, 30) == 0
+    assert calendar.reserve("b", 10, 40) == 1
+    assert not calendar.is_free(20, 25)
+    assert calendar.first_fit(0, 15) == 30
+    assert calendar.reserve("c", 30, 60) == 0
+    assert calendar.first_fit(0, 20) == 40
+    with pytest.raises(ValueError):
+        calendar.reserve("d", 35, 45)
+    calendar.release("a")
+    assert calendar.first_fit(0, 20) == 0
+    assert calendar.first_fit(0, 40) == 40
+    assert calendar.free_intervals(0, 0, 90) == [(0, 30), (60, 90)]
+
+    plant = Plant(1, 0.0, 0.0, "06:00:00", "07:00:00", loading_capacity=1, loading_time=15)
+    plant.reserve_slot("x", 360, 375)
+    assert not plant.is_loading_slot_available(360, 375)
+    assert plant.is_loading_slot_available(375, 390)
+    assert plant.get_first_available_slot(350) == 375
+    assert plant.get_first_available_slot(410) is None
+
+
+def test_event_queue_keeps_insertion_order_on_ties():
+    """
+    Checks that events come out by time, events with equal times in the order they were pushed,
+    and that a restored snapshot replays the same order.
+    """
+    from events import EventQueue
+    queue = EventQueue()
+    for time, name in ((10, "b"), (5, "a"), (10, "c"), (5, "d"), (7, "e")):
+        queue.push(time, name)
+    state = queue.snapshot()
+    expected = [(5, "a"), (5, "d"), (7, "e"), (10, "b"), (10, "c")]
+    assert [queue.pop() for _ in range(len(queue))] == expected
+    assert not queue
+    queue.restore(state)
+    queue.push(5, "f")
+    assert [queue.pop() for _ in range(len(queue))] == expected[:2] + [(5, "f")] + expected[2:]
+
+
+def test_trip_minutes_round_trip():
+    """
+    Checks that times are whole minutes from the planning day: a night shift ends after 24 * 60,
+    and a trip (with an id requested for another time) survives to_dict / from_dict.
+    """
+    from datetime import datetime
+    from classes import Trip, work_window, datetime_minutes
+    day_start = datetime(2024, 3, 10)
+    assert work_window("08:00:00", "20:00:00") == (480, 1200)
+    assert work_window("20:00:00", "08:00:00") == (1200, 1920)
+    assert datetime_minutes("2024-03-11 01:30:00", day_start) == 1530
+    trip = Trip(order_id=7, plant_id=1, delivery_address_id=3, vehicle_id=2, confirm=True, total=8,
+                start_at=1400, load_at=1415, arrive_at=1460, unload_at=1490, return_at=1530, status="confirmed",
+                return_plant_id=1, plan_date_start=None, plan_date_object=1450, plan_date_done=None)
+    trip.id = (7, 1450)
+    data = trip.to_dict(day_start)
+    assert data["id"] == "7_2024-03-11 00:10:00" and data["return_at"] == "2024-03-11 01:30:00"
+    restored = Trip.from_dict(json.loads(json.dumps(data)), day_start)
+    assert restored.to_dict(day_start) == data
+    assert restored.id == trip.id
+    assert (restored.start_at, restored.return_at, restored.plan_date_object) == (1400, 1530, 1450)
+
+def small_case(seed):
+    """
+    Small seeded case (same data for the same seed) for the scheduler checks below.
+    """
+    from generate_test_data import generate_case
+    return generate_case(num_plants=4, num_vehicles=30, num_customers=25, num_orders=2, seed=seed)
+
+
+def plan_signature(assigned_trips):
+    """
+    Assignments in a comparable form: order, vehicle, plants and times of every trip.
+    """
+    return sorted((trip.order_id, trip.vehicle_id, trip.plant_id, trip.return_plant_id,
+                   trip.start_at, trip.arrive_at, trip.return_at, trip.total) for trip in assigned_trips)
+
+
+def test_vectorized_parity():
+    """
+    Checks that vectorized.py assigns the same trips and gives the same metrics as the scalar scheduler
+    for a fixed seed.
+    """
+    from main import build_scheduler
+    from scoring import BestCostStrategy
+    for seed in range(3):
+        case = small_case(seed)
+        for options in ({}, {"return_slack": 15}, {"scoring": BestCostStrategy()}):
+            scalar = build_scheduler(case, seed=seed, **options)
+            vectorized = build_scheduler(case, seed=seed, vectorized=True, **options)
+            scalar.simulate()
+            vectorized.simulate()
+            assert plan_signature(vectorized.assigned_trips) == plan_signature(scalar.assigned_trips), (seed, options)
+            assert vectorized.metrics == scalar.metrics, (seed, options)
+
+
+def test_pruning_keeps_best_result():
+    """
+    Checks that cutting restarts by their optimistic bound (prune=True) picks the same best restart,
+    trips and metrics as running every restart to the end, for a fixed seed (generated cases and
+    data/case_2_2_2).
+    """
+    import os
+    from main import run_restarts, load_case
+    cut = 0
+    cases = [(seed, small_case(seed)) for seed in range(3)]
+    cases.append((0, load_case(os.path.join(os.path.dirname(__file__), "data", "case_2_2_2"))))
+    for seed, case in cases:
+        pruned = run_restarts(case, restarts=12, workers=1, seed=seed, prune=True)
+        full = run_restarts(case, restarts=12, workers=1, seed=seed, prune=False)
+        for key in ("seed", "score", "assigned_trips", "failed_trips", "metrics"):
+            assert pruned[key] == full[key], (seed, key)
+        assert full["restarts_cut"] == 0
+        cut += pruned["restarts_cut"]
+    # Otherwise the check is vacuous: some restarts must actually be cut
+    assert cut > 0
+
+
+
+def test_restarts_do_not_depend_on_workers():
+    """
+    Checks that run_restarts with a fixed seed picks the same restart, trips and metrics on one worker
+    and on a process pool of two.
+    """
+    from main import run_restarts
+    case = small_case(1)
+    for prune in (False, True):
+        single = run_restarts(case, restarts=6, workers=1, seed=7, prune=prune)
+        pooled = run_restarts(case, restarts=6, workers=2, seed=7, prune=prune)
+        for key in ("seed", "score", "assigned_trips", "failed_trips", "metrics"):
+            assert pooled[key] == single[key], (prune, key)
+        assert pooled["restarts"] == single["restarts"] == 6
+
+
+def scheduler_state(scheduler):
+    """
+    Everything a restart can change: vehicle schedules and free gaps, plant bays, order volumes and
+    statuses, lost volume, metrics and the event queue.
+    """
+    return {
+        "vehicles": {v.id: [(tr.id, tr.plant_id, tr.start_at, tr.return_at, tr.return_plant_id, tr.status)
+                            for tr in v.schedule] for v in scheduler.vehicles.values()},
+        "gaps": {key: list(gaps) for key, gaps in scheduler.fleet.gaps.items() if gaps},
+        "bays": {p.id: (p.calendar.starts, p.calendar.ends, len(p.calendar)) for p in scheduler.plants.values()},
+        "ordered": dict(scheduler.ordered),
+        "remaining": dict(scheduler.remaining),
+        "statuses": {order.id: order.status for order in scheduler.orders.values()},
+        "lost": dict(scheduler.lost),
+        "metrics": scheduler.accumulator.as_dict(),
+        "trips": (len(scheduler.assigned_trips), len(scheduler.failed_trips)),
+        "queue": len(scheduler.customer_delivery_queue),
+    }
+
+
+def test_reset_returns_to_initial_state():
+    """
+    Checks that restore rolls back a simulation and events to the snapshot exactly, and that reset
+    returns a finished restart to the initial state, so the next restart with the same seed repeats it.
+    """
+    import copy
+    from main import build_scheduler
+    from events import PlantOutage
+    scheduler = build_scheduler(small_case(2), seed=2)
+    initial = copy.deepcopy(scheduler_state(scheduler))
+    scheduler.simulate()
+    planned = copy.deepcopy(scheduler_state(scheduler))
+    state = scheduler.snapshot()
+    trip = scheduler.assigned_trips[10]
+    scheduler.cancel_order(trip.order_id, trip.start_at - 1)
+    scheduler.vehicle_unavailable(scheduler.assigned_trips[3].vehicle_id, trip.start_at, trip.start_at + 240)
+    scheduler.apply_event(PlantOutage(trip.plant_id, trip.start_at - 30, trip.start_at + 90))
+    assert scheduler_state(scheduler) != planned
+    scheduler.restore(state)
+    assert scheduler_state(scheduler) == planned
+
+    scheduler.reset(seed=2)
+    assert scheduler_state(scheduler) == initial
+    scheduler.simulate()
+    assert scheduler_state(scheduler) == planned
+
+
+def recounted_metrics(scheduler):
+    """
+    Metrics of the scheduler's current plan counted from scratch instead of the running accumulator.
+    """
+    from metrics import MetricsAccumulator
+    trips = [tr for v in scheduler.vehicles.values() for tr in v.schedule if tr.status != "breakdown"]
+    return MetricsAccumulator(scheduler.plants.values(), scheduler.vehicles.values(), scheduler.remaining,
+                              trips).as_dict()
+
+
+def test_running_metrics_match_recount():
+    """
+    Checks that the running metrics equal metrics recounted from the plan after a simulation, after
+    order changes, breakdowns and plant outages, and after rolling them back.
+    """
+    import random
+    from main import build_scheduler
+    from events import PlantOutage
+    rng = random.Random(3)
+    for seed in range(2):
+        scheduler = build_scheduler(small_case(seed), seed=seed)
+        scheduler.simulate()
+        assert scheduler.calculate_metrics() == recounted_metrics(scheduler), seed
+        state = scheduler.snapshot()
+        for trip in rng.sample(scheduler.assigned_trips, 6):
+            scheduler.change_volume(trip.order_id, trip.start_at - 1, scheduler.ordered[trip.order_id] // 2)
+            scheduler.vehicle_unavailable(trip.vehicle_id, trip.start_at + 5, trip.start_at + 180)
+            scheduler.apply_event(PlantOutage(trip.plant_id, trip.start_at - 20, trip.start_at + 60))
+            assert scheduler.calculate_metrics() == recounted_metrics(scheduler), (seed, trip.id)
+        scheduler.restore(state)
+        assert scheduler.calculate_metrics() == recounted_metrics(scheduler), seed
+
+def plan_violations(scheduler):
+    """
+    validation.py violations of the scheduler's plan, except overlapping unloadings of different
+    orders at one address (the scheduler does not prevent them yet).
+    """
+    from validation import validate_scheduler
+    violations = validate_scheduler(scheduler)
+    violations.pop("customer_overlap", None)
+    return violations
+
+
+def test_outage_over_frozen_loading():
+    """
+    Checks that a plant outage starting during a loading that is already in progress keeps that trip
+    and blocks only the free time of the plant's bays.
+    """
+    from main import build_scheduler
+    from events import PlantOutage
+    scheduler = build_scheduler(small_case(0), seed=0)
+    scheduler.simulate()
+    trip = scheduler.assigned_trips[5]
+    plant = scheduler.plants[trip.plant_id]
+    at, until = trip.start_at + 1, trip.start_at + 120
+    scheduler.apply_event(PlantOutage(plant.id, at, until))
+    assert trip in scheduler.assigned_trips
+    assert not plan_violations(scheduler)
+    # Only loadings that were already frozen at the outage start overlap it
+    assert all(scheduler.is_frozen(tr, at) for tr in scheduler.assigned_trips
+               if tr.plant_id == plant.id and tr.start_at < until and tr.start_at + plant.loading_time > at)
+    assert plant.get_first_available_slot(at) >= until
+
+
+def test_cancellations_keep_plant_chain():
+    """
+    Checks that cancelling or reducing an order (and a plant outage) leaves a consistent plan: the
+    vehicles' next trips still start at the plant where the previous remaining trip returned.
+    """
+    import random
+    from main import build_scheduler
+    from events import PlantOutage
+    rng = random.Random(5)
+    for seed in range(2):
+        scheduler = build_scheduler(small_case(seed), seed=seed)
+        scheduler.simulate()
+        for trip in rng.sample(scheduler.assigned_trips, 8):
+            for apply in (lambda: scheduler.cancel_order(trip.order_id, trip.start_at - 1),
+                          lambda: scheduler.change_volume(trip.order_id, trip.start_at - 1,
+                                                          scheduler.ordered[trip.order_id] // 2),
+                          lambda: scheduler.apply_event(PlantOutage(trip.plant_id, trip.start_at - 10,
+                                                                    trip.start_at + 60))):
+                state = scheduler.snapshot()
+                apply()
+                assert not plan_violations(scheduler), (seed, trip.id)
+                scheduler.restore(state)
+
+
+def test_breakdown_blocks_do_not_overlap():
+    """
+    Checks that a breakdown during a trip in progress, followed by a second overlapping breakdown,
+    gives one repair block that starts after the trip returns and no overlapping vehicle trips.
+    """
+    from main import build_scheduler
+    scheduler = build_scheduler(small_case(0), seed=0)
+    scheduler.simulate()
+    trip = scheduler.assigned_trips[3]
+    vehicle = scheduler.vehicles[trip.vehicle_id]
+    scheduler.vehicle_unavailable(vehicle.id, trip.start_at + 5, trip.start_at + 200)
+    scheduler.vehicle_unavailable(vehicle.id, trip.start_at + 100, trip.start_at + 300)
+    blocks = [tr for tr in vehicle.schedule if tr.status == "breakdown"]
+    assert len(blocks) == 1
+    assert blocks[0].start_at == trip.return_at and blocks[0].return_at == trip.start_at + 300
+    assert not plan_violations(scheduler)
+
+
+
+def test_existing_schedule_loads():
+    """
+    Checks that an unordered occupied day loads with every trip on its vehicle, and that a reservation
+    on a plant missing from the case is rejected with a ValueError.
+    """
+    import pytest
+    from benchmark import occupied_schedule
+    from classes import planning_day
+    from main import build_scheduler
+    case, day_start = small_case(0), planning_day()
+    schedule = occupied_schedule(case, 0.7, 0, day_start)
+    scheduler = build_scheduler(dict(case, schedule=schedule), day_start=day_start)
+    assert sum(len(v.schedule) for v in scheduler.vehicles.values()) == len(schedule['trips'])
+    trip = schedule['trips'][0]
+    reservation = {"plant_id": "missing", "start": trip['start_at'], "end": trip['load_at']}
+    with pytest.raises(ValueError):
+        build_scheduler(dict(case, schedule=dict(schedule, reservations=[reservation])), day_start=day_start)
+
+
+def save_string_id_case(path):
+    """
+    Writes small_case(0) to the folder path with string plant ("P1") and address ("A1") ids.
+    """
+    from generate_test_data import save_case
+    save_case(small_case(0), str(path))
+    for name, rename in (("plants.json", lambda p: p.update(id=f"P{p['id']}")),
+                         ("vehicles.json", lambda v: v.update(plants=[f"P{i}" for i in v['plants']],
+                                                              plant_start=f"P{v['plant_start']}")),
+                         ("travel_times.json", lambda t: t.update(plant_id=f"P{t['plant_id']}",
+                                                                  customer_id=f"A{t['customer_id']}"))):
+        records = json.loads((path / name).read_text())
+        for record in records:
+            rename(record)
+        (path / name).write_text(json.dumps(records))
+    customers = json.loads((path / "customers.json").read_text())
+    for customer in customers:
+        customer['delivery_address_id'] = f"A{customer['delivery_address_id']}"
+        for order in customer['orders']:
+            order['plants'] = [f"P{i}" for i in order['plants']]
+            order['delivery_address_id'] = customer['delivery_address_id']
+    (path / "customers.json").write_text(json.dumps(customers))
+
+
+def test_binary_formats_keep_string_ids(tmp_path):
+    """
+    Checks that a case with string plant and address ids plans the same when read from JSON, from
+    the cached snapshot, from a single-file case and with travel_times.bin, and that the cache leaves
+    no temporary file behind.
+    """
+    import os
+    from case_file import save_case_file
+    from case_cache import CachedCase
+    from main import load_case, build_scheduler
+    from travel import convert_json
+    save_string_id_case(tmp_path)
+    case_data = load_case(str(tmp_path))
+    save_case_file(case_data, str(tmp_path / "case.bin"))
+
+    sources = [case_data, load_case(str(tmp_path), cache=True), load_case(str(tmp_path), cache=True),
+               load_case(str(tmp_path / "case.bin"))]
+    assert isinstance(sources[2], CachedCase)
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path / ".cache"))
+    convert_json(str(tmp_path / "travel_times.json"), str(tmp_path / "travel_times.bin"))
+    sources.append(load_case(str(tmp_path)))
+
+    signatures = []
+    for data in sources:
+        scheduler = build_scheduler(data, seed=0)
+        scheduler.simulate()
+        signatures.append(plan_signature(scheduler.assigned_trips))
+    assert signatures[0] and all(signature == signatures[0] for signature in signatures)
+
+
+def test_horizon_counts_spilled_trips_once():
+    """
+    Checks that trips running past midnight are counted in the horizon metrics once: the merged
+    metrics match the ones recomputed from the merged trips.
+    """
+    from classes import Trip, planning_day
+    from generate_test_data import generate_case
+    from horizon import plan_horizon
+    case = generate_case(num_plants=6, num_vehicles=40, num_customers=40, num_orders=3, num_days=3, seed=5)
+    # Round-the-clock plants, every third vehicle on a night shift and half of the orders at night
+    for plant in case['plants']:
+        plant.update(work_time_start="00:00:00", work_time_end="00:00:00")
+    for vehicle in case['vehicles'][::3]:
+        vehicle.update(work_time_start="18:00:00", work_time_end="06:00:00")
+    for customer in case['customers'][::2]:
+        for order in customer['orders']:
+            hours, rest = order['first_order_time_delivery'].split(":", 1)
+            order['first_order_time_delivery'] = f"{(int(hours) + 12) % 24:02d}:{rest}"
+    for workers in (1, 2):
+        result = plan_horizon(case, restarts=2, workers=workers, seed=0)
+        trips = [Trip.from_dict(data, planning_day()) for data in result["assigned_trips"]]
+        assert any(trip.start_at // (24 * 60) != trip.return_at // (24 * 60) for trip in trips)
+        assert len({trip["id"] for trip in result["assigned_trips"]}) == len(trips)
+        assert result["metrics"]["Empty run minutes"] == sum(trip.return_at - trip.unload_at for trip in trips)
+        assert result["metrics"]["Late arrivals"] == sum(trip.arrive_at > trip.plan_date_object for trip in trips)
+
+
+def test_estimated_travel_caches_are_bounded():
+    """
+    Checks that with estimated travel times the per-address and per-order caches stay within the
+    estimator's cache size without changing the plan, and that orders for an address with neither
+    coordinates nor known times fail with their own reason.
+    """
+    import random
+    from main import build_scheduler
+    from travel import TravelTimeMatrix
+    case = small_case(0)
+    lost = case['customers'][0]
+    lost.update(latitude=None, longitude=None)
+    matrix, rng = case['travel_times'], random.Random(1)
+    case['travel_times'] = TravelTimeMatrix.from_entries([
+        {"plant_id": p, "customer_id": a, "travel_time_minutes": matrix[p, a]}
+        for p in matrix.plant_ids for a in matrix.address_ids
+        if a != lost['delivery_address_id'] and (p, a) in matrix and rng.random() < 0.4])
+
+    signatures = []
+    for cache_size in (None, 2):
+        scheduler = build_scheduler(case, seed=0, nearest=3)
+        if cache_size:
+            scheduler._cache_size = scheduler.travel_times.cache_size = cache_size
+        scheduler.simulate()
+        signatures.append(plan_signature(scheduler.assigned_trips))
+        unreachable = {request.order_id for request, err in scheduler.failed_trips
+                       if err == "No travel times to delivery address"}
+        assert unreachable == {order['id'] for order in lost['orders']}
+    assert len(scheduler._templates) <= 2 and len(scheduler._reachable) <= 2
+    assert signatures[0] == signatures[1]
+
+
+def test_free_vehicle_index_matches_is_free():
+    """
+    Checks that VehicleIndex.free_vehicles returns every vehicle that Vehicle.is_free accepts,
+    after planning, a breakdown and a rollback.
+    """
+    import random
+    from main import build_scheduler
+    scheduler = build_scheduler(small_case(0), seed=0)
+    mark = scheduler.snapshot()
+    scheduler.simulate()
+    trip = scheduler.assigned_trips[3]
+    scheduler.vehicle_unavailable(trip.vehicle_id, trip.start_at + 5, trip.start_at + 200)
+    rng = random.Random(0)
+    for state in range(2):
+        for _ in range(2000):
+            vehicle = rng.choice(list(scheduler.vehicles.values()))
+            plant_id, return_id = rng.choice(vehicle.plants), rng.choice(vehicle.plants)
+            start_at = rng.randrange(vehicle.work_time_start - 60, vehicle.work_time_end)
+            unload_at, return_at = start_at + 60, start_at + rng.randrange(60, 240)
+            if vehicle.is_free(start_at, unload_at, return_at, plant_id, return_id):
+                assert vehicle.id in scheduler.fleet.free_vehicles(plant_id, start_at, return_at)
+        scheduler.restore(mark)
+
+
+def test_pruning_counts_unreachable_plants_separately():
+    """
+    Checks that loading plants without a travel time are counted apart from plants the order excludes,
+    that the scalar pruning counters add up to all candidates, and that the vectorized path splits them
+    the same way.
+    """
+    from main import build_scheduler
+    from travel import TravelTimeMatrix
+    case = small_case(0)
+    matrix = case['travel_times']
+    case['travel_times'] = TravelTimeMatrix.from_entries([
+        {"plant_id": p, "customer_id": a, "travel_time_minutes": matrix[p, a]}
+        for p in matrix.plant_ids for a in matrix.address_ids if (p, a) in matrix and (p + a) % 3])
+    counters = []
+    for vectorized in (False, True):
+        scheduler = build_scheduler(case, seed=0, vectorized=vectorized)
+        scheduler.simulate()
+        stats = scheduler.pruning_stats
+        assert stats["order_plants"] and stats["unreachable_plants"]
+        counters.append((stats["order_plants"], stats["unreachable_plants"]))
+        if not vectorized:
+            assert sum(value for key, value in stats.items() if key not in ("trips", "candidates")) == \
+                stats["candidates"]
+    assert counters[0] == counters[1]
+
 def main():
     # Load assigned_trips data
     with open('assigned_trips.json', 'r', encoding='utf-8') as f:
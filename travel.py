@@ -0,0 +1,344 @@
+# travel.py
+
+import json
+import math
+import mmap
+import struct
+from array import array
+from collections import OrderedDict, defaultdict
+
+MISSING = -1  # Нет данных о времени пути для пары (завод, адрес)
+
+# Бинарный формат: заголовок, id заводов (int64), id адресов (int64), матрица int32 по строкам-заводам.
+# Если id не целые (например, строки), версия JSON_IDS_VERSION: вместо массивов int64 — длина
+# и JSON-список [id заводов, id адресов], дополненный пробелами до 8 байт
+MAGIC = b'BTTM'
+HEADER = struct.Struct('<4sIII')
+VERSION = 1
+JSON_IDS_VERSION = 2
+IDS_SIZE = struct.Struct('<Q')
+
+KM_PER_DEGREE = 111.0
+# Оценка по умолчанию, пока не по чему калибровать: подача плюс дорога (как generate_test_data.road_minutes)
+DEFAULT_BASE_MINUTES = 10
+DEFAULT_MINUTES_PER_KM = 1.95
+DEFAULT_NEAREST = 5  # Сколько ближайших заводов получают оценку для адреса без данных
+CALIBRATION_PAIRS = 5000
+
+
+class TravelTimeMatrix:
+    """
+    Плотная матрица времени пути (минуты) завод × адрес доставки в одном непрерывном буфере.
+    Матрица только читается: один экземпляр разделяют все планировщики процесса, а загруженная
+    из файла передаётся в воркеры по пути и отображается в память без копирования.
+    Время пути считается симметричным: завод -> адрес и адрес -> завод совпадают.
+    """
+
+    def __init__(self, plant_ids, address_ids, data, path=None, offset=0):
+        self.plant_ids = list(plant_ids)
+        self.address_ids = list(address_ids)
+        self.plant_index = {plant_id: i for i, plant_id in enumerate(self.plant_ids)}
+        self.address_index = {address_id: j for j, address_id in enumerate(self.address_ids)}
+        self.n_addresses = len(self.address_ids)
+        self.data = data
+        self.path = path
+        self.offset = offset  # Смещение матрицы в файле path (в однофайловом кейсе она лежит не с начала)
+
+    @classmethod
+    def from_dict(cls, travel_times):
+        """
+        Из словаря {(plant_id, address_id): минуты}.
+        """
+        plant_ids = sorted({plant_id for plant_id, _ in travel_times})
+        address_ids = sorted({address_id for _, address_id in travel_times})
+        matrix = cls(plant_ids, address_ids, array('i', [MISSING]) * (len(plant_ids) * len(address_ids)))
+        for (plant_id, address_id), minutes in travel_times.items():
+            matrix.data[matrix.plant_index[plant_id] * matrix.n_addresses + matrix.address_index[address_id]] = minutes
+        return matrix
+
+    @classmethod
+    def from_entries(cls, entries):
+        """
+        Из записей travel_times.json: {"plant_id", "customer_id", "travel_time_minutes"}.
+        Матрица заполняется напрямую, без промежуточного словаря на все пары.
+        """
+        entries = [(e['plant_id'], e['customer_id'], e['travel_time_minutes']) for e in entries]
+        plant_ids = sorted({plant_id for plant_id, _, _ in entries})
+        address_ids = sorted({address_id for _, address_id, _ in entries})
+        matrix = cls(plant_ids, address_ids, array('i', [MISSING]) * (len(plant_ids) * len(address_ids)))
+        plant_index, address_index, n, data = matrix.plant_index, matrix.address_index, matrix.n_addresses, matrix.data
+        for plant_id, address_id, minutes in entries:
+            data[plant_index[plant_id] * n + address_index[address_id]] = minutes
+        return matrix
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Из колоночного JSON: {"plant_ids": [...], "address_ids": [...], "minutes": [строки по заводам]};
+        отсутствующие пары — MISSING.
+        """
+        data = array('i')
+        for row in columns['minutes']:
+            data.extend(row)
+        return cls(columns['plant_ids'], columns['address_ids'], data)
+
+    def as_columns(self):
+        n = self.n_addresses
+        return {"plant_ids": list(self.plant_ids), "address_ids": list(self.address_ids),
+                "minutes": [list(self.data[i * n:(i + 1) * n]) for i in range(len(self.plant_ids))]}
+
+    def __reduce__(self):
+        # В воркеры матрица из файла передаётся путём, а не содержимым
+        if self.path is not None:
+            return type(self).load, (self.path, self.offset)
+        return type(self), (self.plant_ids, self.address_ids, array('i', self.data))
+
+    def __len__(self):
+        return sum(1 for minutes in self.data if minutes != MISSING)
+
+    def __contains__(self, key):
+        plant_id, address_id = key
+        i = self.plant_index.get(plant_id)
+        j = self.address_index.get(address_id)
+        return i is not None and j is not None and self.data[i * self.n_addresses + j] != MISSING
+
+    def __getitem__(self, key):
+        return self.get(*key)
+
+    def get(self, plant_id, address_id):
+        minutes = self.data[self.plant_index[plant_id] * self.n_addresses + self.address_index[address_id]]
+        if minutes == MISSING:
+            raise KeyError((plant_id, address_id))
+        return minutes
+
+    def column(self, address_id):
+        """
+        Времена пути от всех заводов (в порядке plant_ids) до адреса.
+        """
+        j = self.address_index[address_id]
+        return self.data[j::self.n_addresses]
+
+    def as_numpy(self):
+        """
+        Представление без копирования: массив (заводы × адреса) int32.
+        """
+        import numpy as np
+        return np.frombuffer(self.data, dtype=np.int32).reshape(len(self.plant_ids), self.n_addresses)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            self.write(f)
+
+    def write(self, f):
+        ids = self.plant_ids + self.address_ids
+        if all(type(i) is int and -2 ** 63 <= i < 2 ** 63 for i in ids):
+            f.write(HEADER.pack(MAGIC, VERSION, len(self.plant_ids), self.n_addresses))
+            f.write(array('q', self.plant_ids).tobytes())
+            f.write(array('q', self.address_ids).tobytes())
+        else:
+            raw = json.dumps([self.plant_ids, self.address_ids], ensure_ascii=False,
+                             separators=(',', ':')).encode('utf-8')
+            raw += b' ' * (-len(raw) % 8)
+            f.write(HEADER.pack(MAGIC, JSON_IDS_VERSION, len(self.plant_ids), self.n_addresses))
+            f.write(IDS_SIZE.pack(len(raw)))
+            f.write(raw)
+        f.write(array('i', self.data).tobytes())
+
+    @classmethod
+    def load(cls, path, offset=0):
+        """
+        Отображает бинарный файл матрицы в память; данные читаются с диска по мере обращения.
+        offset — начало матрицы внутри файла (для однофайлового кейса).
+        """
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls.from_buffer(buffer, offset, path)
+
+    @classmethod
+    def from_buffer(cls, buffer, start=0, path=None):
+        """
+        Матрица поверх буфера (mmap) без копирования данных.
+        """
+        magic, version, n_plants, n_addresses = HEADER.unpack_from(buffer, start)
+        if magic != MAGIC or version not in (VERSION, JSON_IDS_VERSION):
+            raise ValueError(f"{path}: не файл матрицы времени пути")
+        offset = start + HEADER.size
+        if version == VERSION:
+            plant_ids = array('q', buffer[offset:offset + 8 * n_plants])
+            offset += 8 * n_plants
+            address_ids = array('q', buffer[offset:offset + 8 * n_addresses])
+            offset += 8 * n_addresses
+        else:
+            size, = IDS_SIZE.unpack_from(buffer, offset)
+            offset += IDS_SIZE.size
+            plant_ids, address_ids = json.loads(buffer[offset:offset + size])
+            offset += size
+        data = memoryview(buffer)[offset:offset + 4 * n_plants * n_addresses].cast('i')
+        return cls(plant_ids, address_ids, data, path=path, offset=start)
+
+
+def convert_json(json_path, bin_path):
+    """
+    Переводит travel_times.json в бинарный travel_times.bin.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        TravelTimeMatrix.from_entries(json.load(f)).save(bin_path)
+
+
+class PlantGrid:
+    """
+    Пространственный индекс заводов: равномерная сетка по координатам в километрах (долгота
+    с косинусом средней широты), в среднем около одного завода на ячейку. Ближайшие заводы
+    ищутся по кольцам ячеек вокруг точки, пока следующее кольцо не может дать завод ближе.
+    """
+
+    def __init__(self, points):
+        latitudes = [lat for lat, _ in points.values()]
+        self.cos_lat = math.cos(math.radians(sum(latitudes) / len(latitudes))) if latitudes else 1.0
+        xy = {plant_id: self.project(*point) for plant_id, point in points.items()}
+        if xy:
+            xs, ys = [x for x, _ in xy.values()], [y for _, y in xy.values()]
+            area = (max(xs) - min(xs)) * (max(ys) - min(ys))
+            self.cell = max(1.0, math.sqrt(area / len(xy)))
+        else:
+            self.cell = 1.0
+        self.cells = defaultdict(list)
+        for plant_id, (x, y) in xy.items():
+            self.cells[self.cell_of(x, y)].append((x, y, plant_id))
+        self.bounds = (min((i for i, _ in self.cells), default=0), max((i for i, _ in self.cells), default=-1),
+                       min((j for _, j in self.cells), default=0), max((j for _, j in self.cells), default=-1))
+
+    def project(self, latitude, longitude):
+        return latitude * KM_PER_DEGREE, longitude * KM_PER_DEGREE * self.cos_lat
+
+    def cell_of(self, x, y):
+        return math.floor(x / self.cell), math.floor(y / self.cell)
+
+    def distance(self, a, b):
+        (ax, ay), (bx, by) = self.project(*a), self.project(*b)
+        return math.hypot(ax - bx, ay - by)
+
+    def nearest(self, latitude, longitude, k):
+        """
+        До k ближайших заводов: [(км, plant_id)] по возрастанию расстояния.
+        """
+        x, y = self.project(latitude, longitude)
+        cx, cy = self.cell_of(x, y)
+        min_i, max_i, min_j, max_j = self.bounds
+        radius = max(cx - min_i, max_i - cx, cy - min_j, max_j - cy) if self.cells else -1
+        found = []
+        for r in range(radius + 1):
+            for i in range(cx - r, cx + r + 1):
+                # Кольцо r: верхняя и нижняя строки целиком, из остальных — крайние ячейки
+                for j in (range(cy - r, cy + r + 1) if abs(i - cx) == r else {cy - r, cy + r}):
+                    for px, py, plant_id in self.cells.get((i, j), ()):
+                        found.append((math.hypot(px - x, py - y), plant_id))
+            # Заводы за кольцом r не ближе r * cell
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= r * self.cell:
+                    break
+        found.sort()
+        return found[:k]
+
+
+class EstimatedTravelTimes:
+    """
+    Матрица времени пути, где недостающие пары (завод, адрес) оцениваются по координатам. Оценка
+    строится лениво: при первом обращении к адресу без данных для него ищутся k ближайших заводов
+    (PlantGrid) и только им считается время — минуты подачи плюс минуты на километр, подобранные
+    по известным парам матрицы. Оценки хранятся в LRU-кэше на cache_size адресов, поэтому полная
+    матрица заводы × адреса не строится. Пары вне известных и k ближайших недоступны (KeyError,
+    in — False): планировщик просто не рассматривает такие заводы.
+    """
+
+    def __init__(self, matrix, plant_points, address_points, k=DEFAULT_NEAREST, cache_size=4096):
+        self.matrix = matrix
+        self.grid = PlantGrid(plant_points)
+        self.plant_points = plant_points
+        self.address_points = address_points
+        self.k = k
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.base, self.per_km = self.calibrate()
+
+    def __reduce__(self):
+        return type(self), (self.matrix, self.plant_points, self.address_points, self.k, self.cache_size)
+
+    def calibrate(self):
+        """
+        Минуты подачи и минуты на километр: наименьшие квадраты по известным парам матрицы
+        (не больше CALIBRATION_PAIRS), иначе — значения по умолчанию.
+        """
+        pairs = []
+        matrix = self.matrix
+        for address_id, j in matrix.address_index.items():
+            if address_id not in self.address_points:
+                continue
+            for plant_id, i in matrix.plant_index.items():
+                minutes = matrix.data[i * matrix.n_addresses + j]
+                if minutes != MISSING and plant_id in self.plant_points:
+                    pairs.append((self.grid.distance(self.plant_points[plant_id], self.address_points[address_id]),
+                                  minutes))
+            if len(pairs) >= CALIBRATION_PAIRS:
+                break
+        n = len(pairs)
+        if n >= 2:
+            mean_km = sum(km for km, _ in pairs) / n
+            mean_minutes = sum(minutes for _, minutes in pairs) / n
+            spread = sum((km - mean_km) ** 2 for km, _ in pairs)
+            if spread > 0:
+                per_km = sum((km - mean_km) * (minutes - mean_minutes) for km, minutes in pairs) / spread
+                if per_km > 0:
+                    return max(0.0, mean_minutes - per_km * mean_km), per_km
+        return DEFAULT_BASE_MINUTES, DEFAULT_MINUTES_PER_KM
+
+    def nearest(self, address_id):
+        """
+        {plant_id: минуты} для k ближайших к адресу заводов (известное время, иначе оценка).
+        """
+        cache = self.cache
+        if address_id in cache:
+            self.hits += 1
+            cache.move_to_end(address_id)
+            return cache[address_id]
+        self.misses += 1
+        point = self.address_points.get(address_id)
+        times = {}
+        if point is not None:
+            matrix = self.matrix
+            j = matrix.address_index.get(address_id)
+            for km, plant_id in self.grid.nearest(*point, self.k):
+                i = matrix.plant_index.get(plant_id)
+                minutes = MISSING if i is None or j is None else matrix.data[i * matrix.n_addresses + j]
+                times[plant_id] = minutes if minutes != MISSING else round(self.base + self.per_km * km)
+        cache[address_id] = times
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return times
+
+    def __contains__(self, key):
+        return key in self.matrix or key[0] in self.nearest(key[1])
+
+    def __getitem__(self, key):
+        return self.get(*key)
+
+    def get(self, plant_id, address_id):
+        matrix = self.matrix
+        i = matrix.plant_index.get(plant_id)
+        j = matrix.address_index.get(address_id)
+        if i is not None and j is not None:
+            minutes = matrix.data[i * matrix.n_addresses + j]
+            if minutes != MISSING:
+                return minutes
+        minutes = self.nearest(address_id).get(plant_id)
+        if minutes is None:
+            raise KeyError((plant_id, address_id))
+        return minutes
+
+    def cache_info(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "addresses": len(self.cache),
+                "hit_rate": round(self.hits / total, 4) if total else None}
@@ -0,0 +1,181 @@
+# validation.py
+
+import json
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from classes import DATETIME_FORMAT, Trip, planning_day
+
+NONE = -1  # Индекс отсутствующего завода (None у блоков поломки)
+DAY = 24 * 60
+
+
+def validate_plan(trips, plants, vehicles, slots=()):
+    """
+    Проверка всего плана одной сортировкой и проходом по массивам целых минут (в отличие от
+    tests.py — без разбора строк и словарей по ТС). trips — поездки (Trip, в том числе блоки
+    поломок без завода), plants и vehicles — словари по id, slots — прочие занятые интервалы
+    постов (plant_id, start, end): брони и простои. Возвращает {вид нарушения: [описания]},
+    пустой словарь — план непротиворечив:
+      vehicle_overlap  — поездки одного ТС пересекаются;
+      vehicle_hours    — поездка выходит за смену ТС (смена повторяется каждый день);
+      vehicle_plant    — ТС грузится на заводе не из своего списка;
+      plant_continuity — поездка начинается не на том заводе, куда ТС вернулось (или не на заводе старта);
+      plant_capacity   — одновременных погрузок на заводе больше, чем постов;
+      plant_hours      — погрузка вне рабочего времени завода;
+      customer_overlap — разгрузки на одном адресе пересекаются.
+    """
+    violations = {}
+
+    def report(kind, mask, describe):
+        found = np.flatnonzero(mask)
+        if len(found):
+            violations[kind] = [describe(i) for i in found.tolist()]
+
+    plant_ids = list(plants)
+    plant_index = {plant_id: i for i, plant_id in enumerate(plant_ids)}
+    vehicle_ids = list(vehicles)
+    vehicle_index = {vehicle_id: i for i, vehicle_id in enumerate(vehicle_ids)}
+    addresses = {}
+    n = len(trips)
+
+    def column(values):
+        return np.fromiter(values, dtype=np.int64, count=n)
+
+    vehicle = column(vehicle_index[trip.vehicle_id] for trip in trips)
+    start = column(trip.start_at for trip in trips)
+    arrive = column(trip.arrive_at for trip in trips)
+    unload = column(trip.unload_at for trip in trips)
+    ret = column(trip.return_at for trip in trips)
+    # Неизвестный завод получает индекс len(plants) и не совпадает ни с одним известным
+    unknown = len(plant_ids)
+    plant = column(NONE if trip.plant_id is None else plant_index.get(trip.plant_id, unknown) for trip in trips)
+    return_plant = column(NONE if trip.return_plant_id is None else plant_index.get(trip.return_plant_id, unknown)
+                          for trip in trips)
+    address = column(addresses.setdefault(trip.delivery_address_id, len(addresses)) for trip in trips)
+    is_trip = plant != NONE
+    known = is_trip & (plant != unknown)
+
+    plant_list = [plants[plant_id] for plant_id in plant_ids]
+    # Последний элемент — фиктивный завод для индексов unknown и NONE (-1)
+    loading_time = np.array([p.loading_time for p in plant_list] + [0], dtype=np.int64)
+    capacity = np.array([max(1, p.loading_capacity) for p in plant_list] + [1], dtype=np.int64)
+    plant_open = np.array([p.work_time_start for p in plant_list] + [0], dtype=np.int64)
+    plant_close = np.array([p.work_time_end for p in plant_list] + [0], dtype=np.int64)
+    vehicle_list = [vehicles[vehicle_id] for vehicle_id in vehicle_ids]
+    work_start = np.array([v.work_time_start for v in vehicle_list], dtype=np.int64)
+    work_end = np.array([v.work_time_end for v in vehicle_list], dtype=np.int64)
+    # Неизвестный завод старта не совпадает ни с одним заводом, None совпадает с любым
+    plant_start = np.array([NONE if v.plant_start is None else plant_index.get(v.plant_start, NONE - 1)
+                            for v in vehicle_list], dtype=np.int64)
+    allowed = np.array([i * (unknown + 1) + plant_index[plant_id] for i, v in enumerate(vehicle_list)
+                        for plant_id in v.plants if plant_id in plant_index], dtype=np.int64)
+    load_end = start + loading_time[plant]
+
+    # ТС: поездки подряд в порядке (ТС, начало)
+    order = np.lexsort((start, vehicle))
+    v, s, r, p, rp = vehicle[order], start[order], ret[order], plant[order], return_plant[order]
+    same = v[1:] == v[:-1]
+
+    def vehicle_pair(i, **extra):
+        first, second = trips[order[i]], trips[order[i + 1]]
+        return {"vehicle_id": first.vehicle_id, "trip1_id": first.id, "trip2_id": second.id, **extra}
+
+    report("vehicle_overlap", same & (r[:-1] > s[1:]),
+           lambda i: vehicle_pair(i, trip1_end=int(r[i]), trip2_start=int(s[i + 1])))
+    first = np.ones(n, dtype=bool)
+    first[1:] = ~same
+    broken = np.zeros(n, dtype=bool)
+    broken[1:] = same & (rp[:-1] != p[1:]) & (rp[:-1] != NONE) & (p[1:] != NONE)
+    broken |= first & (plant_start[v] != NONE) & (p != NONE) & (p != plant_start[v])
+    report("plant_continuity", broken,
+           lambda i: {"vehicle_id": trips[order[i]].vehicle_id, "trip_id": trips[order[i]].id,
+                      "plant_id": trips[order[i]].plant_id,
+                      "expected_plant_id": vehicles[trips[order[i]].vehicle_id].plant_start if first[i]
+                      else trips[order[i - 1]].return_plant_id})
+
+    def trip_info(i, **extra):
+        return {"trip_id": trips[i].id, "vehicle_id": trips[i].vehicle_id, "plant_id": trips[i].plant_id, **extra}
+
+    # Смена повторяется каждый день: поездка сверяется со сменой того дня, в который она начинается
+    # (для плана на несколько дней и поездок ночной смены предыдущего дня)
+    shift = (start - work_start[vehicle]) // DAY * DAY
+    report("vehicle_hours", is_trip & (ret - shift > work_end[vehicle]),
+           lambda i: trip_info(i, start_at=int(start[i]), return_at=int(ret[i])))
+    report("vehicle_plant", is_trip & ~np.isin(vehicle * (unknown + 1) + plant, allowed), trip_info)
+    shift = (start - plant_open[plant]) // DAY * DAY
+    report("plant_hours", known & (load_end - shift > plant_close[plant]),
+           lambda i: trip_info(i, start_at=int(start[i]), load_end=int(load_end[i])))
+
+    # Посты заводов: +1 в начале погрузки и -1 в конце, при равном времени концы раньше начал.
+    # По каждому заводу сумма изменений нулевая, поэтому общая накопленная сумма после
+    # сортировки по заводу — это число занятых постов именно этого завода
+    slots = [(plant_index[plant_id], slot_start, slot_end) for plant_id, slot_start, slot_end in slots
+             if plant_id in plant_index]
+    slot_plant = np.concatenate([plant[known], np.array([slot[0] for slot in slots], dtype=np.int64)])
+    slot_start = np.concatenate([start[known], np.array([slot[1] for slot in slots], dtype=np.int64)])
+    slot_end = np.concatenate([load_end[known], np.array([slot[2] for slot in slots], dtype=np.int64)])
+    keys = np.concatenate([slot_plant, slot_plant])
+    times = np.concatenate([slot_start, slot_end])
+    deltas = np.concatenate([np.ones(len(slot_plant), dtype=np.int64), -np.ones(len(slot_plant), dtype=np.int64)])
+    order = np.lexsort((deltas, times, keys))
+    busy = np.cumsum(deltas[order])
+    report("plant_capacity", (deltas[order] > 0) & (busy > capacity[keys[order]]),
+           lambda i: {"plant_id": plant_ids[keys[order[i]]], "at": int(times[order[i]]),
+                      "loading": int(busy[i]), "capacity": int(capacity[keys[order[i]]])})
+
+    # Клиенты: разгрузки подряд в порядке (адрес, прибытие)
+    trip_index = np.flatnonzero(is_trip)
+    order = trip_index[np.lexsort((arrive[trip_index], address[trip_index]))]
+    a, u, addr = arrive[order], unload[order], address[order]
+    report("customer_overlap", (addr[1:] == addr[:-1]) & (u[:-1] > a[1:]),
+           lambda i: {"delivery_address_id": trips[order[i]].delivery_address_id,
+                      "trip1_id": trips[order[i]].id, "trip2_id": trips[order[i + 1]].id,
+                      "unload1_end": int(u[i]), "unload2_start": int(a[i + 1])})
+    return violations
+
+
+def validate_scheduler(scheduler):
+    """
+    Проверка текущего плана планировщика: назначенные поездки, блоки поломок в расписаниях ТС,
+    брони и простои в календарях заводов.
+    """
+    blocks = [trip for vehicle in scheduler.vehicles.values() for trip in vehicle.schedule
+              if trip.status == "breakdown"]
+    slots = [(plant.id, slot['start'], slot['end']) for plant in scheduler.plants.values()
+             for key, slot in plant.loading_schedule.items() if not isinstance(key, Trip)]
+    return validate_plan(scheduler.assigned_trips + blocks, scheduler.plants, scheduler.vehicles, slots)
+
+
+def summarize(violations):
+    return {kind: len(items) for kind, items in violations.items()}
+
+
+def validate_results(case_path, results_path=None, day_start=None):
+    """
+    Проверка сохранённого результата (results.json или .jsonl из main.py) по данным кейса.
+    По умолчанию день планирования — день первой поездки результата.
+    """
+    from main import load_case, read_results, create_plants, create_vehicles, create_existing_schedule, \
+        results_path as default_path
+    case_data = load_case(case_path)
+    result = read_results(results_path or default_path(case_path))
+    if day_start is None and result["assigned_trips"]:
+        day_start = planning_day(datetime.strptime(result["assigned_trips"][0]["start_at"], DATETIME_FORMAT))
+    day_start = day_start or planning_day()
+    trips = [Trip.from_dict(data, day_start) for data in result["assigned_trips"]]
+    for trip, data in zip(trips, result["assigned_trips"]):
+        trip.id = data["id"]
+    reservations = create_existing_schedule(case_data['schedule'], day_start)[1] if case_data.get('schedule') else []
+    plants = {plant.id: plant for plant in create_plants(case_data['plants'])}
+    vehicles = {vehicle.id: vehicle for vehicle in create_vehicles(case_data['vehicles'])}
+    return validate_plan(trips, plants, vehicles, reservations)
+
+
+if __name__ == "__main__":
+    # python validation.py <папка кейса> [файл результата]
+    found = validate_results(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(json.dumps(found, ensure_ascii=False, indent=4, default=str) if found else "Нарушений не найдено")
+    sys.exit(1 if found else 0)
@@ -0,0 +1,193 @@
+# vectorized.py
+
+import numpy as np
+
+NONE = -1  # Индекс «любого» завода (None в скалярном пути)
+
+
+class VectorizedEvaluator:
+    """
+    Пакетная оценка вариантов поездки на NumPy. Времена — целые минуты (как и в classes.py),
+    расписания ТС — в дополненных матрицах (ТС × поездки). Для каждого завода погрузки
+    маска допустимости по всем (ТС, завод возврата) считается одной операцией, и Trip
+    создаётся только для выбранного варианта. Порядок вариантов совпадает со скалярным
+    Scheduler.assign_trip, поэтому при одном сиде назначения одинаковые.
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.plant_ids = list(scheduler.plants)
+        self.plant_index = {plant_id: i for i, plant_id in enumerate(self.plant_ids)}
+        self.vehicle_ids = list(scheduler.vehicles)
+        self.vehicle_index = {vehicle_id: i for i, vehicle_id in enumerate(self.vehicle_ids)}
+        vehicles = [scheduler.vehicles[vehicle_id] for vehicle_id in self.vehicle_ids]
+
+        self.work_start = np.array([v.work_time_start for v in vehicles], dtype=np.int64)
+        self.work_end = np.array([v.work_time_end for v in vehicles], dtype=np.int64)
+        self.axes = np.array([v.axes for v in vehicles], dtype=np.int64)
+        self.volume = np.array([v.volume for v in vehicles], dtype=np.int64)
+        self.gidrolotok = np.array([bool(v.gidrolotok) for v in vehicles])
+        # Неизвестный завод старта не совпадает ни с одним заводом, None совпадает с любым
+        self.plant_start = np.array([NONE if v.plant_start is None else self.plant_index.get(v.plant_start, NONE - 1)
+                                     for v in vehicles], dtype=np.int64)
+        # Для каждого завода — индексы ТС в том же порядке, что и VehicleIndex.vehicles_for_plant
+        self.plant_vehicles = [
+            np.array([self.vehicle_index[v.id] for v in scheduler.fleet.vehicles_for_plant(plant_id)], dtype=np.int64)
+            for plant_id in self.plant_ids
+        ]
+
+        self.capacity = 4
+        self.count = np.zeros(len(vehicles), dtype=np.int64)
+        self.starts = np.empty((len(vehicles), self.capacity), dtype=np.int64)
+        self.returns = np.empty_like(self.starts)
+        self.loads_from = np.empty_like(self.starts)
+        self.returns_to = np.empty_like(self.starts)
+        self.dirty = set(self.vehicle_ids)
+
+    def _plant_idx(self, plant_id):
+        return NONE if plant_id is None else self.plant_index[plant_id]
+
+    def refresh(self):
+        """
+        Переписывает строки ТС, расписание которых изменилось с прошлого вызова.
+        """
+        for vehicle_id in self.dirty:
+            schedule = self.scheduler.vehicles[vehicle_id].schedule
+            v = self.vehicle_index[vehicle_id]
+            if len(schedule) >= self.capacity:
+                self._grow(len(schedule) * 2)
+            self.count[v] = len(schedule)
+            for j, tr in enumerate(schedule):
+                self.starts[v, j] = tr.start_at
+                self.returns[v, j] = tr.return_at
+                self.loads_from[v, j] = self._plant_idx(tr.plant_id)
+                self.returns_to[v, j] = self._plant_idx(tr.return_plant_id)
+        self.dirty.clear()
+
+    def _grow(self, capacity):
+        for name in ("starts", "returns", "loads_from", "returns_to"):
+            old = getattr(self, name)
+            new = np.empty((old.shape[0], capacity), dtype=np.int64)
+            new[:, :old.shape[1]] = old
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def _gaps(self, rows, start):
+        """
+        Для каждого ТС из rows — окно между поездками, в которое попадает start:
+        начало, конец, завод перед окном и завод после него.
+        """
+        count = self.count[rows]
+        cols = np.arange(self.capacity)
+        valid = cols[None, :] < count[:, None]
+        i = (valid & (self.starts[rows] <= start)).sum(axis=1)
+
+        has_prev = i > 0
+        prev = np.maximum(i - 1, 0)[:, None]
+        gap_start = np.where(has_prev, np.take_along_axis(self.returns[rows], prev, 1)[:, 0], self.work_start[rows])
+        plant_before = np.where(has_prev, np.take_along_axis(self.returns_to[rows], prev, 1)[:, 0],
+                                self.plant_start[rows])
+
+        has_next = i < count
+        nxt = np.minimum(i, self.capacity - 1)[:, None]
+        gap_end = np.where(has_next, np.take_along_axis(self.starts[rows], nxt, 1)[:, 0], self.work_end[rows])
+        plant_after = np.where(has_next, np.take_along_axis(self.loads_from[rows], nxt, 1)[:, 0], NONE)
+        return gap_start, gap_end, plant_before, plant_after
+
+    def candidates(self, trip):
+        """
+        Возвращает список блоков (plant_from, vehicle_ids, plant_to_ids, time_shift, маска) и
+        стоимости допустимых вариантов в порядке скалярного перебора.
+        """
+        sch = self.scheduler
+        self.refresh()
+        order = sch.orders[trip.order_id]
+        stats = sch.pruning_stats
+        evaluated = stats["evaluated"]
+        n_plants = len(sch.plants)
+        n_vehicles = len(sch.vehicles)
+        stats["trips"] += 1
+        stats["candidates"] += n_vehicles * n_plants * n_plants
+
+        # Времена из шаблона заказа (Scheduler.trip_template), без обращений к матрице
+        loads, unloading, returns = sch.trip_template(order)
+        allowed = sch.count_order_plants(order)
+        stats["order_plants"] += n_vehicles * (n_plants - allowed) * n_plants
+        stats["unreachable_plants"] += n_vehicles * (allowed - len(loads)) * n_plants
+        return_plants = [plant for plant, _ in returns.values()]
+        back = np.array([offset - unloading for _, offset in returns.values()], dtype=np.int64)
+        return_idx = np.array([self.plant_index[p.id] for p in return_plants], dtype=np.int64)
+
+        arrive = trip.arrive_at
+        fits = self.gidrolotok | (not order.gidrolotok)
+        if order.axle is not None:
+            fits &= self.axes <= order.axle
+        in_window = self.work_end >= arrive + unloading
+
+        blocks = []
+        costs = []
+        for plant_from, start_offset, _ in loads.values():
+            p = self.plant_index[plant_from.id]
+            start_at = trip.arrive_at + start_offset
+            rows = self.plant_vehicles[p]
+            stats["vehicle_plants"] += (n_vehicles - len(rows)) * n_plants
+            fitting = rows[fits[rows]]
+            stats["vehicle_specs"] += (len(rows) - len(fitting)) * n_plants
+            rows = fitting[in_window[fitting]]
+            stats["time_window"] += (len(fitting) - len(rows)) * n_plants
+            if len(rows) == 0:
+                continue
+
+            slot = plant_from.get_first_available_slot(start_at)
+            if slot is None:
+                stats["plant_slot"] += len(rows) * n_plants
+                continue
+            time_shift = slot - start_at
+            stats["return_plants"] += len(rows) * (n_plants - len(return_plants))
+            stats["evaluated"] += len(rows) * len(return_plants)
+
+            start = slot
+            unload = arrive + time_shift + unloading
+            ret = unload + back
+
+            ws, we = self.work_start[rows], self.work_end[rows]
+            gap_start, gap_end, plant_before, plant_after = self._gaps(rows, start)
+            ok_vehicle = ((ws <= start) & (start <= we) & (ws <= unload) & (unload <= we) &
+                          (gap_start <= start) & ((plant_before == NONE) | (plant_before == p)))
+            mask = (ok_vehicle[:, None] & (ret[None, :] <= gap_end[:, None]) &
+                    ((plant_after[:, None] == NONE) | (plant_after[:, None] == return_idx[None, :])))
+            if not mask.any():
+                continue
+            blocks.append((plant_from, rows, return_plants, time_shift, mask))
+            # Слагаемые стоимости, как в Scheduler.trip_costs: отклонение, порожний пробег, недогруз
+            unused = self.volume[rows] - np.minimum(self.volume[rows], sch.remaining[order.id])
+            block_costs = np.empty(mask.shape + (3,), dtype=np.int64)
+            block_costs[..., 0] = abs(time_shift)
+            block_costs[..., 1] = back[None, :]
+            block_costs[..., 2] = unused[:, None]
+            costs.append(block_costs[mask])
+
+        if sch.instruments is not None:
+            sch.observe_candidates(stats["evaluated"] - evaluated, sum(len(c) for c in costs))
+        if not blocks:
+            return [], []
+        return blocks, [tuple(cost) for cost in np.concatenate(costs).tolist()]
+
+    def assign_trip(self, trip):
+        sch = self.scheduler
+        blocks, costs = self.candidates(trip)
+        if not blocks:
+            return None, "No suitable trips"
+
+        index = sch.pick_index(costs)
+        for plant_from, rows, return_plants, time_shift, mask in blocks:
+            n = int(mask.sum())
+            if index >= n:
+                index -= n
+                continue
+            v, q = np.argwhere(mask)[index]
+            vehicle = sch.vehicles[self.vehicle_ids[rows[v]]]
+            best_trip = sch.make_trip_variant(trip, vehicle, plant_from, return_plants[q])
+            best_trip.shift(time_shift)
+            sch.commit_trip(best_trip)
+            return best_trip, None